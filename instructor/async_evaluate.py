@@ -0,0 +1,315 @@
+"""
+Concurrent evaluation of many repos with async Playwright.
+
+evaluate_all_repos runs an AsyncEvaluationEngine, which claims evaluation
+jobs (instructor/evaluation_jobs.py) into N slots and evaluates them at once:
+their pages load in one Chromium browser, a context per repo, and their
+static checks (license, README and code quality), which are blocking HTTP and
+LLM calls, run in threads alongside. Results have the same format as
+RepoEvaluator.evaluate_repo and are stored as each repo completes, while the
+leases of the jobs in flight are renewed in the background.
+
+N is EVALUATION_PAGES or, when that is 0, derived from the CPUs and the
+memory available to the process (EVALUATION_PAGE_MEMORY_MB per page).
+
+With several workers (``--workers``), the claimable jobs are sharded by a hash
+of (email, task, round) across a process pool, so grading, parsing and
+database writes use more than one core. Each worker process runs its own
+engine, browsers, database sessions and leases on a share of N, and reports
+each evaluated job to the parent, which prints the overall progress.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from playwright.async_api import async_playwright
+from sqlalchemy.orm import Session
+
+from instructor.browser_pool import AsyncBrowserPool
+from instructor.evaluate import (
+    RepoEvaluator, check_error_result, checked_separately, js_check_result, js_outcome_result,
+    page_load_error_result, separate_check_result, text_check_result
+)
+from instructor.evaluation_jobs import EvaluationJobs
+from instructor.js_checks import async_run_js_checks
+from instructor.page_readiness import READINESS_SCRIPT, async_wait_until_ready, log_readiness
+from shared.config import settings
+from shared.database import Repo, SessionLocal, Task
+from shared.llm_usage import usage_context
+from shared.profiling import async_profile_run
+
+
+def available_memory_mb() -> Optional[float]:
+    """Memory this process can still use: MemAvailable, capped by a cgroup limit."""
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            with open("/sys/fs/cgroup/memory.current") as f:
+                headroom = (int(limit) - int(f.read())) / (1024 * 1024)
+            available = headroom if available is None else min(available, headroom)
+    except (OSError, ValueError):
+        pass
+    return available
+
+
+def default_concurrency() -> int:
+    """Repos evaluated at once: EVALUATION_PAGES, or what the CPUs and memory allow."""
+    if settings.evaluation_pages:
+        return settings.evaluation_pages
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    # Pages mostly wait on the network, so two per CPU keep the renderers busy
+    by_cpu = cpus * 2
+    memory_mb = available_memory_mb()
+    by_memory = int(memory_mb // settings.evaluation_page_memory_mb) if memory_mb else by_cpu
+    return max(1, min(by_cpu, by_memory))
+
+
+class AsyncEvaluationEngine:
+    """Evaluate many repos concurrently."""
+
+    def __init__(
+        self,
+        evaluator: Optional[RepoEvaluator] = None,
+        concurrency: Optional[int] = None,
+        profile: bool = False
+    ):
+        """
+        Initialize the engine.
+
+        Args:
+            evaluator: Provides the static checks (a new RepoEvaluator by default)
+            concurrency: Most repos evaluated at once (default_concurrency() by default)
+            profile: Store a sampling profile of each repo's evaluation
+        """
+        self.evaluator = evaluator or RepoEvaluator()
+        self.concurrency = concurrency or default_concurrency()
+        self.profile = profile
+        self.browsers: Optional[AsyncBrowserPool] = None
+
+    async def run_jobs(
+        self,
+        jobs: EvaluationJobs,
+        ids: Optional[List[int]] = None,
+        on_complete: Optional[Callable[[str, Repo, List[dict]], None]] = None
+    ) -> Dict[str, int]:
+        """
+        Claim and evaluate jobs until none can be claimed.
+
+        Args:
+            jobs: Job store holding this process's leases
+            ids: Only claim among these jobs (a worker's shard)
+            on_complete: Called in a thread with each evaluated job's outcome,
+                repo and results
+
+        Returns:
+            Number of jobs per outcome (done, retried, lost, skipped, error)
+        """
+        outcomes: Counter = Counter()
+        # Four static checks and a store per repo in flight
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=self.concurrency * 5, thread_name_prefix="evaluate")
+        )
+        in_flight: Dict[asyncio.Task, int] = {}
+        async with async_playwright() as playwright:
+            self.browsers = AsyncBrowserPool(playwright)
+            heartbeat = asyncio.create_task(self._heartbeat(jobs, in_flight))
+            try:
+                while True:
+                    # Claiming only into free slots bounds the repos in flight
+                    claimed = await asyncio.to_thread(jobs.claim, self.concurrency - len(in_flight), ids)
+                    for job_id in claimed:
+                        in_flight[asyncio.create_task(self._run_job(jobs, job_id, on_complete))] = job_id
+                    if not in_flight:
+                        break
+                    done, _ = await asyncio.wait(
+                        in_flight, timeout=settings.evaluation_poll_interval, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for finished in done:
+                        del in_flight[finished]
+                        outcomes[finished.result()] += 1
+            finally:
+                heartbeat.cancel()
+                await self.browsers.close()
+        return dict(outcomes)
+
+    async def _heartbeat(self, jobs: EvaluationJobs, in_flight: Dict[asyncio.Task, int]):
+        while True:
+            await asyncio.sleep(settings.evaluation_heartbeat_seconds)
+            try:
+                await asyncio.to_thread(jobs.heartbeat, list(in_flight.values()))
+            except Exception as e:
+                print(f"⚠️  Renewing evaluation job leases failed: {e}")
+
+    async def _run_job(self, jobs: EvaluationJobs, job_id: int, on_complete) -> str:
+        db: Session = SessionLocal()
+        try:
+            prepared = await asyncio.to_thread(jobs.prepare, db, job_id)
+            if prepared is None:
+                return "skipped"
+            job, repo, task = prepared
+            print(f"\nEvaluating {repo.email} - {repo.task} round {repo.round} (job {job_id}, attempt {job.attempts})")
+            async with async_profile_run(f"evaluate-{repo.task}-r{repo.round}-{repo.email}", enabled=self.profile):
+                with usage_context(service="evaluation", task=repo.task, round=repo.round):
+                    eval_results = await self.evaluate_repo(repo, task)
+            outcome = await asyncio.to_thread(jobs.complete, db, job, repo, eval_results)
+            if on_complete is not None:
+                await asyncio.to_thread(on_complete, outcome, repo, eval_results)
+            return outcome
+        except Exception as e:
+            print(f"❌ Evaluation job {job_id}: {e}")
+            await asyncio.to_thread(jobs.retry_or_fail, db, job_id, str(e))
+            return "error"
+        finally:
+            db.close()
+
+    async def evaluate_repo(self, repo: Repo, task: Task) -> List[dict]:
+        """Evaluate a repository against all checks, as RepoEvaluator.evaluate_repo."""
+        checks = json.loads(task.checks)
+        static_results, dynamic_results = await asyncio.gather(
+            asyncio.gather(*(
+                asyncio.to_thread(static_check) for static_check in self.evaluator.static_checks(repo, task)
+            )),
+            self.run_playwright_checks(repo, checks)
+        )
+        return list(static_results) + dynamic_results
+
+    async def run_playwright_checks(self, repo: Repo, checks: List[str]) -> List[dict]:
+        """Run dynamic checks in a fresh context of the shared browser."""
+        results = []
+        cdn_cache = self.evaluator.cdn_cache
+        async with self.browsers.context() as context:
+            cdn_route = await cdn_cache.async_route(context) if cdn_cache else None
+            page = await context.new_page()
+            await page.add_init_script(READINESS_SCRIPT)
+            try:
+                started = time.perf_counter()
+                await page.goto(repo.pages_url, timeout=settings.timeout)
+                log_readiness(repo.pages_url, started, await async_wait_until_ready(page, checks))
+
+                js_outcomes = await async_run_js_checks(page, checks)
+                for i, check in enumerate(checks):
+                    if i in js_outcomes:
+                        results.append(js_outcome_result(check, js_outcomes[i]))
+                    else:
+                        results.append(await self.evaluate_check(page, check))
+            except Exception as e:
+                results.append(page_load_error_result(e))
+            if cdn_route:
+                cdn_route.log(repo.pages_url)
+        return results
+
+    async def evaluate_check(self, page, check: str) -> dict:
+        """Evaluate a single check, as RepoEvaluator.evaluate_check."""
+        try:
+            if check.startswith("js:"):
+                return js_check_result(check, await page.evaluate(check[3:].strip()))
+            elif checked_separately(check):
+                return separate_check_result(check)
+            else:
+                return text_check_result(check, await page.content())
+        except Exception as e:
+            return check_error_result(check, e)
+
+
+def shard_of(email: str, task: str, round: int, workers: int) -> int:
+    """Worker for a submission; stable across processes, unlike hash()."""
+    return zlib.crc32(f"{email}\0{task}\0{round}".encode()) % workers
+
+
+def evaluate_shard(shard: int, ids: List[int], concurrency: int, profile: bool, progress) -> Dict[str, int]:
+    """
+    Process pool entry point: evaluate the jobs of one shard.
+
+    Args:
+        shard: Worker number, for progress reports
+        ids: Job IDs of the shard
+        concurrency: Repos this worker evaluates at once
+        profile: Store a sampling profile of each repo's evaluation
+        progress: Queue receiving (shard, outcome, checks, score) per evaluated job
+
+    Returns:
+        Number of jobs per outcome
+    """
+    def on_complete(outcome: str, repo: Repo, eval_results: List[dict]):
+        progress.put((shard, outcome, len(eval_results), sum(r["score"] for r in eval_results)))
+
+    engine = AsyncEvaluationEngine(concurrency=concurrency, profile=profile)
+    # Own process, so own engine connections, browser and leases
+    return asyncio.run(engine.run_jobs(EvaluationJobs(), ids=ids, on_complete=on_complete))
+
+
+def evaluate_sharded(
+    claimable: List[Tuple[int, str, str, int]],
+    workers: int,
+    concurrency: Optional[int] = None,
+    profile: bool = False
+) -> Dict[str, int]:
+    """
+    Evaluate jobs in a pool of worker processes.
+
+    Args:
+        claimable: (job id, email, task, round) of the jobs to evaluate
+        workers: Worker processes
+        concurrency: Repos evaluated at once across all workers
+        profile: Store a sampling profile of each repo's evaluation
+
+    Returns:
+        Number of jobs per outcome, over all workers
+    """
+    shards: List[List[int]] = [[] for _ in range(workers)]
+    for job_id, email, task, round in claimable:
+        shards[shard_of(email, task, round, workers)].append(job_id)
+    # Memory and CPUs are shared by the workers
+    per_worker = max(1, (concurrency or default_concurrency()) // workers)
+    print(f"📊 Shards: {[len(shard) for shard in shards]}, {per_worker} repos at a time per worker")
+
+    # spawn: children must not inherit the parent's engine connections or threads
+    context = multiprocessing.get_context("spawn")
+    started = time.monotonic()
+    completed = 0
+    outcomes: Counter = Counter()
+    with context.Manager() as manager, ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        progress = manager.Queue()
+        futures = [
+            pool.submit(evaluate_shard, shard, ids, per_worker, profile, progress)
+            for shard, ids in enumerate(shards) if ids
+        ]
+        while True:
+            finished = all(future.done() for future in futures)
+            try:
+                shard, outcome, checks, score = progress.get(timeout=0.5)
+            except queue.Empty:
+                if finished:
+                    break
+                continue
+            completed += 1
+            rate = completed / max(time.monotonic() - started, 1e-9) * 60
+            print(f"📊 {completed}/{len(claimable)} jobs evaluated ({rate:.1f}/min), "
+                  f"worker {shard}: {outcome}, {score:.1f}/{checks} points")
+        failed = []
+        for future in futures:
+            if future.exception() is not None:
+                failed.append(future.exception())
+            else:
+                outcomes.update(future.result())
+    for error in failed:
+        print(f"❌ Evaluation worker failed: {error}")
+    if failed:
+        raise failed[0]
+    return dict(outcomes)
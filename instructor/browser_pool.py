@@ -0,0 +1,248 @@
+"""
+Long-lived Chromium browsers for evaluation.
+
+Launching Chromium takes longer than most checks, so RepoEvaluator no longer
+starts a browser per repository. A BrowserPool keeps browsers running and
+hands out a fresh browser context for each evaluation: contexts are isolated
+(cookies, storage, cache), cheap to create, and closed afterwards.
+
+A browser is replaced after BROWSER_MAX_USES evaluations, when its processes
+use more than BROWSER_MAX_MEMORY_MB, or when it has crashed.
+
+Playwright's sync API objects belong to the thread that created them, so each
+thread gets its own driver and browser; with the evaluation worker, the pool
+holds one browser per worker thread. AsyncBrowserPool is the async API
+counterpart, for the concurrent engine in instructor/async_evaluate.py: one
+browser shared by all pages of the event loop, recycled by the same rules
+(process memory is read in a worker thread, off the event loop).
+"""
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from playwright.async_api import Browser as AsyncBrowser, BrowserContext as AsyncBrowserContext, Playwright
+from playwright.sync_api import Browser, BrowserContext, Error as PlaywrightError, sync_playwright
+
+from shared.config import settings
+
+
+class BrowserPool:
+    """Per-thread Chromium browsers, recycled after a number of uses or above a memory limit."""
+
+    def __init__(
+        self,
+        max_uses: Optional[int] = None,
+        max_memory_mb: Optional[int] = None,
+        headless: Optional[bool] = None
+    ):
+        """
+        Initialize the pool; browsers are launched on first use.
+
+        Args:
+            max_uses: Contexts handed out by a browser before it is replaced
+            max_memory_mb: Resident memory of a browser's processes above
+                which it is replaced (0 disables the check)
+            headless: Run Chromium headless
+        """
+        self.max_uses = max_uses or settings.browser_max_uses
+        self.max_memory_mb = max_memory_mb if max_memory_mb is not None else settings.browser_max_memory_mb
+        self.headless = headless if headless is not None else settings.headless
+        self._local = threading.local()
+
+    @contextmanager
+    def context(self) -> Iterator[BrowserContext]:
+        """A fresh, isolated browser context, closed on exit."""
+        browser = self._browser()
+        context = browser.new_context()
+        try:
+            yield context
+        finally:
+            try:
+                context.close()
+            except PlaywrightError:
+                pass
+            self._local.uses += 1
+            self._recycle_if_needed()
+
+    def close(self):
+        """Close the calling thread's browser and driver."""
+        browser = getattr(self._local, "browser", None)
+        if browser is not None:
+            try:
+                browser.close()
+            except PlaywrightError:
+                pass
+            self._local.browser = None
+        playwright = getattr(self._local, "playwright", None)
+        if playwright is not None:
+            playwright.stop()
+            self._local.playwright = None
+
+    def _browser(self) -> Browser:
+        if getattr(self._local, "playwright", None) is None:
+            self._local.playwright = sync_playwright().start()
+            self._local.browser = None
+        browser = self._local.browser
+        if browser is None or not browser.is_connected():
+            browser = self._local.playwright.chromium.launch(headless=self.headless)
+            self._local.browser = browser
+            self._local.uses = 0
+        return browser
+
+    def _recycle_if_needed(self):
+        browser = self._local.browser
+        replace = not browser.is_connected() or self._local.uses >= self.max_uses
+        if not replace and self.max_memory_mb:
+            memory_mb = browser_memory_mb(browser)
+            if memory_mb is not None and memory_mb > self.max_memory_mb:
+                print(f"⚠️  Replacing browser using {memory_mb:.0f} MB")
+                replace = True
+        if not replace:
+            return
+        try:
+            browser.close()
+        except PlaywrightError:
+            pass
+        # Launched again on the next context()
+        self._local.browser = None
+
+
+class AsyncBrowserPool:
+    """A Chromium browser shared by concurrent async evaluations, recycled after a number of uses or above a memory limit."""
+
+    def __init__(
+        self,
+        playwright: Playwright,
+        max_uses: Optional[int] = None,
+        max_memory_mb: Optional[int] = None,
+        headless: Optional[bool] = None
+    ):
+        """
+        Initialize the pool; the browser is launched on first use.
+
+        Args:
+            playwright: Started async Playwright driver
+            max_uses: Contexts handed out by a browser before it is replaced
+            max_memory_mb: Resident memory of a browser's processes above
+                which it is replaced (0 disables the check)
+            headless: Run Chromium headless
+        """
+        self.playwright = playwright
+        self.max_uses = max_uses or settings.browser_max_uses
+        self.max_memory_mb = max_memory_mb if max_memory_mb is not None else settings.browser_max_memory_mb
+        self.headless = headless if headless is not None else settings.headless
+        self._browser: Optional[AsyncBrowser] = None
+        self._uses = 0
+        # Open contexts per browser, by id(browser); replaced browsers close when theirs do
+        self._active: Dict[int, int] = {}
+        self._browsers: Dict[int, AsyncBrowser] = {}
+        self._lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def context(self) -> AsyncIterator[AsyncBrowserContext]:
+        """A fresh, isolated browser context, closed on exit."""
+        async with self._lock:
+            if self._browser is None or not self._browser.is_connected() or self._uses >= self.max_uses:
+                await self._replace()
+            browser = self._browser
+            self._uses += 1
+            self._active[id(browser)] += 1
+        try:
+            context = await browser.new_context()
+            try:
+                yield context
+            finally:
+                try:
+                    await context.close()
+                except PlaywrightError:
+                    pass
+            await self._check_memory(browser)
+        finally:
+            if id(browser) in self._active:
+                self._active[id(browser)] -= 1
+                if browser is not self._browser and not self._active[id(browser)]:
+                    await self._close(browser)
+
+    async def close(self):
+        """Close every browser of the pool."""
+        for browser in list(self._browsers.values()):
+            await self._close(browser)
+        self._browser = None
+
+    async def _check_memory(self, browser: AsyncBrowser):
+        """Have the next context() replace the browser if it uses too much memory."""
+        if not self.max_memory_mb or browser is not self._browser:
+            return
+        memory_mb = await async_browser_memory_mb(browser)
+        if memory_mb is not None and memory_mb > self.max_memory_mb and browser is self._browser:
+            print(f"⚠️  Replacing browser using {memory_mb:.0f} MB")
+            self._uses = self.max_uses
+
+    async def _replace(self):
+        previous = self._browser
+        self._browser = await self.playwright.chromium.launch(headless=self.headless)
+        self._browsers[id(self._browser)] = self._browser
+        self._active[id(self._browser)] = 0
+        self._uses = 0
+        if previous is not None and not self._active[id(previous)]:
+            await self._close(previous)
+
+    async def _close(self, browser: AsyncBrowser):
+        self._browsers.pop(id(browser), None)
+        self._active.pop(id(browser), None)
+        try:
+            await browser.close()
+        except PlaywrightError:
+            pass
+
+
+def browser_memory_mb(browser: Browser) -> Optional[float]:
+    """
+    Resident memory of all of a Chromium browser's processes.
+
+    Returns:
+        Megabytes, or None where process memory cannot be read (non-Linux)
+    """
+    try:
+        session = browser.new_browser_cdp_session()
+        try:
+            processes = session.send("SystemInfo.getProcessInfo")["processInfo"]
+        finally:
+            session.detach()
+    except PlaywrightError:
+        return None
+    return processes_memory_mb([process["id"] for process in processes])
+
+
+async def async_browser_memory_mb(browser: AsyncBrowser) -> Optional[float]:
+    """Async counterpart of browser_memory_mb; /proc is read in a worker thread."""
+    try:
+        session = await browser.new_browser_cdp_session()
+        try:
+            processes = (await session.send("SystemInfo.getProcessInfo"))["processInfo"]
+        finally:
+            await session.detach()
+    except PlaywrightError:
+        return None
+    return await asyncio.to_thread(processes_memory_mb, [process["id"] for process in processes])
+
+
+def processes_memory_mb(pids: List[int]) -> Optional[float]:
+    """
+    Resident memory of a set of processes.
+
+    Returns:
+        Megabytes, or None where process memory cannot be read (non-Linux)
+    """
+    page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            # Exited since the query, or no /proc
+            continue
+    return total / (1024 * 1024) if total else None
@@ -0,0 +1,255 @@
+"""
+Local cache of CDN assets for evaluation pages.
+
+Generated pages load Bootstrap, marked, highlight.js and the like from public
+CDNs, and without a cache every evaluation downloads them again. With
+CDN_CACHE_ENABLED, each browser context of the evaluator routes requests to
+the CDN_CACHE_HOSTS through a CdnCache:
+
+- a cached asset is fulfilled from disk without touching the network
+- a missing one is fetched once, stored and served (or, with
+  CDN_CACHE_OFFLINE, aborted, so an evaluation never waits on a CDN)
+
+The page still requests the original CDN URLs, only the responses come from
+the cache, so the DOM, the performance entries and every check that looks for
+a CDN URL see exactly what they would online. The URLs each page requested
+are kept on its CdnRoute.
+
+The cache under CDN_CACHE_DIR is content-addressed: ``objects/`` holds each
+distinct body once, named by its SHA-256, and ``urls/`` maps a URL (by its
+SHA-256) to its body's hash and response headers. Files are written to a
+temporary name and renamed, so any number of evaluator threads and processes
+can share a cache.
+
+Warm it before an offline run with ``python scripts/warm_cdn_cache.py``.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import requests
+from playwright.async_api import Error as AsyncPlaywrightError
+from playwright.sync_api import Error as PlaywrightError
+
+from shared.config import settings
+
+
+# Kept from the CDN response; the body is stored decoded and whole
+CACHED_HEADERS = ("content-type", "access-control-allow-origin", "timing-allow-origin")
+
+_ASSET_REFERENCE = re.compile(r"""(?:src|href)\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+_CSS_URL = re.compile(r"""url\(\s*["']?([^"')]+)["']?\s*\)""")
+
+
+def cached_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """Headers of a CDN response worth replaying with its decoded body."""
+    return {name.lower(): value for name, value in headers.items() if name.lower() in CACHED_HEADERS}
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class CdnRoute:
+    """Requests of one browser context that went through the cache."""
+
+    def __init__(self):
+        self.urls: List[str] = []
+        self.hits = 0
+        self.misses = 0
+        self.blocked = 0
+
+    def log(self, url: str):
+        if self.urls:
+            print(f"📊 CDN cache for {url}: {self.hits} hits, {self.misses} fetched, {self.blocked} blocked offline")
+
+
+class CdnCache:
+    """Content-addressed cache of CDN responses, served to pages by request routing."""
+
+    def __init__(self, directory: Optional[str] = None, hosts: Optional[List[str]] = None, offline: Optional[bool] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            directory: Cache directory (created on first store)
+            hosts: CDN host names whose requests are routed through the cache
+            offline: Abort requests missing from the cache instead of fetching them
+        """
+        self.directory = Path(directory or settings.cdn_cache_dir)
+        if hosts is None:
+            hosts = [host.strip() for host in settings.cdn_cache_hosts.split(",") if host.strip()]
+        self.hosts = {host.lower() for host in hosts}
+        self.offline = offline if offline is not None else settings.cdn_cache_offline
+
+    def is_cdn(self, url: str) -> bool:
+        """Whether a URL is on one of the cached CDN hosts."""
+        parsed = urlparse(url)
+        return parsed.scheme in ("http", "https") and (parsed.hostname or "").lower() in self.hosts
+
+    def _entry_path(self, url: str) -> Path:
+        return self.directory / "urls" / f"{_digest(url.encode())}.json"
+
+    def _object_path(self, sha256: str) -> Path:
+        return self.directory / "objects" / sha256[:2] / sha256
+
+    def lookup(self, url: str) -> Optional[Tuple[Dict[str, str], bytes]]:
+        """
+        A cached response.
+
+        Returns:
+            (headers, body), or None when the URL is not cached
+        """
+        try:
+            with open(self._entry_path(url)) as f:
+                entry = json.load(f)
+            body = self._object_path(entry["sha256"]).read_bytes()
+        except (OSError, ValueError, KeyError):
+            return None
+        return entry["headers"], body
+
+    def store(self, url: str, headers: Dict[str, str], body: bytes):
+        """Cache a successful response to a URL."""
+        sha256 = _digest(body)
+        object_path = self._object_path(sha256)
+        if not object_path.exists():
+            self._write(object_path, body)
+        entry = {"url": url, "sha256": sha256, "headers": cached_headers(headers)}
+        self._write(self._entry_path(url), json.dumps(entry).encode())
+
+    def _write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            raise
+
+    def fetch(self, url: str, refresh: bool = False) -> Optional[bytes]:
+        """
+        Download an asset into the cache (used for warming).
+
+        Returns:
+            The body, or None if it could not be downloaded
+        """
+        if not refresh:
+            cached = self.lookup(url)
+            if cached is not None:
+                return cached[1]
+        try:
+            response = requests.get(url, timeout=settings.timeout / 1000)
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️  Could not fetch {url}: {e}")
+            return None
+        if response.status_code != 200:
+            print(f"⚠️  Could not fetch {url}: HTTP {response.status_code}")
+            return None
+        self.store(url, dict(response.headers), response.content)
+        return response.content
+
+    def asset_urls(self, html: str, base_url: str) -> List[str]:
+        """CDN asset URLs referenced by src and href attributes of a page."""
+        urls = (urljoin(base_url, reference) for reference in _ASSET_REFERENCE.findall(html))
+        return list(dict.fromkeys(url for url in urls if self.is_cdn(url)))
+
+    def warm(self, urls: List[str], refresh: bool = False) -> int:
+        """
+        Cache assets, and the CDN fonts and images their stylesheets refer to.
+
+        Returns:
+            Number of assets now cached
+        """
+        cached = 0
+        pending = list(dict.fromkeys(urls))
+        seen = set(pending)
+        while pending:
+            url = pending.pop(0)
+            body = self.fetch(url, refresh=refresh)
+            if body is None:
+                continue
+            cached += 1
+            if urlparse(url).path.endswith(".css"):
+                for reference in _CSS_URL.findall(body.decode("utf-8", "replace")):
+                    asset = urljoin(url, reference.strip())
+                    if self.is_cdn(asset) and asset not in seen:
+                        seen.add(asset)
+                        pending.append(asset)
+        return cached
+
+    def route(self, context) -> CdnRoute:
+        """Serve a sync Playwright browser context's CDN requests from the cache."""
+        recorded = CdnRoute()
+
+        def handle(route):
+            request = route.request
+            if request.method != "GET":
+                route.continue_()
+                return
+            recorded.urls.append(request.url)
+            cached = self.lookup(request.url)
+            if cached is not None:
+                recorded.hits += 1
+                headers, body = cached
+                route.fulfill(status=200, headers=headers, body=body)
+            elif self.offline:
+                recorded.blocked += 1
+                route.abort("internetdisconnected")
+            else:
+                recorded.misses += 1
+                try:
+                    response = route.fetch()
+                    body = response.body()
+                except PlaywrightError:
+                    route.abort("failed")
+                    return
+                if response.status == 200:
+                    self.store(request.url, response.headers, body)
+                route.fulfill(status=response.status, headers=cached_headers(response.headers), body=body)
+
+        context.route(self.is_cdn, handle)
+        return recorded
+
+    async def async_route(self, context) -> CdnRoute:
+        """Async counterpart of route, for the concurrent engine."""
+        recorded = CdnRoute()
+
+        async def handle(route):
+            request = route.request
+            if request.method != "GET":
+                await route.continue_()
+                return
+            recorded.urls.append(request.url)
+            cached = await asyncio.to_thread(self.lookup, request.url)
+            if cached is not None:
+                recorded.hits += 1
+                headers, body = cached
+                await route.fulfill(status=200, headers=headers, body=body)
+            elif self.offline:
+                recorded.blocked += 1
+                await route.abort("internetdisconnected")
+            else:
+                recorded.misses += 1
+                try:
+                    response = await route.fetch()
+                    body = await response.body()
+                except AsyncPlaywrightError:
+                    await route.abort("failed")
+                    return
+                if response.status == 200:
+                    await asyncio.to_thread(self.store, request.url, response.headers, body)
+                await route.fulfill(status=response.status, headers=cached_headers(response.headers), body=body)
+
+        await context.route(self.is_cdn, handle)
+        return recorded
@@ -1,20 +1,36 @@
 """
 Evaluate: Run checks on submitted repositories.
 """
+import argparse
+import asyncio
 import requests
 import json
 from datetime import datetime
-from playwright.sync_api import sync_playwright
+from typing import Callable, Optional
 from sqlalchemy.orm import Session
-from shared.database import SessionLocal, Repo, Result, Task, init_db
+from shared.database import Repo, Result, Task, init_db
+from instructor.browser_pool import BrowserPool
+from instructor.cdn_cache import CdnCache
+from instructor.js_checks import run_js_checks
+from instructor.page_readiness import READINESS_SCRIPT, log_readiness, wait_until_ready
 from shared.config import settings
+from shared.llm_usage import record_llm_call
 import re
+import time
 
 
 class RepoEvaluator:
     """Evaluate a repository against checks."""
     
-    def __init__(self):
+    def __init__(self, browsers: Optional[BrowserPool] = None):
+        """
+        Initialize the evaluator.
+        
+        Args:
+            browsers: Browser pool for dynamic checks (a new one by default)
+        """
+        self.browsers = browsers or BrowserPool()
+        self.cdn_cache = CdnCache() if settings.cdn_cache_enabled else None
         self.llm_provider = settings.llm_provider
         if self.llm_provider == "openai":
             self.api_key = settings.openai_api_key
@@ -23,32 +39,34 @@ class RepoEvaluator:
             self.api_key = settings.anthropic_api_key
             self.api_url = "https://api.anthropic.com/v1/messages"
     
+    def _post_llm(self, headers: dict, payload: dict, stage: str) -> requests.Response:
+        """Call the grading LLM, recording latency, token usage and cost."""
+        started = time.perf_counter()
+        try:
+            response = requests.post(self.api_url, headers=headers, json=payload, timeout=60)
+        except requests.exceptions.RequestException as e:
+            status = "timeout" if isinstance(e, requests.exceptions.Timeout) else "error"
+            record_llm_call(self.llm_provider, payload["model"], None, time.perf_counter() - started, status=status, stage=stage)
+            raise
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        status = "ok" if response.status_code == 200 else f"http_{response.status_code}"
+        record_llm_call(self.llm_provider, payload["model"], body, time.perf_counter() - started, status=status, stage=stage)
+        response.raise_for_status()
+        return response
+    
     def evaluate_repo(self, repo: Repo, task: Task) -> list[dict]:
         """
         Evaluate a repository against all checks.
         
         Returns list of evaluation results.
         """
-        results = []
-        
         # Parse checks
         checks = json.loads(task.checks)
         
-        # 1. Check repository creation time
-        result = self.check_repo_created_after_task(repo, task)
-        results.append(result)
-        
-        # 2. Check MIT License
-        result = self.check_mit_license(repo)
-        results.append(result)
-        
-        # 3. Check README quality
-        result = self.check_readme_quality(repo)
-        results.append(result)
-        
-        # 4. Check code quality
-        result = self.check_code_quality(repo)
-        results.append(result)
+        results = [static_check() for static_check in self.static_checks(repo, task)]
         
         # 5. Run dynamic checks with Playwright
         dynamic_results = self.run_playwright_checks(repo, checks)
@@ -56,6 +74,19 @@ class RepoEvaluator:
         
         return results
     
+    def static_checks(self, repo: Repo, task: Task) -> list[Callable[[], dict]]:
+        """Checks that do not need the page, in result order; they are independent."""
+        return [
+            # 1. Check repository creation time
+            lambda: self.check_repo_created_after_task(repo, task),
+            # 2. Check MIT License
+            lambda: self.check_mit_license(repo),
+            # 3. Check README quality
+            lambda: self.check_readme_quality(repo),
+            # 4. Check code quality
+            lambda: self.check_code_quality(repo),
+        ]
+    
     def check_repo_created_after_task(self, repo: Repo, task: Task) -> dict:
         """Check if repo was created after task was sent."""
         # This would need GitHub API to check repo creation time
@@ -141,8 +172,7 @@ Return ONLY a JSON object with keys: score (float), reason (string)
                     "response_format": {"type": "json_object"},
                     "temperature": 0.3
                 }
-                response = requests.post(self.api_url, headers=headers, json=payload, timeout=60)
-                response.raise_for_status()
+                response = self._post_llm(headers, payload, stage="readme_quality")
                 result_json = json.loads(response.json()["choices"][0]["message"]["content"])
             else:  # anthropic
                 headers = {
@@ -156,8 +186,7 @@ Return ONLY a JSON object with keys: score (float), reason (string)
                     "messages": [{"role": "user", "content": prompt}],
                     "temperature": 0.3
                 }
-                response = requests.post(self.api_url, headers=headers, json=payload, timeout=60)
-                response.raise_for_status()
+                response = self._post_llm(headers, payload, stage="readme_quality")
                 content = response.json()["content"][0]["text"]
                 # Extract JSON
                 start = content.find("{")
@@ -222,8 +251,7 @@ Return ONLY a JSON object with keys: score (float), reason (string)
                     "response_format": {"type": "json_object"},
                     "temperature": 0.3
                 }
-                response = requests.post(self.api_url, headers=headers, json=payload, timeout=60)
-                response.raise_for_status()
+                response = self._post_llm(headers, payload, stage="code_quality")
                 result_json = json.loads(response.json()["choices"][0]["message"]["content"])
             else:  # anthropic
                 headers = {
@@ -237,8 +265,7 @@ Return ONLY a JSON object with keys: score (float), reason (string)
                     "messages": [{"role": "user", "content": prompt}],
                     "temperature": 0.3
                 }
-                response = requests.post(self.api_url, headers=headers, json=payload, timeout=60)
-                response.raise_for_status()
+                response = self._post_llm(headers, payload, stage="code_quality")
                 content = response.json()["content"][0]["text"]
                 start = content.find("{")
                 end = content.rfind("}") + 1
@@ -263,32 +290,34 @@ Return ONLY a JSON object with keys: score (float), reason (string)
         """Run dynamic checks using Playwright."""
         results = []
         
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=settings.headless)
-            page = browser.new_page()
+        # A fresh context per repo: no cookies or storage from earlier evaluations
+        with self.browsers.context() as context:
+            cdn_route = self.cdn_cache.route(context) if self.cdn_cache else None
+            page = context.new_page()
+            page.add_init_script(READINESS_SCRIPT)
             
             try:
                 # Navigate to page
+                started = time.perf_counter()
                 page.goto(repo.pages_url, timeout=settings.timeout)
-                page.wait_for_load_state("networkidle", timeout=settings.timeout)
                 
-                # Wait a bit for dynamic content
-                page.wait_for_timeout(5000)
+                # Wait for what the checks look at rather than a fixed time
+                log_readiness(repo.pages_url, started, wait_until_ready(page, checks))
                 
-                # Run each check
-                for check in checks:
-                    result = self.evaluate_check(page, check)
+                # All js: checks in one round trip, then the rest
+                js_outcomes = run_js_checks(page, checks)
+                for i, check in enumerate(checks):
+                    if i in js_outcomes:
+                        result = js_outcome_result(check, js_outcomes[i])
+                    else:
+                        result = self.evaluate_check(page, check)
                     results.append(result)
                 
             except Exception as e:
-                results.append({
-                    "check": "Page load",
-                    "score": 0.0,
-                    "reason": f"Failed to load page: {str(e)}",
-                    "logs": str(e)
-                })
-            finally:
-                browser.close()
+                results.append(page_load_error_result(e))
+            
+            if cdn_route:
+                cdn_route.log(repo.pages_url)
         
         return results
     
@@ -297,136 +326,158 @@ Return ONLY a JSON object with keys: score (float), reason (string)
         try:
             # Check if it's a JavaScript check
             if check.startswith("js:"):
-                js_code = check[3:].strip()
-                result = page.evaluate(js_code)
-                
-                if result:
-                    return {
-                        "check": check,
-                        "score": 1.0,
-                        "reason": "Check passed",
-                        "logs": f"Result: {result}"
-                    }
-                else:
-                    return {
-                        "check": check,
-                        "score": 0.0,
-                        "reason": "Check failed",
-                        "logs": f"Result: {result}"
-                    }
-            
-            # Text-based checks
-            elif "MIT license" in check.lower():
-                # Already checked in separate function
-                return {
-                    "check": check,
-                    "score": 1.0,
-                    "reason": "Checked separately",
-                    "logs": ""
-                }
+                return js_check_result(check, page.evaluate(check[3:].strip()))
             
-            elif "README.md" in check:
-                # Already checked in separate function
-                return {
-                    "check": check,
-                    "score": 1.0,
-                    "reason": "Checked separately",
-                    "logs": ""
-                }
+            elif checked_separately(check):
+                return separate_check_result(check)
             
             else:
                 # Generic check - look for keywords in page
-                content = page.content()
-                if any(keyword in content for keyword in check.split()):
-                    return {
-                        "check": check,
-                        "score": 0.5,
-                        "reason": "Partial match found",
-                        "logs": ""
-                    }
-                else:
-                    return {
-                        "check": check,
-                        "score": 0.0,
-                        "reason": "No match found",
-                        "logs": ""
-                    }
+                return text_check_result(check, page.content())
         
         except Exception as e:
-            return {
-                "check": check,
-                "score": 0.0,
-                "reason": f"Error running check: {str(e)}",
-                "logs": str(e)
-            }
+            return check_error_result(check, e)
 
 
-def evaluate_all_repos():
-    """Evaluate all repositories in the database."""
+def js_check_result(check: str, result) -> dict:
+    """Score a js: check from the value its expression returned."""
+    if result:
+        return {
+            "check": check,
+            "score": 1.0,
+            "reason": "Check passed",
+            "logs": f"Result: {result}"
+        }
+    else:
+        return {
+            "check": check,
+            "score": 0.0,
+            "reason": "Check failed",
+            "logs": f"Result: {result}"
+        }
+
+
+def js_outcome_result(check: str, outcome: dict) -> dict:
+    """Score a js: check from its outcome in a batch (see instructor/js_checks.py)."""
+    if "error" in outcome:
+        return check_error_result(check, RuntimeError(outcome["error"]))
+    return js_check_result(check, outcome.get("value"))
+
+
+def checked_separately(check: str) -> bool:
+    """Whether a check is covered by the license and README checks."""
+    return "MIT license" in check.lower() or "README.md" in check
+
+
+def separate_check_result(check: str) -> dict:
+    return {
+        "check": check,
+        "score": 1.0,
+        "reason": "Checked separately",
+        "logs": ""
+    }
+
+
+def text_check_result(check: str, content: str) -> dict:
+    """Score a text check by looking for its keywords in the page HTML."""
+    if any(keyword in content for keyword in check.split()):
+        return {
+            "check": check,
+            "score": 0.5,
+            "reason": "Partial match found",
+            "logs": ""
+        }
+    else:
+        return {
+            "check": check,
+            "score": 0.0,
+            "reason": "No match found",
+            "logs": ""
+        }
+
+
+def check_error_result(check: str, e: Exception) -> dict:
+    return {
+        "check": check,
+        "score": 0.0,
+        "reason": f"Error running check: {str(e)}",
+        "logs": str(e)
+    }
+
+
+def page_load_error_result(e: Exception) -> dict:
+    return {
+        "check": "Page load",
+        "score": 0.0,
+        "reason": f"Failed to load page: {str(e)}",
+        "logs": str(e)
+    }
+
+
+def page_load_failed(eval_results: list[dict]) -> bool:
+    """Whether the deployed page could not be loaded (e.g. Pages not built yet)."""
+    return any(r["check"] == "Page load" and r["score"] == 0.0 for r in eval_results)
+
+
+def add_results(db: Session, repo: Repo, eval_results: list[dict]):
+    """Add the results of one evaluation to the session; the caller commits."""
+    for eval_result in eval_results:
+        result = Result(
+            email=repo.email,
+            task=repo.task,
+            round=repo.round,
+            repo_url=repo.repo_url,
+            commit_sha=repo.commit_sha,
+            pages_url=repo.pages_url,
+            check=eval_result['check'],
+            score=eval_result['score'],
+            reason=eval_result['reason'],
+            logs=eval_result['logs']
+        )
+        db.add(result)
+        
+        print(f"  {eval_result['check']}: {eval_result['score']:.2f} - {eval_result['reason']}")
+
+
+def evaluate_all_repos(profile: bool = False, concurrency: Optional[int] = None, workers: int = 1):
+    """
+    Evaluate every submission whose current commit has no results yet.
+    
+    Evaluation jobs are queued for them and then claimed with leases, along
+    with any other due jobs, so the batch can run next to evaluation workers
+    and other batch runs without evaluating a repo twice. Repos are evaluated
+    concurrently by the async engine, and each repo's results are stored as
+    soon as it completes.
+    
+    Args:
+        profile: Store a sampling profile of each evaluation run
+        concurrency: Repos evaluated at once (default from CPUs and memory)
+        workers: Worker processes; jobs are sharded by (email, task, round)
+    """
+    # Imported here: both build on RepoEvaluator and the helpers above
+    from instructor.async_evaluate import AsyncEvaluationEngine, evaluate_sharded
+    from instructor.evaluation_jobs import EvaluationJobs
+    
     init_db()
-    db: Session = SessionLocal()
-    evaluator = RepoEvaluator()
+    jobs = EvaluationJobs()
+    print(f"Queued {jobs.enqueue_missing()} repositories without results")
     
-    try:
-        # Get all repos
-        repos = db.query(Repo).all()
-        
-        print(f"Found {len(repos)} repositories to evaluate")
-        
-        for repo in repos:
-            # Check if already evaluated
-            existing = db.query(Result).filter(
-                Result.email == repo.email,
-                Result.task == repo.task,
-                Result.round == repo.round,
-                Result.repo_url == repo.repo_url
-            ).first()
-            
-            if existing:
-                print(f"Skipping {repo.email} - {repo.task} round {repo.round} (already evaluated)")
-                continue
-            
-            print(f"\nEvaluating {repo.email} - {repo.task} round {repo.round}")
-            
-            # Get task
-            task = db.query(Task).filter(
-                Task.email == repo.email,
-                Task.task == repo.task,
-                Task.round == repo.round
-            ).first()
-            
-            if not task:
-                print(f"  Warning: No task found")
-                continue
-            
-            # Run evaluation
-            eval_results = evaluator.evaluate_repo(repo, task)
-            
-            # Store results
-            for eval_result in eval_results:
-                result = Result(
-                    email=repo.email,
-                    task=repo.task,
-                    round=repo.round,
-                    repo_url=repo.repo_url,
-                    commit_sha=repo.commit_sha,
-                    pages_url=repo.pages_url,
-                    check=eval_result['check'],
-                    score=eval_result['score'],
-                    reason=eval_result['reason'],
-                    logs=eval_result['logs']
-                )
-                db.add(result)
-                
-                print(f"  {eval_result['check']}: {eval_result['score']:.2f} - {eval_result['reason']}")
-            
-            db.commit()
-        
-        print("\nEvaluation complete")
-        
-    finally:
-        db.close()
+    if workers > 1:
+        claimable = jobs.claimable_jobs()
+        print(f"Evaluating {len(claimable)} jobs in {workers} worker processes")
+        outcomes = evaluate_sharded(claimable, workers, concurrency=concurrency, profile=profile)
+    else:
+        engine = AsyncEvaluationEngine(concurrency=concurrency, profile=profile)
+        print(f"Evaluating queued jobs, {engine.concurrency} at a time")
+        outcomes = asyncio.run(engine.run_jobs(jobs))
+    
+    print(f"\nEvaluation complete: {outcomes}")
 
 
 if __name__ == "__main__":
-    evaluate_all_repos()
+    parser = argparse.ArgumentParser(description="Evaluate all submitted repositories not evaluated yet")
+    parser.add_argument("--profile", action="store_true", help="profile each evaluation")
+    parser.add_argument("--concurrency", type=int, help="repos evaluated at once (across all workers)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, each with its own browser")
+    args = parser.parse_args()
+    evaluate_all_repos(profile=args.profile, concurrency=args.concurrency, workers=args.workers)
@@ -1,72 +1,101 @@
 """
 Evaluation API endpoint for receiving student submissions.
 """
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+import asyncio
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from shared.models import RepoSubmission
-from shared.database import get_db, Repo, Task, init_db
+from shared.database import (
+    get_async_db, init_async_db, dispose_async_engine,
+    upsert_submission, submission_params, enqueue_evaluation, evaluation_job_params
+)
 from shared.config import settings
-from datetime import datetime
+from shared.loop_monitor import install_loop_monitor
+from shared.profiling import install_profiling
+from shared.tracing import install_tracing, annotate
+from shared.metrics import REGISTRY, CONTENT_TYPE_LATEST
+from shared.llm_usage import get_ledger, GROUP_BY
+from instructor.ingest_buffer import IngestBuffer
+from typing import Optional
 
 app = FastAPI(title="TDS Evaluation API")
 
-# Initialize database
-init_db()
+# Report event-loop lag and stacks of blocking calls
+loop_monitor = install_loop_monitor(app)
+
+# Profile requests sent with X-Profile; admin endpoints list stored profiles
+install_profiling(app, profile_requests=True)
+
+# Record submissions in the trace started by the instructor dispatch
+install_tracing(app, "tds-evaluation-api")
+
+
+# Group-commits submissions when INGEST_MODE=buffered
+ingest_buffer: Optional[IngestBuffer] = None
+
+
+@app.on_event("startup")
+async def startup():
+    """Initialize database tables and the ingest buffer."""
+    global ingest_buffer
+    await init_async_db()
+    if settings.ingest_mode == "buffered":
+        buffer = IngestBuffer()
+        try:
+            await buffer.start()
+        except RuntimeError as e:
+            # Another worker owns the log; this one commits each submission
+            print(f"⚠️  Buffered ingestion disabled in this worker, writing directly: {e}")
+            return
+        ingest_buffer = buffer
+        print(f"✅ Buffered ingestion: batches of up to {ingest_buffer.batch_size} every {settings.ingest_flush_ms}ms")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Commit buffered submissions and close pooled database connections."""
+    if ingest_buffer is not None:
+        await ingest_buffer.stop()
+    await dispose_async_engine()
 
 
 @app.post("/api/evaluate")
-async def receive_submission(submission: RepoSubmission):
+async def receive_submission(submission: RepoSubmission, db: AsyncSession = Depends(get_async_db)):
     """
     Receive repository submission from students.
     
     Validates the submission against the task table and stores in repos table.
     """
-    db: Session = next(get_db())
+    annotate(email=submission.email, task=submission.task, round=submission.round, nonce=submission.nonce)
     
     try:
-        # Find matching task
-        task = db.query(Task).filter(
-            Task.email == submission.email,
-            Task.task == submission.task,
-            Task.round == submission.round,
-            Task.nonce == submission.nonce
-        ).first()
-        
-        if not task:
-            raise HTTPException(
-                status_code=400,
-                detail="No matching task found. Check email, task, round, and nonce."
-            )
-        
-        # Check if already submitted
-        existing = db.query(Repo).filter(
-            Repo.email == submission.email,
-            Repo.task == submission.task,
-            Repo.round == submission.round,
-            Repo.nonce == submission.nonce
-        ).first()
-        
-        if existing:
-            # Update existing submission
-            existing.repo_url = submission.repo_url
-            existing.commit_sha = submission.commit_sha
-            existing.pages_url = submission.pages_url
-            existing.timestamp = datetime.utcnow()
+        if ingest_buffer is not None:
+            # Validate now, store with the next group commit
+            if not await ingest_buffer.has_task(submission.model_dump()):
+                raise HTTPException(
+                    status_code=400,
+                    detail="No matching task found. Check email, task, round, and nonce."
+                )
+            await ingest_buffer.submit(submission.model_dump())
         else:
-            # Create new submission
-            repo = Repo(
-                email=submission.email,
-                task=submission.task,
-                round=submission.round,
-                nonce=submission.nonce,
-                repo_url=submission.repo_url,
-                commit_sha=submission.commit_sha,
-                pages_url=submission.pages_url
-            )
-            db.add(repo)
-        
-        db.commit()
+            # Store the submission if a matching task exists, updating a previous
+            # one for the same task (one statement, see upsert_submission)
+            stored = (await db.execute(
+                upsert_submission(db.bind.dialect.name), submission_params(submission.model_dump())
+            )).first()
+            
+            if stored is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail="No matching task found. Check email, task, round, and nonce."
+                )
+            
+            if settings.evaluation_enqueue:
+                # Picked up by the evaluation worker (instructor/evaluation_worker.py)
+                await db.execute(enqueue_evaluation(db.bind.dialect.name), evaluation_job_params(submission.model_dump()))
+            
+            await db.commit()
         
         return JSONResponse(
             status_code=200,
@@ -80,10 +109,8 @@ async def receive_submission(submission: RepoSubmission):
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 
 @app.get("/")
@@ -98,6 +125,26 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/usage")
+async def usage(group_by: str = "model", task: Optional[str] = None, since: Optional[float] = None,
+                offset: int = 0, limit: int = 100):
+    """LLM token usage and cost of the graders, aggregated and per call."""
+    if group_by not in GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(GROUP_BY)}")
+    ledger = get_ledger()
+    return {
+        "group_by": group_by,
+        "summary": await asyncio.to_thread(ledger.summary, group_by, task, since),
+        "calls": await asyncio.to_thread(ledger.records, offset, limit, task, since)
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
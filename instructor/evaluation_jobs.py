@@ -0,0 +1,275 @@
+"""
+Evaluation jobs claimed with leases, shared by any number of evaluators.
+
+Every evaluation goes through the ``evaluation_jobs`` table: the evaluation API
+queues a job for each accepted submission, and the batch scan queues one for
+each submission without results (backfill). Evaluator processes, on one
+machine or several, share the queue safely:
+
+- there is one job per commit of a submission (unique index), so a commit is
+  never queued twice; a finished or failed job is queued again on resubmission
+- a job is claimed with a conditional UPDATE that sets a lease (owner and
+  expiry); only one claimer's update matches
+- the owner renews the leases of its running jobs every
+  EVALUATION_HEARTBEAT_SECONDS; a running job whose lease lapsed (its
+  evaluator crashed or lost the database) is claimed again
+- every claim counts as an attempt; a job is failed after
+  EVALUATION_MAX_ATTEMPTS
+- results are stored in the transaction that marks the job done, and only
+  while the lease is still held, so no repo is evaluated into the results
+  table twice, even if a lease lapsed during a slow evaluation
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from instructor.evaluate import add_results, page_load_failed
+from shared.config import settings
+from shared.database import (
+    EVALUATION_JOB_KEY, EvaluationJob, Repo, Result, SessionLocal, Task, engine,
+    enqueue_evaluation, evaluation_job_params
+)
+
+
+def claimable(now: datetime):
+    """Jobs that are due, or running under a lapsed lease."""
+    return or_(
+        and_(EvaluationJob.status == "queued", EvaluationJob.available_at <= now),
+        and_(EvaluationJob.status == "running", EvaluationJob.lease_expires_at < now)
+    )
+
+
+class EvaluationJobs:
+    """Claim, renew and complete evaluation jobs as one lease owner."""
+
+    def __init__(self, owner: Optional[str] = None, lease_seconds: Optional[float] = None):
+        """
+        Initialize the job store.
+
+        Args:
+            owner: Lease owner name, unique per evaluator process (default:
+                host, process ID and a random suffix)
+            lease_seconds: How long a claim or renewal holds a job
+        """
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds or settings.evaluation_lease_seconds
+
+    def _lease_expiry(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+
+    def _owned(self, db: Session, job_id: int):
+        """Query for a job only while this owner holds its lease."""
+        return db.query(EvaluationJob).filter(
+            EvaluationJob.id == job_id,
+            EvaluationJob.status == "running",
+            EvaluationJob.lease_owner == self.owner
+        )
+
+    def enqueue_missing(self) -> int:
+        """
+        Queue a job for every submission whose current commit has no results (backfill).
+
+        Returns:
+            Number of submissions queued
+        """
+        db: Session = SessionLocal()
+        try:
+            evaluated = set(db.query(Result.email, Result.task, Result.round, Result.commit_sha).distinct())
+            params = [
+                evaluation_job_params({column: getattr(repo, column) for column in EVALUATION_JOB_KEY}, delay=0)
+                for repo in db.query(Repo).all()
+                if (repo.email, repo.task, repo.round, repo.commit_sha) not in evaluated
+            ]
+            if params:
+                db.execute(enqueue_evaluation(engine.dialect.name), params)
+                db.commit()
+            return len(params)
+        finally:
+            db.close()
+
+    def claimable_jobs(self) -> List[Tuple[int, str, str, int]]:
+        """(id, email, task, round) of the jobs that can be claimed now."""
+        db: Session = SessionLocal()
+        try:
+            return [tuple(row) for row in db.query(
+                EvaluationJob.id, EvaluationJob.email, EvaluationJob.task, EvaluationJob.round
+            ).filter(claimable(datetime.utcnow())).order_by(EvaluationJob.id).all()]
+        finally:
+            db.close()
+
+    def claim(self, limit: int, ids: Optional[Iterable[int]] = None) -> List[int]:
+        """
+        Claim up to limit jobs.
+
+        Args:
+            limit: Most jobs to claim
+            ids: Only claim among these jobs (e.g. a worker's shard)
+
+        Returns:
+            IDs of the jobs this owner now holds leases on
+        """
+        if limit <= 0:
+            return []
+        db: Session = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            query = db.query(EvaluationJob.id).filter(claimable(now))
+            if ids is not None:
+                query = query.filter(EvaluationJob.id.in_(list(ids)))
+            candidates = query.order_by(EvaluationJob.available_at, EvaluationJob.id).limit(limit).all()
+            claimed = []
+            for (job_id,) in candidates:
+                # Matches no row if another evaluator claimed it since the select
+                updated = db.query(EvaluationJob).filter(
+                    EvaluationJob.id == job_id,
+                    claimable(now)
+                ).update({
+                    "status": "running",
+                    "lease_owner": self.owner,
+                    "lease_expires_at": self._lease_expiry(),
+                    "started_at": now,
+                    "attempts": EvaluationJob.attempts + 1
+                }, synchronize_session=False)
+                db.commit()
+                if updated:
+                    claimed.append(job_id)
+            return claimed
+        finally:
+            db.close()
+
+    def heartbeat(self, job_ids: Iterable[int]) -> int:
+        """
+        Renew the leases of running jobs.
+
+        Returns:
+            Number of leases renewed; fewer than given means some were lost
+        """
+        job_ids = list(job_ids)
+        if not job_ids:
+            return 0
+        db: Session = SessionLocal()
+        try:
+            renewed = db.query(EvaluationJob).filter(
+                EvaluationJob.id.in_(job_ids),
+                EvaluationJob.status == "running",
+                EvaluationJob.lease_owner == self.owner
+            ).update({"lease_expires_at": self._lease_expiry()}, synchronize_session=False)
+            db.commit()
+            return renewed
+        finally:
+            db.close()
+
+    def prepare(self, db: Session, job_id: int) -> Optional[Tuple[EvaluationJob, Repo, Task]]:
+        """
+        Load a claimed job's repo and task, or finish the job if there is nothing to evaluate.
+
+        Returns:
+            (job, repo, task), or None when the job was finished or is no longer held
+        """
+        job = db.get(EvaluationJob, job_id)
+        if job is None or job.status != "running" or job.lease_owner != self.owner:
+            return None
+        if job.attempts > settings.evaluation_max_attempts:
+            # Its evaluators kept stopping before finishing it
+            self.fail(db, job_id, job.error or "Lease lapsed too many times")
+            return None
+        key = {column: getattr(job, column) for column in ("email", "task", "round", "nonce")}
+        repo = db.query(Repo).filter_by(**key).first()
+        task = db.query(Task).filter_by(**key).first()
+        if repo is None or task is None:
+            self.fail(db, job_id, "No matching task or submission")
+            return None
+        if repo.commit_sha != job.commit_sha:
+            # The resubmission has a job of its own
+            self._finish(db, job_id, f"Superseded by commit {repo.commit_sha}")
+            return None
+        evaluated = db.query(Result.id).filter(
+            Result.email == repo.email,
+            Result.task == repo.task,
+            Result.round == repo.round,
+            Result.commit_sha == repo.commit_sha
+        ).first()
+        if evaluated:
+            self._finish(db, job_id, "Already evaluated")
+            return None
+        return job, repo, task
+
+    def complete(self, db: Session, job: EvaluationJob, repo: Repo, eval_results: List[dict]) -> str:
+        """
+        Record the outcome of an evaluation.
+
+        A page that did not load (Pages still building) is retried while
+        attempts remain; otherwise the results are stored.
+
+        Returns:
+            "retried", "done", or "lost" if the lease was lost and the
+            results were discarded
+        """
+        job_id, attempts = job.id, job.attempts
+        if page_load_failed(eval_results) and attempts < settings.evaluation_max_attempts:
+            reason = next(r["reason"] for r in eval_results if r["check"] == "Page load")
+            return "retried" if self.retry(db, job_id, attempts, reason) else "lost"
+        if not self._finish(db, job_id, None, commit=False):
+            db.rollback()
+            print(f"⚠️  Lease on evaluation job {job_id} was lost; results discarded")
+            return "lost"
+        add_results(db, repo, eval_results)
+        db.commit()
+        return "done"
+
+    def retry(self, db: Session, job_id: int, attempts: int, error: str) -> bool:
+        """Queue a held job again after EVALUATION_RETRY_DELAY_SECONDS times its attempts."""
+        delay = settings.evaluation_retry_delay_seconds * attempts
+        updated = self._owned(db, job_id).update({
+            "status": "queued",
+            "available_at": datetime.utcnow() + timedelta(seconds=delay),
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "error": error
+        }, synchronize_session=False)
+        db.commit()
+        if updated:
+            print(f"⚠️  Evaluation job {job_id} retried in {delay}s: {error}")
+        return bool(updated)
+
+    def fail(self, db: Session, job_id: int, error: str) -> bool:
+        """Mark a held job failed."""
+        updated = self._owned(db, job_id).update({
+            "status": "failed",
+            "finished_at": datetime.utcnow(),
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "error": error
+        }, synchronize_session=False)
+        db.commit()
+        if updated:
+            print(f"❌ Evaluation job {job_id} failed: {error}")
+        return bool(updated)
+
+    def retry_or_fail(self, db: Session, job_id: int, error: str):
+        """After an error: retry while attempts remain, otherwise fail."""
+        db.rollback()
+        job = db.get(EvaluationJob, job_id)
+        if job is None:
+            return
+        if job.attempts < settings.evaluation_max_attempts:
+            self.retry(db, job_id, job.attempts, error)
+        else:
+            self.fail(db, job_id, error)
+
+    def _finish(self, db: Session, job_id: int, note: Optional[str], commit: bool = True) -> bool:
+        updated = self._owned(db, job_id).update({
+            "status": "done",
+            "finished_at": datetime.utcnow(),
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "error": note
+        }, synchronize_session=False)
+        if commit:
+            db.commit()
+        return bool(updated)
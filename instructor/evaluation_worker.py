@@ -0,0 +1,141 @@
+"""
+Evaluation worker: evaluate submissions as soon as they arrive.
+
+With EVALUATION_ENQUEUE on, the evaluation API queues an ``evaluation_jobs``
+row in the same transaction that stores each accepted submission. This worker
+claims due jobs and evaluates up to EVALUATION_CONCURRENCY submissions at a
+time, so results appear within seconds of the Pages deploy instead of at the
+next batch run.
+
+Jobs are claimed with leases (see instructor/evaluation_jobs.py), which a
+background thread renews every EVALUATION_HEARTBEAT_SECONDS, so any number of
+workers on any number of machines can share the queue, and the jobs of a
+worker that crashed are claimed again once their leases lapse. A job whose
+page did not load yet (Pages still building) is retried after
+EVALUATION_RETRY_DELAY_SECONDS, up to EVALUATION_MAX_ATTEMPTS times.
+
+``python -m instructor.evaluate`` queues and evaluates everything without
+results, for backfill.
+
+Usage:
+    python -m instructor.evaluation_worker [--concurrency N] [--profile]
+"""
+import argparse
+import signal
+import threading
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from instructor.evaluate import RepoEvaluator
+from instructor.evaluation_jobs import EvaluationJobs
+from shared.config import settings
+from shared.database import SessionLocal, init_db
+from shared.llm_usage import usage_context
+from shared.profiling import profile_run
+
+
+class EvaluationWorker:
+    """Consume the evaluation job queue with bounded concurrency."""
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        profile: bool = False
+    ):
+        """
+        Initialize the worker.
+
+        Args:
+            concurrency: Most submissions evaluated at a time
+            poll_interval: Seconds between queue polls when idle
+            profile: Store a sampling profile of each evaluation
+        """
+        self.concurrency = concurrency or settings.evaluation_concurrency
+        self.poll_interval = poll_interval if poll_interval is not None else settings.evaluation_poll_interval
+        self.profile = profile
+        self.evaluator = RepoEvaluator()
+        self.jobs = EvaluationJobs()
+        self._stopping = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self):
+        """Evaluate claimed jobs until stop() is called."""
+        init_db()
+        print(f"✅ Evaluation worker {self.jobs.owner} started (concurrency {self.concurrency})")
+
+        in_flight: Dict[Future, int] = {}
+        heartbeat = threading.Thread(target=self._heartbeat, args=(in_flight,), name="evaluation-heartbeat", daemon=True)
+        heartbeat.start()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="evaluate") as pool:
+            while not self._stopping.is_set():
+                for job_id in self.jobs.claim(self.concurrency - len(in_flight)):
+                    in_flight[pool.submit(self.process, job_id)] = job_id
+                if in_flight:
+                    done, _ = wait(list(in_flight), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del in_flight[future]
+                        if future.exception() is not None:
+                            print(f"❌ Evaluation worker error: {future.exception()}")
+                else:
+                    self._stopping.wait(self.poll_interval)
+            if in_flight:
+                print(f"⏳ Waiting for {len(in_flight)} running evaluations...")
+        # Leases of running jobs are renewed until they finish
+        self._stopped.set()
+        heartbeat.join()
+        print("✅ Evaluation worker stopped")
+
+    def stop(self):
+        """Stop claiming jobs; running evaluations are finished."""
+        self._stopping.set()
+
+    def _heartbeat(self, in_flight: Dict[Future, int]):
+        while not self._stopped.wait(settings.evaluation_heartbeat_seconds):
+            try:
+                self.jobs.heartbeat(list(in_flight.values()))
+            except Exception as e:
+                print(f"⚠️  Renewing evaluation job leases failed: {e}")
+
+    def process(self, job_id: int):
+        """Evaluate the submission of a claimed job and record the outcome."""
+        db: Session = SessionLocal()
+        try:
+            prepared = self.jobs.prepare(db, job_id)
+            if prepared is None:
+                return
+            job, repo, task = prepared
+
+            print(f"\nEvaluating {repo.email} - {repo.task} round {repo.round} (job {job_id}, attempt {job.attempts})")
+            with profile_run(f"evaluate-{repo.task}-r{repo.round}-{repo.email}", enabled=self.profile), \
+                    usage_context(service="evaluation", task=repo.task, round=repo.round):
+                eval_results = self.evaluator.evaluate_repo(repo, task)
+
+            created_at = job.created_at
+            if self.jobs.complete(db, job, repo, eval_results) == "done":
+                latency = (datetime.utcnow() - created_at).total_seconds()
+                print(f"✅ Evaluated {repo.email} - {repo.task} round {repo.round} {latency:.1f}s after submission")
+        except Exception as e:
+            print(f"❌ Evaluation job {job_id}: {e}")
+            self.jobs.retry_or_fail(db, job_id, str(e))
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, help="submissions evaluated at a time")
+    parser.add_argument("--profile", action="store_true", help="profile each evaluation")
+    args = parser.parse_args()
+
+    worker = EvaluationWorker(concurrency=args.concurrency, profile=args.profile)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: worker.stop())
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
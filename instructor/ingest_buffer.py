@@ -0,0 +1,291 @@
+"""
+Write-behind ingestion of submissions with group commit.
+
+With INGEST_MODE=buffered, ``/api/evaluate`` acknowledges a submission once it
+is appended to a local log and fsynced, instead of after its own database
+commit. A single writer collects submissions for up to INGEST_FLUSH_MS or
+INGEST_BATCH_SIZE records, appends the whole batch to the log with one fsync,
+acknowledges it, and then upserts it into ``repos`` (and queues evaluation
+jobs) in one transaction. Under a burst, one fsync and one commit are shared
+by many submissions.
+
+The log is truncated once its records are in the database. Records left in it
+by a crash are applied again on startup; the upsert makes that idempotent.
+A buffer holds an exclusive lock on its log while it runs: with several
+uvicorn workers, only the first one buffers and ``start`` fails in the others
+(which then write directly), so no worker truncates records another one
+acknowledged.
+Submissions are validated against an in-memory index of task keys, refreshed
+incrementally when a key is missing, so the request path makes no query.
+
+INGEST_ORDERING sets how a batch is applied:
+
+- ``key``: only the latest submission per (email, task, round, nonce) in a
+  batch is written; batches are applied in arrival order, so the last
+  submission for a task wins, as with direct writes
+- ``strict``: every submission is written in arrival order
+"""
+import asyncio
+import fcntl
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from shared.config import settings
+from shared.database import (
+    EVALUATION_JOB_KEY, SUBMISSION_KEY, Task, enqueue_evaluation, engine, evaluation_job_params,
+    submission_params, upsert_submission
+)
+from shared.metrics import Counter, Gauge, Histogram
+
+
+ORDERINGS = ("key", "strict")
+
+INGEST_BATCH = Histogram(
+    "ingest_batch_size",
+    "Submissions per group commit.",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+
+INGEST_COMMIT_SECONDS = Histogram(
+    "ingest_commit_seconds",
+    "Duration of a group commit to the repos table.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+INGEST_PENDING = Gauge(
+    "ingest_pending",
+    "Acknowledged submissions not yet committed to the database."
+)
+
+INGEST_FAILURES = Counter(
+    "ingest_commit_failures_total",
+    "Group commits that failed and will be retried."
+)
+
+
+class TaskIndex:
+    """Keys of known tasks, so that submissions are validated without a query per request."""
+
+    def __init__(self):
+        self._keys = set()
+        self._last_id = 0
+        self._lock = asyncio.Lock()
+
+    def _load_new(self):
+        """Add tasks created since the last load (tasks are never deleted)."""
+        columns = [getattr(Task, column) for column in SUBMISSION_KEY]
+        with engine.connect() as conn:
+            rows = conn.execute(select(Task.id, *columns).where(Task.id > self._last_id)).all()
+        for row in rows:
+            self._keys.add(tuple(row[1:]))
+            self._last_id = max(self._last_id, row[0])
+
+    async def contains(self, key: tuple) -> bool:
+        if key in self._keys:
+            return True
+        async with self._lock:
+            # Concurrent misses share one refresh
+            if key not in self._keys:
+                await asyncio.to_thread(self._load_new)
+        return key in self._keys
+
+
+class IngestBuffer:
+    """Durable log in front of the repos table, flushed in batches."""
+
+    def __init__(
+        self,
+        log_path: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        flush_ms: Optional[float] = None,
+        ordering: Optional[str] = None
+    ):
+        """
+        Initialize the buffer.
+
+        Args:
+            log_path: Append-only log of acknowledged submissions
+            batch_size: Most submissions per group commit
+            flush_ms: Longest wait for more submissions before a commit
+            ordering: key or strict (see module docstring)
+        """
+        self.log_path = Path(log_path or settings.ingest_log_path)
+        self.batch_size = batch_size or settings.ingest_batch_size
+        self.flush_interval = (flush_ms if flush_ms is not None else settings.ingest_flush_ms) / 1000
+        self.ordering = ordering or settings.ingest_ordering
+        if self.ordering not in ORDERINGS:
+            raise ValueError(f"ordering must be one of {ORDERINGS}")
+        self._queue: "asyncio.Queue[Tuple[Dict[str, Any], asyncio.Future]]" = asyncio.Queue()
+        self._unapplied: List[Dict[str, Any]] = []
+        self._writer: Optional[asyncio.Task] = None
+        self._lock_file = None
+        self._stopping = False
+        self.tasks = TaskIndex()
+
+    async def start(self):
+        """
+        Apply records left in the log by a previous run, then start the writer.
+
+        Raises:
+            RuntimeError: Another process is buffering into the same log
+        """
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_log()
+        await asyncio.to_thread(self.tasks._load_new)
+        self._unapplied = await asyncio.to_thread(self._read_log)
+        if self._unapplied:
+            print(f"⚠️  Replaying {len(self._unapplied)} buffered submissions from {self.log_path}")
+            await self._apply()
+        self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commit everything acknowledged so far and stop the writer."""
+        self._stopping = True
+        if self._writer is not None:
+            await self._writer
+            self._writer = None
+        if self._lock_file is not None:
+            # Closing the file releases the lock
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _lock_log(self):
+        lock_file = open(self.log_path, "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(f"{self.log_path} is in use by another process")
+        self._lock_file = lock_file
+
+    async def has_task(self, submission: Dict[str, Any]) -> bool:
+        """Whether the task the submission is for exists."""
+        return await self.tasks.contains(tuple(submission[column] for column in SUBMISSION_KEY))
+
+    async def submit(self, submission: Dict[str, Any]):
+        """
+        Append a submission; returns once it is durable in the log.
+
+        Args:
+            submission: email, task, round, nonce, repo_url, commit_sha, pages_url
+        """
+        if self._writer is None or self._stopping:
+            raise RuntimeError("Ingest buffer is not running")
+        durable = asyncio.get_running_loop().create_future()
+        await self._queue.put(({**submission, "received_at": time.time()}, durable))
+        await durable
+
+    def pending(self) -> int:
+        return self._queue.qsize() + len(self._unapplied)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            if batch:
+                records = [record for record, _ in batch]
+                try:
+                    await asyncio.to_thread(self._append_log, records)
+                except Exception as e:
+                    for _, durable in batch:
+                        durable.set_exception(e)
+                else:
+                    for _, durable in batch:
+                        durable.set_result(None)
+                    self._unapplied.extend(records)
+            INGEST_PENDING.set(self.pending())
+            if self._unapplied and not await self._apply():
+                if self._stopping:
+                    # Left in the log, replayed on the next start
+                    return
+                await asyncio.sleep(min(1.0, self.flush_interval * 100))
+            if self._stopping and self._queue.empty() and not self._unapplied:
+                return
+
+    async def _collect(self) -> List[Tuple[Dict[str, Any], asyncio.Future]]:
+        """Wait for a first submission, then gather more for up to flush_ms."""
+        batch = []
+        try:
+            batch.append(await asyncio.wait_for(self._queue.get(), timeout=0.1))
+        except asyncio.TimeoutError:
+            return batch
+        flush_at = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = flush_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _batch_records(self) -> List[Dict[str, Any]]:
+        if self.ordering == "strict":
+            return list(self._unapplied)
+        latest: Dict[tuple, Dict[str, Any]] = {}
+        for record in self._unapplied:
+            key = tuple(record[column] for column in SUBMISSION_KEY)
+            latest.pop(key, None)  # keep arrival order of the latest submission
+            latest[key] = record
+        return list(latest.values())
+
+    async def _apply(self) -> bool:
+        """Upsert unapplied records in one transaction; True on success."""
+        records = self._batch_records()
+        start = time.perf_counter()
+        try:
+            # One thread for the whole batch rather than a hop per statement
+            await asyncio.to_thread(self._commit, records)
+        except Exception as e:
+            INGEST_FAILURES.inc()
+            print(f"⚠️  Group commit of {len(records)} submissions failed, retrying: {e}")
+            return False
+        INGEST_COMMIT_SECONDS.observe(time.perf_counter() - start)
+        INGEST_BATCH.observe(len(self._unapplied))
+        self._unapplied = []
+        INGEST_PENDING.set(self.pending())
+        await asyncio.to_thread(self._truncate_log)
+        return True
+
+    def _commit(self, records: List[Dict[str, Any]]):
+        params = [
+            submission_params({**record, "timestamp": datetime.utcfromtimestamp(record["received_at"])})
+            for record in records
+        ]
+        with engine.begin() as conn:
+            # executemany runs the upserts in the order given
+            conn.execute(upsert_submission(engine.dialect.name, returning=False), params)
+            if settings.evaluation_enqueue:
+                # One per commit: a multi-row upsert must not touch a row twice
+                jobs = {tuple(record[column] for column in EVALUATION_JOB_KEY): record for record in records}
+                conn.execute(enqueue_evaluation(engine.dialect.name), [evaluation_job_params(record) for record in jobs.values()])
+
+    def _append_log(self, records: List[Dict[str, Any]]):
+        with open(self.log_path, "a") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            if settings.ingest_fsync:
+                os.fsync(f.fileno())
+
+    def _truncate_log(self):
+        with open(self.log_path, "w"):
+            pass
+
+    def _read_log(self) -> List[Dict[str, Any]]:
+        if not self.log_path.exists():
+            return []
+        records = []
+        with open(self.log_path, "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A torn last line was never acknowledged
+                    continue
+        return records
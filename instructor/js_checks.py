@@ -0,0 +1,105 @@
+"""
+All ``js:`` checks of a page in one round trip.
+
+Instead of a ``page.evaluate`` per check, the expressions of a page's ``js:``
+checks are compiled into one script. It runs each of them in isolation, as
+its own function with its own exception capture, waits at most
+JS_CHECK_TIMEOUT_MS for checks that return promises, and returns one outcome
+per check: ``{"value": ...}`` or ``{"error": "..."}``.
+
+An expression that is not valid on its own (say, statements rather than an
+expression) makes the whole script fail to compile; the checks are then
+evaluated one at a time, as before. A check stuck in a synchronous loop can
+not be interrupted by the timeout, as with a single ``page.evaluate``.
+"""
+from typing import Any, Dict, List
+
+from shared.config import settings
+
+
+BATCH_RUNNER = """
+const run = async (check, timeoutMs) => {
+  let timer;
+  try {
+    const timeout = new Promise((_, reject) => {
+      timer = setTimeout(() => reject(new Error(`Timed out after ${timeoutMs} ms`)), timeoutMs);
+    });
+    let value = check();
+    // As page.evaluate: a function is called, a promise awaited
+    if (typeof value === "function") value = value();
+    return {value: await Promise.race([Promise.resolve(value), timeout])};
+  } catch (e) {
+    return {error: e instanceof Error ? `${e.name}: ${e.message}` : String(e)};
+  } finally {
+    clearTimeout(timer);
+  }
+};
+"""
+
+
+def js_expression(check: str) -> str:
+    """The JavaScript of a js: check."""
+    return check[3:].strip()
+
+
+def batch_script(expressions: List[str], timeout_ms: int) -> str:
+    """
+    One script evaluating every expression in isolation.
+
+    Returns:
+        A function for page.evaluate, resolving to one outcome per expression
+    """
+    # Newlines keep a trailing // comment from swallowing the closing paren
+    checks = ",\n".join(
+        f"run(() => (\n{expression.rstrip().rstrip(';')}\n), {timeout_ms})" for expression in expressions
+    )
+    return f"async () => {{\n{BATCH_RUNNER}\nreturn Promise.all([\n{checks}\n]);\n}}"
+
+
+def _single_outcome(evaluate, expression: str) -> Dict[str, Any]:
+    try:
+        return {"value": evaluate(expression)}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def run_js_checks(page, checks: List[str]) -> Dict[int, Dict[str, Any]]:
+    """
+    Evaluate the js: checks of a loaded page.
+
+    Args:
+        page: Playwright page
+        checks: All checks of the task
+
+    Returns:
+        Outcome per index of a js: check in checks
+    """
+    indexes = [i for i, check in enumerate(checks) if check.startswith("js:")]
+    if not indexes:
+        return {}
+    expressions = [js_expression(checks[i]) for i in indexes]
+    try:
+        outcomes = page.evaluate(batch_script(expressions, settings.js_check_timeout_ms))
+    except Exception as e:
+        print(f"⚠️  Batched js: checks failed, running them one at a time: {e}")
+        outcomes = [_single_outcome(page.evaluate, expression) for expression in expressions]
+    return dict(zip(indexes, outcomes))
+
+
+async def async_run_js_checks(page, checks: List[str]) -> Dict[int, Dict[str, Any]]:
+    """Async counterpart of run_js_checks."""
+    indexes = [i for i, check in enumerate(checks) if check.startswith("js:")]
+    if not indexes:
+        return {}
+    expressions = [js_expression(checks[i]) for i in indexes]
+    try:
+        outcomes = await page.evaluate(batch_script(expressions, settings.js_check_timeout_ms))
+    except Exception as e:
+        print(f"⚠️  Batched js: checks failed, running them one at a time: {e}")
+        outcomes = []
+        for expression in expressions:
+            try:
+                outcomes.append({"value": await page.evaluate(expression)})
+            except Exception as e:
+                outcomes.append({"error": str(e)})
+    return dict(zip(indexes, outcomes))
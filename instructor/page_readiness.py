@@ -0,0 +1,122 @@
+"""
+Page readiness for dynamic checks, instead of a fixed wait.
+
+A page is ready when it has loaded, no fetch or XHR requests are pending, the
+DOM has not changed for PAGE_QUIET_MS, and every element the checks refer to
+(``#id`` in the check text, selectors passed to querySelector or
+getElementById in ``js:`` checks) exists. An element that is still missing
+once the page has been quiet for PAGE_SETTLE_MS is not waited for any longer:
+nothing is left to render it, and its check fails on its own. Waiting never
+takes longer than PAGE_READY_TIMEOUT_MS.
+
+The pending requests and the last mutation are tracked by READINESS_SCRIPT,
+installed with ``page.add_init_script`` before navigation.
+"""
+import re
+import time
+from typing import Any, Dict, List
+
+from playwright.async_api import TimeoutError as AsyncPlaywrightTimeoutError
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+from shared.config import settings
+
+
+READINESS_SCRIPT = """
+(() => {
+  const state = window.__readiness = {pending: 0, lastChange: performance.now()};
+  const changed = () => { state.lastChange = performance.now(); };
+  const track = (promise) => {
+    state.pending++;
+    changed();
+    const done = () => { state.pending--; changed(); };
+    promise.then(done, done);
+    return promise;
+  };
+  if (window.fetch) {
+    const fetch = window.fetch;
+    window.fetch = function (...args) { return track(fetch.apply(this, args)); };
+  }
+  const send = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function (...args) {
+    track(new Promise((resolve) => this.addEventListener("loadend", resolve, {once: true})));
+    return send.apply(this, args);
+  };
+  new MutationObserver(changed).observe(document, {
+    subtree: true, childList: true, attributes: true, characterData: true
+  });
+})();
+"""
+
+READY_CONDITION = """
+({selectors, quietMs, settleMs}) => {
+  const state = window.__readiness;
+  if (document.readyState !== "complete") return false;
+  if (!state) return true;
+  const quiet = performance.now() - state.lastChange;
+  if (state.pending > 0 || quiet < quietMs) return false;
+  const present = (selector) => {
+    try { return document.querySelector(selector) !== null; } catch (e) { return true; }
+  };
+  return quiet >= settleMs || selectors.every(present);
+}
+"""
+
+_ID_REFERENCE = re.compile(r"(?<![\w&])#([A-Za-z][\w-]*)")
+_SELECTOR_CALL = re.compile(r"(querySelector(?:All)?|getElementById)\(\s*(['\"`])(.+?)\2\s*\)")
+
+
+def check_selectors(checks: List[str]) -> List[str]:
+    """CSS selectors of the elements the checks refer to, in order of first mention."""
+    selectors = []
+    for check in checks:
+        if check.startswith("js:"):
+            for function, _, argument in _SELECTOR_CALL.findall(check):
+                selectors.append(f"#{argument}" if function == "getElementById" else argument)
+        else:
+            selectors.extend(f"#{element_id}" for element_id in _ID_REFERENCE.findall(check))
+    return list(dict.fromkeys(selectors))
+
+
+def _condition_args(checks: List[str]) -> Dict[str, Any]:
+    return {
+        "selectors": check_selectors(checks),
+        "quietMs": settings.page_quiet_ms,
+        "settleMs": settings.page_settle_ms,
+    }
+
+
+def wait_until_ready(page, checks: List[str]) -> bool:
+    """
+    Wait until a loaded page is ready for its checks.
+
+    Returns:
+        Whether it became ready before PAGE_READY_TIMEOUT_MS
+    """
+    try:
+        page.wait_for_function(
+            READY_CONDITION, arg=_condition_args(checks), polling=100, timeout=settings.page_ready_timeout_ms
+        )
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+async def async_wait_until_ready(page, checks: List[str]) -> bool:
+    """Async counterpart of wait_until_ready."""
+    try:
+        await page.wait_for_function(
+            READY_CONDITION, arg=_condition_args(checks), polling=100, timeout=settings.page_ready_timeout_ms
+        )
+        return True
+    except AsyncPlaywrightTimeoutError:
+        return False
+
+
+def log_readiness(url: str, started: float, ready: bool):
+    """Log how long a page took from navigation to ready (started: time.perf_counter())."""
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if ready:
+        print(f"  Page ready in {elapsed_ms:.0f} ms: {url}")
+    else:
+        print(f"⚠️  Page not ready after {elapsed_ms:.0f} ms, checking anyway: {url}")
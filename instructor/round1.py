@@ -7,6 +7,7 @@ import uuid
 import hashlib
 from datetime import datetime
 from sqlalchemy.orm import Session
+from shared.tracing import span, current_traceparent, set_service_name
 from shared.database import SessionLocal, Task, init_db
 from instructor.task_templates import (
     TASK_TEMPLATES,
@@ -26,6 +27,8 @@ def send_round1_tasks(submissions_csv: str, evaluation_url: str):
         submissions_csv: Path to CSV with columns: timestamp,email,endpoint,secret
         evaluation_url: URL where students should submit their repos
     """
+    set_service_name("tds-instructor")
+    
     # Initialize database
     init_db()
     db: Session = SessionLocal()
@@ -91,22 +94,27 @@ def send_round1_tasks(submissions_csv: str, evaluation_url: str):
                 "attachments": attachments
             }
             
-            # Send request
-            try:
-                print(f"Sending Round 1 task to {email} at {endpoint}")
-                response = requests.post(
-                    endpoint,
-                    json=task_request,
-                    headers={"Content-Type": "application/json"},
-                    timeout=30
-                )
+            # Send request; the trace follows the task through the student API
+            with span("dispatch_task", kind="client", email=email, task=task_id, round=1, nonce=nonce) as dispatch:
+                try:
+                    print(f"Sending Round 1 task to {email} at {endpoint}")
+                    response = requests.post(
+                        endpoint,
+                        json=task_request,
+                        headers={"Content-Type": "application/json", "traceparent": current_traceparent()},
+                        timeout=30
+                    )
                 
-                status_code = response.status_code
-                print(f"  Status: {status_code}")
+                    status_code = response.status_code
+                    print(f"  Status: {status_code}")
+                    dispatch.set_attributes(**{"http.status_code": status_code})
                 
-            except Exception as e:
-                print(f"  Error: {e}")
-                status_code = 0
+                except Exception as e:
+                    print(f"  Error: {e}")
+                    status_code = 0
+                    dispatch.error = str(e)
+            
+                print(f"  Trace: {dispatch.trace_id}")
             
             # Log to database
             task = Task(
@@ -7,6 +7,7 @@ import hashlib
 import json
 import random
 from sqlalchemy.orm import Session
+from shared.tracing import span, current_traceparent, set_service_name
 from shared.database import SessionLocal, Task, Repo, init_db
 from instructor.task_templates import (
     TASK_TEMPLATES,
@@ -20,6 +21,8 @@ def send_round2_tasks():
     """
     Send round 2 tasks to all students who completed round 1.
     """
+    set_service_name("tds-instructor")
+    
     # Initialize database
     init_db()
     db: Session = SessionLocal()
@@ -103,22 +106,27 @@ def send_round2_tasks():
                 "attachments": attachments
             }
             
-            # Send request
-            try:
-                print(f"Sending Round 2 task to {email} at {round1_task.endpoint}")
-                response = requests.post(
-                    round1_task.endpoint,
-                    json=task_request,
-                    headers={"Content-Type": "application/json"},
-                    timeout=30
-                )
+            # Send request; the trace follows the task through the student API
+            with span("dispatch_task", kind="client", email=email, task=base_task, round=2, nonce=nonce) as dispatch:
+                try:
+                    print(f"Sending Round 2 task to {email} at {round1_task.endpoint}")
+                    response = requests.post(
+                        round1_task.endpoint,
+                        json=task_request,
+                        headers={"Content-Type": "application/json", "traceparent": current_traceparent()},
+                        timeout=30
+                    )
                 
-                status_code = response.status_code
-                print(f"  Status: {status_code}")
+                    status_code = response.status_code
+                    print(f"  Status: {status_code}")
+                    dispatch.set_attributes(**{"http.status_code": status_code})
                 
-            except Exception as e:
-                print(f"  Error: {e}")
-                status_code = 0
+                except Exception as e:
+                    print(f"  Error: {e}")
+                    status_code = 0
+                    dispatch.error = str(e)
+            
+                print(f"  Trace: {dispatch.trace_id}")
             
             # Log to database
             task = Task(
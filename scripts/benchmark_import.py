@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Import-time regression benchmark for the student API.
+
+Imports the module in fresh interpreters, reports the median import time and
+the slowest modules, and fails if the import is slower than the budget or
+pulls in a module that should only load on first use.
+
+Usage:
+    python scripts/benchmark_import.py [--module student.api] [--runs 5] [--max-seconds 2.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Heavy modules that student.api must not import at startup
+DEFERRED_MODULES = ["github", "git", "requests", "httpx"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(module: str) -> dict:
+    """Import the module in a fresh interpreter and return its timing."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module)],
+        capture_output=True, text=True, env=env, check=True
+    )
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    data["importtime"] = result.stderr
+    return data
+
+
+def slowest_modules(importtime: str, top: int = 10) -> list:
+    """Parse -X importtime output into the modules with the largest cumulative time."""
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # import time: <self us> | <cumulative us> | <module>
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="student.api")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=2.0, help="fail above this median")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    median = statistics.median(run["seconds"] for run in runs)
+
+    print(f"📊 import {args.module}: median {median:.3f}s over {args.runs} runs "
+          f"(min {min(r['seconds'] for r in runs):.3f}s, max {max(r['seconds'] for r in runs):.3f}s)")
+    print("\nSlowest modules (cumulative):")
+    for cumulative_us, name in slowest_modules(runs[-1]["importtime"]):
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    loaded = set(runs[-1]["modules"])
+    eager = [name for name in DEFERRED_MODULES if name in loaded]
+    if eager:
+        failures.append(f"imported at startup but should be deferred: {', '.join(eager)}")
+    if median > args.max_seconds:
+        failures.append(f"median {median:.3f}s exceeds the {args.max_seconds:.3f}s budget")
+
+    if failures:
+        for failure in failures:
+            print(f"\n❌ {failure}")
+        sys.exit(1)
+    print("\n✅ Import time within budget")
+
+
+if __name__ == "__main__":
+    main()
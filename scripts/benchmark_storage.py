@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Storage profile benchmark: submission and result-insert throughput.
+
+Runs concurrent writer processes against the database with each storage
+profile, as the evaluation API, evaluate_all_repos and the round scripts do,
+and reports throughput, latency and failed writes (e.g. "database is locked").
+
+Without --url, each profile gets a fresh temporary SQLite file. With --url,
+only rows for the benchmark email are written and removed.
+
+Usage:
+    python scripts/benchmark_storage.py [--url URL] [--profiles default,sqlite]
+                                        [--writers 4] [--ops 200] [--checks 5]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from sqlalchemy import delete, insert
+from sqlalchemy.engine import make_url
+
+from shared.database import Base, Repo, Result, Task, create_db_engine, submission_params, upsert_submission
+from shared.migrations import migrate
+
+
+BENCH_EMAIL = "storage-benchmark@example.com"
+
+
+def nonce(writer: int, op: int) -> str:
+    return f"bench-{writer}-{op}"
+
+
+def setup(url: str, profile: str, writers: int, ops: int):
+    """Create the schema and the tasks that submissions refer to."""
+    engine = create_db_engine(url, profile)
+    with engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+        migrate(conn)
+        cleanup(conn)
+        conn.execute(insert(Task), [
+            {
+                "email": BENCH_EMAIL, "task": f"bench-{writer}", "round": 1, "nonce": nonce(writer, op),
+                "brief": "benchmark", "evaluation_url": "http://localhost", "endpoint": "http://localhost",
+                "secret": "benchmark",
+            }
+            for writer in range(writers) for op in range(ops)
+        ])
+    engine.dispose()
+
+
+def cleanup(conn):
+    for table in (Result, Repo, Task):
+        conn.execute(delete(table).where(table.email == BENCH_EMAIL))
+
+
+def run_writer(url: str, profile: str, workload: str, writer: int, ops: int, checks: int) -> Dict:
+    """Perform ops writes in one process; returns per-write latencies and errors."""
+    engine = create_db_engine(url, profile)
+    latencies: List[float] = []
+    errors: List[str] = []
+    for op in range(ops):
+        start = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                if workload == "submissions":
+                    # The second half resubmits, exercising the update path
+                    key = op % max(ops // 2, 1)
+                    conn.execute(upsert_submission(engine.dialect.name), submission_params({
+                        "email": BENCH_EMAIL, "task": f"bench-{writer}", "round": 1, "nonce": nonce(writer, key),
+                        "repo_url": f"https://github.com/bench/{writer}-{op}", "commit_sha": f"{op:040x}",
+                        "pages_url": f"https://bench.github.io/{writer}-{op}/",
+                    }))
+                else:
+                    # One repo's checks, committed together like evaluate_all_repos
+                    conn.execute(insert(Result), [
+                        {
+                            "email": BENCH_EMAIL, "task": f"bench-{writer}", "round": 1,
+                            "repo_url": "https://github.com/bench/repo", "commit_sha": f"{op:040x}",
+                            "pages_url": "https://bench.github.io/repo/", "check": f"check {check}",
+                            "score": 1.0, "reason": "benchmark", "logs": "",
+                        }
+                        for check in range(checks)
+                    ])
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(str(e).splitlines()[0])
+    engine.dispose()
+    return {"latencies": latencies, "errors": errors}
+
+
+def benchmark(url: str, profile: str, workload: str, writers: int, ops: int, checks: int) -> Dict:
+    setup(url, profile, writers, ops)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=writers) as pool:
+        runs = list(pool.map(
+            run_writer, [url] * writers, [profile] * writers, [workload] * writers,
+            range(writers), [ops] * writers, [checks] * writers
+        ))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for run in runs for latency in run["latencies"])
+    errors = [error for run in runs for error in run["errors"]]
+    return {
+        "profile": profile,
+        "workload": workload,
+        "writes": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else "",
+        "per_second": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="database to benchmark (default: temporary SQLite files)")
+    parser.add_argument("--profiles", help="comma-separated storage profiles (default: default and the URL's own)")
+    parser.add_argument("--writers", type=int, default=4, help="concurrent writer processes")
+    parser.add_argument("--ops", type=int, default=200, help="writes per writer")
+    parser.add_argument("--checks", type=int, default=5, help="results per result-insert write")
+    args = parser.parse_args()
+
+    backend = make_url(args.url).get_backend_name() if args.url else "sqlite"
+    tuned = "postgresql" if backend.startswith("postgres") else backend
+    profiles = args.profiles.split(",") if args.profiles else ["default", tuned]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in profiles:
+            url = args.url or f"sqlite:///{os.path.join(directory, f'bench-{profile}.db')}"
+            for workload in ("submissions", "results"):
+                print(f"⏳ {profile}: {workload} with {args.writers} writers x {args.ops} writes...")
+                rows.append(benchmark(url, profile, workload, args.writers, args.ops, args.checks))
+            if args.url:
+                engine = create_db_engine(url, profile)
+                with engine.begin() as conn:
+                    cleanup(conn)
+                engine.dispose()
+
+    print(f"\n📊 {'profile':<12} {'workload':<12} {'writes/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    for row in rows:
+        print(f"   {row['profile']:<12} {row['workload']:<12} {row['per_second']:>10.1f} "
+              f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['errors']:>7}")
+    for row in rows:
+        if row["errors"]:
+            print(f"\n⚠️  {row['profile']} {row['workload']}: {row['first_error']}")
+
+
+if __name__ == "__main__":
+    main()
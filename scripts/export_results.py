@@ -4,6 +4,7 @@ Export results from database to CSV.
 """
 import csv
 from shared.database import SessionLocal, Result, Repo, Task
+from shared.llm_usage import get_ledger
 from datetime import datetime
 
 def export_results(output_file: str = "results_export.csv"):
@@ -77,6 +78,17 @@ def export_summary(output_file: str = "summary.csv"):
     finally:
         db.close()
 
+def export_usage(output_file: str = "llm_usage.csv"):
+    """Export every recorded LLM call with tokens, latency and cost."""
+    ledger = get_ledger()
+    count = ledger.export_csv(output_file)
+    print(f"✅ Exported {count} LLM calls to {output_file}")
+    
+    for row in ledger.summary("model"):
+        cost = f"${row['cost_usd']:.4f}" if row["cost_usd"] is not None else "unknown price"
+        print(f"   {row['group']}: {row['calls']} calls, "
+              f"{row['prompt_tokens']} prompt / {row['completion_tokens']} completion tokens, {cost}")
+
 if __name__ == "__main__":
     import sys
     
@@ -87,3 +99,6 @@ if __name__ == "__main__":
     
     if export_type in ["summary", "both"]:
         export_summary()
+    
+    if export_type == "usage":
+        export_usage()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Pre-warm the CDN asset cache used by evaluation (instructor/cdn_cache.py).
+
+Downloads the CDN assets that the deployed pages of all submitted repos
+reference, plus any URLs given: CDN URLs are cached directly, other URLs are
+pages whose CDN assets are cached. Stylesheets pull in the fonts and images
+they refer to. Run it before evaluating with CDN_CACHE_OFFLINE=true.
+
+Usage:
+    python scripts/warm_cdn_cache.py [URL ...] [--no-repos] [--refresh]
+"""
+import argparse
+from typing import List
+
+import requests
+
+from instructor.cdn_cache import CdnCache
+from shared.config import settings
+from shared.database import Repo, SessionLocal
+
+
+def pages_of_repos() -> List[str]:
+    """Deployed page URLs of all submitted repos."""
+    db = SessionLocal()
+    try:
+        return sorted({pages_url for (pages_url,) in db.query(Repo.pages_url).all() if pages_url})
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download CDN assets into the evaluation cache")
+    parser.add_argument("urls", nargs="*", help="CDN asset URLs, or pages whose CDN assets to cache")
+    parser.add_argument("--no-repos", action="store_true", help="skip the pages of submitted repos")
+    parser.add_argument("--refresh", action="store_true", help="download assets again even if cached")
+    args = parser.parse_args()
+
+    cache = CdnCache()
+    assets = [url for url in args.urls if cache.is_cdn(url)]
+    pages = [url for url in args.urls if not cache.is_cdn(url)]
+    if not args.no_repos:
+        pages += pages_of_repos()
+
+    for page_url in pages:
+        try:
+            response = requests.get(page_url, timeout=settings.timeout / 1000)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️  Skipping {page_url}: {e}")
+            continue
+        assets += cache.asset_urls(response.text, response.url)
+
+    cached = cache.warm(assets, refresh=args.refresh)
+    print(f"✅ {cached} CDN assets cached in {cache.directory} (from {len(pages)} pages)")
+
+
+if __name__ == "__main__":
+    main()
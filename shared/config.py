@@ -3,7 +3,7 @@ Shared configuration settings for the TDS Project.
 """
 import os
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -21,13 +21,102 @@ class Settings(BaseSettings):
     openai_api_key: Optional[str] = None
     anthropic_api_key: Optional[str] = None
     llm_provider: str = "openai"  # openai or anthropic
+    llm_usage_path: str = "llm_usage.db"  # token usage and cost ledger
+    llm_pricing: Dict[str, List[float]] = {}  # model prefix -> [input, cached input, output] USD per 1M tokens
     
     # API Configuration
     api_host: str = "0.0.0.0"
     api_port: int = 8000
     
+    # Task Tracker Configuration
+    task_tracker_path: str = "processed_tasks.db"
+    task_ttl_seconds: int = 0  # 0 keeps processed keys forever
+    task_keep_rounds: int = 0  # keep keys from the latest N rounds, 0 keeps all
+    task_index_capacity: int = 100000
+    task_index_error_rate: float = 0.01
+
+    # Deadline Configuration
+    task_deadline_seconds: int = 600
+    stage_budget_seconds: Dict[str, float] = {
+        "generate": 240,
+        "optimize": 15,
+        "git_push": 120,
+        "pages_propagation": 120,
+        "evaluation_submit": 60,
+    }
+    llm_fallback_model: str = ""  # smaller model used when time is short
+    llm_full_min_seconds: int = 90  # below this, skip the primary model
+    llm_fast_min_seconds: int = 20  # below this, use the template page
+
+    # Page Optimizer Configuration
+    page_optimizer_enabled: bool = True  # minify and trim generated pages before deploy
+
+    # Submission Outbox Configuration
+    outbox_path: str = "outbox.db"
+    outbox_concurrency: int = 4
+    outbox_max_attempts: int = 50
+    outbox_max_backoff: float = 300  # seconds
+
+    # Tenant Configuration
+    tenants_path: str = "tenants.json"  # serve only the STUDENT_* identity when missing
+    tenant_rate_limit_per_minute: float = 0  # default per-tenant limit, 0 = unlimited
+    tenant_max_concurrency: int = 0  # default running tasks per tenant, 0 = unlimited
+
+    # Job Queue Configuration
+    job_backend: str = "memory"  # memory, sqlite or module:Class
+    job_db_path: str = "jobs.db"
+    job_worker_enabled: bool = True  # False on enqueue-only nodes
+    job_worker_id: str = ""  # defaults to hostname-pid
+    job_worker_concurrency: int = 2
+    job_lease_seconds: int = 60
+    job_max_attempts: int = 3
+    job_poll_interval: float = 1.0
+
+    # Event Loop Monitor Configuration
+    loop_monitor_enabled: bool = True
+    loop_monitor_interval: float = 0.1  # seconds between lag measurements
+    loop_block_threshold: float = 0.5  # log a stack sample beyond this lag
+
+    # Profiling Configuration
+    profile_all: bool = False  # profile every pipeline run, not just on request
+    profile_dir: str = "profiles"
+    profile_interval: float = 0.01  # seconds between samples
+    profile_keep: int = 50  # most recent profiles kept on disk
+    admin_token: str = ""  # enables the /admin endpoints when set
+
+    # Tracing Configuration
+    trace_exporter: str = "none"  # none, file or otlp
+    trace_file: str = "traces.jsonl"
+    otlp_endpoint: str = "http://localhost:4318/v1/traces"
+
     # Database Configuration
     database_url: str = "sqlite:///./tds_project.db"
+    database_echo: bool = False  # log every SQL statement
+    database_profile: str = "auto"  # auto, sqlite, postgresql, default or module:Class
+    database_pool_size: int = 5  # pooled connections per process (postgresql profile)
+    database_max_overflow: int = 10
+    database_pool_timeout: float = 30  # seconds to wait for a pooled connection
+    database_pool_recycle: int = 1800  # seconds before a connection is replaced
+    sqlite_busy_timeout_ms: int = 5000  # wait this long for a write lock
+    sqlite_mmap_size: int = 268435456  # bytes of the file read through mmap
+    
+    # Submission Ingestion Configuration
+    ingest_mode: str = "direct"  # direct (commit per submission) or buffered (group commit)
+    ingest_log_path: str = "ingest.log"  # acknowledged submissions awaiting commit
+    ingest_batch_size: int = 200  # most submissions per group commit
+    ingest_flush_ms: float = 5  # longest wait for more submissions
+    ingest_ordering: str = "key"  # key (latest per task wins) or strict (every submission in order)
+    ingest_fsync: bool = True  # fsync the log before acknowledging
+    
+    # Evaluation Worker Configuration
+    evaluation_enqueue: bool = True  # queue an evaluation job for each accepted submission
+    evaluation_concurrency: int = 4  # evaluations run at once by a worker
+    evaluation_poll_interval: float = 1.0  # seconds between queue polls
+    evaluation_delay_seconds: float = 0  # wait after a submission before evaluating it
+    evaluation_retry_delay_seconds: float = 30  # retry when the page did not load yet
+    evaluation_max_attempts: int = 3
+    evaluation_lease_seconds: float = 60  # a running job is claimable again when its lease lapses
+    evaluation_heartbeat_seconds: float = 15  # how often workers renew their leases
     
     # Evaluation API Configuration
     evaluation_api_url: str = ""
@@ -37,6 +126,18 @@ class Settings(BaseSettings):
     # Playwright Configuration
     headless: bool = True
     timeout: int = 15000
+    browser_max_uses: int = 50  # evaluations per browser process before it is replaced
+    browser_max_memory_mb: int = 1024  # replace a browser above this RSS (0 disables)
+    page_ready_timeout_ms: int = 10000  # longest wait for a page to become ready for its checks
+    page_quiet_ms: int = 300  # no DOM changes or pending requests for this long
+    page_settle_ms: int = 2000  # stop waiting for missing elements once quiet this long
+    js_check_timeout_ms: int = 5000  # per js: check that returns a promise
+    cdn_cache_enabled: bool = True  # serve CDN assets to evaluated pages from a local cache
+    cdn_cache_dir: str = "cdn_cache"
+    cdn_cache_hosts: str = "cdn.jsdelivr.net,cdnjs.cloudflare.com,unpkg.com,code.jquery.com,stackpath.bootstrapcdn.com,maxcdn.bootstrapcdn.com"
+    cdn_cache_offline: bool = False  # abort CDN requests missing from the cache instead of fetching them
+    evaluation_pages: int = 0  # pages evaluated at once by evaluate.py (0: from CPUs and memory)
+    evaluation_page_memory_mb: int = 200  # memory budgeted per concurrent page
     
     class Config:
         env_file = ".env"
@@ -1,11 +1,19 @@
 """
 Database schema for the TDS Project.
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, create_engine
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Index, bindparam, create_engine, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Optional
 from shared.config import settings
+from shared.migrations import migrate
+from shared.storage import get_storage_profile
 
 Base = declarative_base()
 
@@ -27,6 +35,10 @@ class Task(Base):
     endpoint = Column(String, nullable=False)
     statuscode = Column(Integer)
     secret = Column(String, nullable=False)
+    
+    __table_args__ = (
+        Index("uq_tasks_submission", "email", "task", "round", "nonce", unique=True),
+    )
 
 
 class Repo(Base):
@@ -42,6 +54,11 @@ class Repo(Base):
     repo_url = Column(String, nullable=False)
     commit_sha = Column(String, nullable=False)
     pages_url = Column(String, nullable=False)
+    
+    # One submission per task; resubmissions update it (see upsert_submission)
+    __table_args__ = (
+        Index("uq_repos_submission", "email", "task", "round", "nonce", unique=True),
+    )
 
 
 class Result(Base):
@@ -62,14 +79,233 @@ class Result(Base):
     logs = Column(Text)
 
 
+class EvaluationJob(Base):
+    """Submissions queued for the evaluation worker."""
+    __tablename__ = "evaluation_jobs"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # not claimed before
+    email = Column(String, nullable=False)
+    task = Column(String, nullable=False)
+    round = Column(Integer, nullable=False)
+    nonce = Column(String, nullable=False)
+    commit_sha = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    error = Column(Text)
+    lease_owner = Column(String)  # worker holding a running job
+    lease_expires_at = Column(DateTime)  # claimable again after this unless renewed
+    
+    __table_args__ = (
+        Index("ix_evaluation_jobs_status", "status", "available_at"),
+        Index("ix_evaluation_jobs_lease", "status", "lease_expires_at"),
+        # One job per commit of a submission
+        Index("uq_evaluation_jobs_commit", "email", "task", "round", "nonce", "commit_sha", unique=True),
+    )
+
+
+SUBMISSION_KEY = ("email", "task", "round", "nonce")
+
+
+SUBMISSION_COLUMNS = SUBMISSION_KEY + ("repo_url", "commit_sha", "pages_url", "timestamp")
+
+
+@lru_cache(maxsize=None)
+def upsert_submission(dialect: str, returning: bool = True):
+    """
+    Statement that stores a submission in one round trip.
+
+    Inserts the repo row only if a matching task exists, and updates the
+    existing row on resubmission (INSERT ... SELECT ... ON CONFLICT DO UPDATE).
+    Execute it with ``submission_params(...)``; it returns the repo id, or no
+    row if there is no matching task. The statement is built once per dialect
+    so that its compiled form is reused.
+
+    Args:
+        dialect: Database dialect name (sqlite or postgresql)
+        returning: Return the repo id; without it the statement can be
+            executed with a list of submissions (executemany)
+    """
+    insert = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}.get(dialect)
+    if insert is None:
+        raise ValueError(f"Upsert is not supported for {dialect}")
+    # Core table rather than the ORM class, so sessions do not treat
+    # parameters as an ORM bulk insert
+    repos, tasks = Repo.__table__, Task.__table__
+    task_exists = select(*[bindparam(column, type_=repos.c[column].type) for column in SUBMISSION_COLUMNS]).where(
+        *[tasks.c[column] == bindparam(column, type_=repos.c[column].type) for column in SUBMISSION_KEY]
+    )
+    statement = insert(repos).from_select(list(SUBMISSION_COLUMNS), task_exists)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(SUBMISSION_KEY),
+        set_={column: getattr(statement.excluded, column) for column in SUBMISSION_COLUMNS if column not in SUBMISSION_KEY}
+    )
+    return statement.returning(repos.c.id) if returning else statement
+
+
+def submission_params(submission: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parameters for upsert_submission.
+
+    Args:
+        submission: email, task, round, nonce, repo_url, commit_sha, pages_url
+            and optionally the timestamp (defaults to now)
+    """
+    values = {"timestamp": datetime.utcnow(), **submission}
+    return {column: values[column] for column in SUBMISSION_COLUMNS}
+
+
+EVALUATION_JOB_KEY = SUBMISSION_KEY + ("commit_sha",)
+
+
+@lru_cache(maxsize=None)
+def enqueue_evaluation(dialect: str):
+    """
+    Statement that queues an evaluation job for a commit of a submission.
+
+    A commit already queued or running is left alone; a finished or failed
+    job for it is queued again (the worker skips commits that already have
+    results). Execute it with ``evaluation_job_params(...)``, or a list of
+    them, in the transaction that stores the submission.
+
+    Args:
+        dialect: Database dialect name (sqlite or postgresql)
+    """
+    insert = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}.get(dialect)
+    if insert is None:
+        raise ValueError(f"Upsert is not supported for {dialect}")
+    jobs = EvaluationJob.__table__
+    statement = insert(jobs)
+    return statement.on_conflict_do_update(
+        index_elements=list(EVALUATION_JOB_KEY),
+        set_={
+            "status": "queued",
+            "available_at": statement.excluded.available_at,
+            "attempts": 0,
+            "error": None,
+            "finished_at": None,
+            "lease_owner": None,
+            "lease_expires_at": None,
+        },
+        # Not in_(): expanding parameters cannot be used with executemany
+        where=or_(jobs.c.status == "done", jobs.c.status == "failed")
+    )
+
+
+def evaluation_job_params(submission: Dict[str, Any], delay: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Parameters for enqueue_evaluation.
+
+    Args:
+        submission: email, task, round, nonce and commit_sha
+        delay: Seconds before the job may be claimed (defaults to
+            settings.evaluation_delay_seconds)
+    """
+    delay = settings.evaluation_delay_seconds if delay is None else delay
+    return {
+        **{column: submission[column] for column in EVALUATION_JOB_KEY},
+        "created_at": datetime.utcnow(),
+        "available_at": datetime.utcnow() + timedelta(seconds=delay),
+        "status": "queued",
+        "attempts": 0,
+    }
+
+
+# Async drivers for the synchronous URLs used in DATABASE_URL (the upserts
+# support SQLite and PostgreSQL only)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def create_db_engine(url: Optional[str] = None, profile: Optional[str] = None) -> Engine:
+    """
+    Engine tuned by the storage profile for the URL.
+
+    Args:
+        url: Database URL (defaults to settings.database_url)
+        profile: Storage profile name (defaults to settings.database_profile)
+    """
+    url = url or settings.database_url
+    storage_profile = get_storage_profile(url, profile)
+    db_engine = create_engine(url, **storage_profile.engine_options(url))
+    storage_profile.install(db_engine)
+    return db_engine
+
+
+def create_async_db_engine(url: Optional[str] = None, profile: Optional[str] = None) -> AsyncEngine:
+    """Async counterpart of create_db_engine, using the URL's async driver."""
+    url = async_database_url(url or settings.database_url)
+    if make_url(url).get_backend_name() not in ("sqlite", "postgresql"):
+        raise ValueError(f"Unsupported database for the async engine: {make_url(url).drivername} (use SQLite or PostgreSQL)")
+    storage_profile = get_storage_profile(url, profile)
+    try:
+        db_engine = create_async_engine(url, **storage_profile.engine_options(url))
+    except ModuleNotFoundError as e:
+        raise ValueError(
+            f"The async driver for {make_url(url).drivername} is not installed ({e.name}); "
+            f"install it with: pip install {e.name}"
+        ) from e
+    except InvalidRequestError as e:
+        raise ValueError(
+            f"{make_url(url).drivername} is not an async driver; use sqlite:// or postgresql:// in DATABASE_URL"
+        ) from e
+    storage_profile.install(db_engine.sync_engine)
+    return db_engine
+
+
 # Database setup
-engine = create_engine(settings.database_url, echo=True)
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Created on first use, so scripts that only use the synchronous engine do not
+# need the async drivers
+_async_engine: Optional[AsyncEngine] = None
+_async_sessionmaker: Optional[async_sessionmaker] = None
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with its async driver, e.g. sqlite:// -> sqlite+aiosqlite://."""
+    parsed = make_url(url)
+    if "+" in parsed.drivername or parsed.drivername not in ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=ASYNC_DRIVERS[parsed.drivername]).render_as_string(hide_password=False)
+
+
+def get_async_engine() -> AsyncEngine:
+    """Async engine for DATABASE_URL; its connection pool is shared by the process."""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        _async_engine = create_async_db_engine()
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False)
+    return _async_engine
+
 
 def init_db():
-    """Initialize database tables."""
-    Base.metadata.create_all(bind=engine)
+    """Initialize database tables and migrate existing databases."""
+    with engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+        migrate(conn)
+
+
+async def init_async_db():
+    """Initialize database tables without blocking the event loop."""
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate)
+
+
+async def dispose_async_engine():
+    """Close the pooled async connections."""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _async_sessionmaker = None
 
 
 def get_db():
@@ -79,3 +315,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Get an async database session (FastAPI dependency)."""
+    get_async_engine()
+    async with _async_sessionmaker() as db:
+        yield db
@@ -0,0 +1,295 @@
+"""
+Token usage and cost accounting for LLM calls.
+
+Every call records prompt, completion and cached tokens, latency and the
+computed cost in a SQLite ledger, attributed to the task, round and stage it
+was made for. Attribution comes from ``usage_context`` blocks (context
+variables, so it follows ``asyncio.to_thread``) or explicit arguments.
+"""
+import contextvars
+import csv
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from shared.config import settings
+from shared.metrics import Counter, Histogram
+
+
+# USD per million tokens: (input, cached input, output). Models are matched
+# by longest prefix, so dated snapshots use their family's price.
+# LLM_PRICING in the environment overrides or extends this table.
+PRICING = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "o4-mini": (1.10, 0.275, 4.40),
+    "claude-3-haiku": (0.25, 0.03, 1.25),
+    "claude-3-sonnet": (3.00, 0.30, 15.00),
+    "claude-3-5-sonnet": (3.00, 0.30, 15.00),
+}
+
+GROUP_BY = ("provider", "model", "task", "round", "stage", "service")
+
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens used by LLM calls, by type (prompt, completion, cached).",
+    ["provider", "model", "type"]
+)
+
+LLM_COST = Counter(
+    "llm_cost_usd_total",
+    "Computed cost of LLM calls in USD.",
+    ["provider", "model"]
+)
+
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds",
+    "Latency of LLM calls by provider, model and status.",
+    ["provider", "model", "status"],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+)
+
+_attribution: contextvars.ContextVar = contextvars.ContextVar("llm_usage_attribution", default={})
+
+
+@contextmanager
+def usage_context(**attribution) -> Iterator[None]:
+    """Attribute LLM calls in the block to a task, round and/or stage."""
+    token = _attribution.set({**_attribution.get(), **attribution})
+    try:
+        yield
+    finally:
+        _attribution.reset(token)
+
+
+def price_for(model: str) -> Optional[tuple]:
+    pricing = dict(PRICING)
+    pricing.update({name: tuple(prices) for name, prices in settings.llm_pricing.items()})
+    matches = [name for name in pricing if model.startswith(name)]
+    return pricing[max(matches, key=len)] if matches else None
+
+
+def compute_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    """Cost in USD, or None if the model has no known price."""
+    prices = price_for(model)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+def extract_usage(provider: str, body: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Normalize the usage block of an OpenAI or Anthropic response.
+
+    prompt_tokens includes cached tokens for both providers.
+    """
+    usage = (body or {}).get("usage") or {}
+    if provider == "anthropic":
+        cached = usage.get("cache_read_input_tokens") or 0
+        prompt = (usage.get("input_tokens") or 0) + cached + (usage.get("cache_creation_input_tokens") or 0)
+        completion = usage.get("output_tokens") or 0
+    else:
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "cached_tokens": cached}
+
+
+class UsageLedger:
+    """SQLite ledger of LLM calls."""
+
+    def __init__(self, path: str = "llm_usage.db"):
+        """
+        Initialize the ledger.
+
+        Args:
+            path: Path to the SQLite file
+        """
+        self.path = path
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    service TEXT,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    task TEXT,
+                    round INTEGER,
+                    stage TEXT,
+                    status TEXT NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    cached_tokens INTEGER NOT NULL,
+                    latency_ms REAL NOT NULL,
+                    cost_usd REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_usage_task ON llm_usage (task, round)")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, entry: Dict[str, Any]):
+        columns = ", ".join(entry)
+        placeholders = ", ".join("?" for _ in entry)
+        conn = self._connect()
+        try:
+            conn.execute(f"INSERT INTO llm_usage ({columns}) VALUES ({placeholders})", tuple(entry.values()))
+        finally:
+            conn.close()
+
+    def summary(self, group_by: str = "model", task: Optional[str] = None, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Aggregate calls, tokens, latency and cost.
+
+        Args:
+            group_by: One of GROUP_BY
+            task: Only calls for this task
+            since: Only calls after this epoch time
+        """
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {GROUP_BY}")
+        where, params = self._filters(task, since)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"""
+                SELECT {group_by} AS "group", COUNT(*) AS calls,
+                       SUM(status != 'ok') AS errors,
+                       SUM(prompt_tokens) AS prompt_tokens,
+                       SUM(completion_tokens) AS completion_tokens,
+                       SUM(cached_tokens) AS cached_tokens,
+                       AVG(latency_ms) AS avg_latency_ms,
+                       SUM(cost_usd) AS cost_usd
+                FROM llm_usage {where}
+                GROUP BY {group_by}
+                ORDER BY cost_usd DESC
+                """,
+                params
+            ).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def records(self, offset: int = 0, limit: int = 100, task: Optional[str] = None,
+                since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Individual calls, newest first."""
+        where, params = self._filters(task, since)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM llm_usage {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def export_csv(self, output_file: str) -> int:
+        """Write every call to a CSV file; returns the number of rows."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute("SELECT * FROM llm_usage ORDER BY id")
+            with open(output_file, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow([column[0] for column in cursor.description])
+                count = 0
+                for row in cursor:
+                    writer.writerow(tuple(row))
+                    count += 1
+            return count
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _filters(task: Optional[str], since: Optional[float]) -> tuple:
+        clauses, params = [], []
+        if task is not None:
+            clauses.append("task = ?")
+            params.append(task)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        return ("WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+_ledger: Optional[UsageLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> UsageLedger:
+    """Ledger at LLM_USAGE_PATH, opened on first use."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger(settings.llm_usage_path)
+        return _ledger
+
+
+def record_llm_call(
+    provider: str,
+    model: str,
+    body: Optional[Dict[str, Any]],
+    latency: float,
+    status: str = "ok",
+    **attribution
+):
+    """
+    Record one LLM call. Never raises: accounting must not fail a task.
+
+    Args:
+        provider: openai or anthropic
+        model: Model requested
+        body: Parsed response body, or None if the call failed
+        latency: Seconds the call took
+        status: ok, or a short error description (http_429, timeout, ...)
+        attribution: task, round, stage or service, overriding usage_context
+    """
+    try:
+        usage = extract_usage(provider, body)
+        # Bill the model the provider reports, e.g. a dated snapshot
+        billed_model = (body or {}).get("model") or model
+        cost = compute_cost(billed_model, **usage)
+        context = {**_attribution.get(), **attribution}
+
+        LLM_LATENCY.observe(latency, provider=provider, model=model, status="ok" if status == "ok" else "error")
+        for kind in ("prompt", "completion", "cached"):
+            LLM_TOKENS.inc(usage[f"{kind}_tokens"], provider=provider, model=model, type=kind)
+        if cost:
+            LLM_COST.inc(cost, provider=provider, model=model)
+
+        get_ledger().record({
+            "created_at": time.time(),
+            "service": context.get("service"),
+            "provider": provider,
+            "model": billed_model,
+            "task": context.get("task"),
+            "round": context.get("round"),
+            "stage": context.get("stage"),
+            "status": status,
+            "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": usage["completion_tokens"],
+            "cached_tokens": usage["cached_tokens"],
+            "latency_ms": round(latency * 1000, 1),
+            "cost_usd": cost,
+        })
+    except Exception as e:
+        print(f"Warning: Could not record LLM usage: {e}")
@@ -0,0 +1,125 @@
+"""
+Event-loop lag monitor and blocking-call detector for the FastAPI services.
+
+A coroutine sleeps for a fixed interval and records how late it wakes up. A
+watchdog thread checks that the coroutine keeps ticking; when the loop has
+been stuck longer than the threshold it prints the stack of the event-loop
+thread, which points at the synchronous call that is blocking it.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from shared.config import settings
+from shared.metrics import Counter, Gauge, Histogram
+
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between when the monitor was due to wake up and when it ran.",
+    buckets=LAG_BUCKETS
+)
+
+LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total",
+    "Times the event loop was blocked longer than the threshold."
+)
+
+LOOP_MAX_LAG = Gauge(
+    "event_loop_max_lag_seconds",
+    "Largest lag seen since the process started."
+)
+
+
+class LoopMonitor:
+    """Measure event-loop lag and report what is blocking the loop."""
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        threshold: Optional[float] = None,
+        stack_limit: int = 30
+    ):
+        """
+        Initialize the monitor.
+
+        Args:
+            interval: Seconds between lag measurements
+            threshold: Lag in seconds after which the loop counts as blocked
+            stack_limit: Maximum frames printed per stack sample
+        """
+        self.interval = interval or settings.loop_monitor_interval
+        self.threshold = threshold or settings.loop_block_threshold
+        self.stack_limit = stack_limit
+        self.max_lag = 0.0
+        self._last_tick = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start measuring on the running event loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _measure(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            self._last_tick = now
+            LOOP_LAG.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+                LOOP_MAX_LAG.set(lag)
+            if lag >= self.threshold:
+                print(f"⚠️  Event loop was blocked for {lag:.3f}s")
+
+    def _watch(self):
+        """Sample the event-loop thread's stack while the loop is stuck."""
+        reported_tick = None
+        while not self._stopped.wait(min(self.threshold / 2, 1.0)):
+            last_tick = self._last_tick
+            stuck_for = time.monotonic() - last_tick - self.interval
+            if stuck_for < self.threshold or reported_tick == last_tick:
+                continue
+            # Report each blocking episode once
+            reported_tick = last_tick
+            LOOP_BLOCKED.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame, limit=self.stack_limit))
+            print(f"⚠️  Event loop blocked for {stuck_for:.3f}s so far, stack of the loop thread:\n{stack}")
+
+
+def install_loop_monitor(app) -> Optional[LoopMonitor]:
+    """
+    Run a LoopMonitor for the lifetime of a FastAPI app.
+
+    Returns:
+        The monitor, or None if disabled with LOOP_MONITOR_ENABLED=false
+    """
+    if not settings.loop_monitor_enabled:
+        return None
+    monitor = LoopMonitor()
+    app.add_event_handler("startup", monitor.start)
+    app.add_event_handler("shutdown", monitor.stop)
+    return monitor
@@ -0,0 +1,85 @@
+"""
+Schema migrations for databases created by earlier versions.
+
+``Base.metadata.create_all`` creates missing tables with their current schema
+but does not change existing ones. Migrations listed in MIGRATIONS bring
+existing tables up to date; each runs once per database, and the applied
+versions are recorded in the ``schema_migrations`` table. Migrations must be
+idempotent, since a fresh database already has the current schema.
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+
+def _unique_submission_indexes(conn: Connection):
+    """Composite unique indexes on (email, task, round, nonce) for tasks and repos."""
+    # Keep the latest of any duplicate submissions so the index can be built
+    deleted = conn.execute(text(
+        "DELETE FROM repos WHERE id NOT IN "
+        "(SELECT MAX(id) FROM repos GROUP BY email, task, round, nonce)"
+    )).rowcount
+    if deleted:
+        print(f"⚠️  Removed {deleted} duplicate submissions from repos")
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_tasks_submission ON tasks (email, task, round, nonce)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_repos_submission ON repos (email, task, round, nonce)"
+    ))
+
+
+def _evaluation_job_leases(conn: Connection):
+    """Lease columns and a unique (submission, commit) index for evaluation_jobs."""
+    columns = {column["name"] for column in inspect(conn).get_columns("evaluation_jobs")}
+    if "lease_owner" not in columns:
+        conn.execute(text("ALTER TABLE evaluation_jobs ADD COLUMN lease_owner VARCHAR"))
+    if "lease_expires_at" not in columns:
+        conn.execute(text("ALTER TABLE evaluation_jobs ADD COLUMN lease_expires_at TIMESTAMP"))
+    # Keep the latest job of any duplicates so the index can be built
+    conn.execute(text(
+        "DELETE FROM evaluation_jobs WHERE id NOT IN "
+        "(SELECT MAX(id) FROM evaluation_jobs GROUP BY email, task, round, nonce, commit_sha)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_evaluation_jobs_lease ON evaluation_jobs (status, lease_expires_at)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_evaluation_jobs_commit "
+        "ON evaluation_jobs (email, task, round, nonce, commit_sha)"
+    ))
+
+
+# (version, name, migration), in order of version
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "unique_submission_indexes", _unique_submission_indexes),
+    (2, "evaluation_job_leases", _evaluation_job_leases),
+]
+
+
+def migrate(conn: Connection):
+    """
+    Apply the migrations this database has not had yet.
+
+    Runs in the caller's transaction, so a failed migration is rolled back
+    together with its version record.
+
+    Args:
+        conn: Connection inside a transaction (engine.begin())
+    """
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations "
+        "(version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at VARCHAR NOT NULL)"
+    ))
+    applied = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+    for version, name, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        migration(conn)
+        conn.execute(
+            text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+            {"version": version, "name": name, "applied_at": datetime.utcnow().isoformat()}
+        )
+        print(f"✅ Applied migration {version}: {name}")
@@ -0,0 +1,317 @@
+"""
+On-demand sampling profiler for individual pipeline runs.
+
+Wrap a run in ``profile_run(name, enabled)`` (``async_profile_run`` in
+coroutines, so that the sampler is joined and the profile written off the
+event loop). While it is active a sampler
+thread records, at a fixed interval:
+
+- wall: where the run is, including what it is awaiting (the await chain of
+  its asyncio task, or the stack of its thread for synchronous runs)
+- cpu: stacks of every thread that is not parked in a known wait, which
+  approximates where CPU time goes (worker threads from asyncio.to_thread
+  included)
+
+Profiles are stored as JSON in ``settings.profile_dir`` and can be listed or
+downloaded, also as collapsed stacks for flame graph tools, through the admin
+endpoints added by ``install_profiling``. When no run is profiled nothing is
+sampled and ``profile_run`` only checks a flag.
+"""
+import asyncio
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from shared.config import settings
+
+
+# Innermost frames of threads that are waiting rather than running
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+_PROFILE_ID = re.compile(r"^[\w.-]+$")
+
+
+def _describe(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _thread_stack(frame) -> List[str]:
+    """Frames from outermost to innermost."""
+    stack = []
+    while frame is not None:
+        stack.append(_describe(frame))
+        frame = frame.f_back
+    return stack[::-1]
+
+
+def _await_stack(task: asyncio.Task) -> List[str]:
+    """Await chain of a task, from the task's coroutine to what it waits on."""
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            # A future, e.g. the result of asyncio.to_thread or a socket read
+            stack.append(f"<{type(awaitable).__name__}>")
+            break
+        stack.append(_describe(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return stack
+
+
+class Profiler:
+    """Sample the stacks of one run until stopped."""
+
+    def __init__(self, name: str, interval: Optional[float] = None):
+        """
+        Initialize the profiler.
+
+        Args:
+            name: Label for the run, e.g. the task key
+            interval: Seconds between samples
+        """
+        self.name = name
+        self.interval = interval or settings.profile_interval
+        safe_name = re.sub(r"[^\w.-]+", "_", name)[:80]
+        self.id = f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{safe_name}-{uuid.uuid4().hex[:6]}"
+        self.wall: Counter = Counter()
+        self.cpu: Counter = Counter()
+        self.samples = 0
+        self._task: Optional[asyncio.Task] = None
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self._wall_start = 0.0
+        self._cpu_start = 0.0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    def start(self):
+        try:
+            self._task = asyncio.current_task()
+        except RuntimeError:
+            self._task = None  # synchronous run, sample the calling thread
+        self._started_at = time.time()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.id}", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._sampler:
+            self._sampler.join()
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        self.cpu_seconds = time.process_time() - self._cpu_start
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            if self._task is not None:
+                wall = _await_stack(self._task)
+            else:
+                wall = _thread_stack(frames.get(self._thread_id))
+            if wall:
+                self.wall[";".join(wall)] += 1
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                    continue
+                self.cpu[";".join(_thread_stack(frame))] += 1
+            self.samples += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self._started_at,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "interval": self.interval,
+            "samples": self.samples,
+            "stacks": {"wall": dict(self.wall), "cpu": dict(self.cpu)},
+        }
+
+
+class ProfileStore:
+    """Profiles saved as JSON files, keeping the most recent ones."""
+
+    def __init__(self, directory: Optional[str] = None, keep: Optional[int] = None):
+        self.directory = Path(directory or settings.profile_dir)
+        self.keep = keep or settings.profile_keep
+
+    def save(self, profiler: Profiler) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{profiler.id}.json"
+        path.write_text(json.dumps(profiler.to_dict()))
+        for old in self._paths()[self.keep:]:
+            old.unlink(missing_ok=True)
+        return path
+
+    def _paths(self) -> List[Path]:
+        """Profile files, newest first."""
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Summaries of stored profiles, newest first."""
+        summaries = []
+        for path in self._paths():
+            try:
+                profile = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            profile.pop("stacks", None)
+            summaries.append(profile)
+        return summaries
+
+    def load(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = self.directory / f"{profile_id}.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+
+def to_collapsed(profile: Dict[str, Any]) -> str:
+    """Render a profile as collapsed stacks ("frame;frame count" per line)."""
+    lines = []
+    for kind in ("wall", "cpu"):
+        for stack, count in profile["stacks"][kind].items():
+            lines.append(f"{kind};{stack} {count}")
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def profile_run(name: str, enabled: bool = False) -> Iterator[Optional[Profiler]]:
+    """
+    Profile the enclosed run if enabled or PROFILE_ALL is set.
+
+    Yields:
+        The Profiler (its id names the stored profile), or None when off
+    """
+    if not (enabled or settings.profile_all):
+        yield None
+        return
+    profiler = Profiler(name)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        _finish(profiler, name)
+
+
+@asynccontextmanager
+async def async_profile_run(name: str, enabled: bool = False) -> AsyncIterator[Optional[Profiler]]:
+    """Async counterpart of profile_run: stops the sampler and saves off the event loop."""
+    if not (enabled or settings.profile_all):
+        yield None
+        return
+    profiler = Profiler(name)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        await asyncio.to_thread(_finish, profiler, name)
+
+
+def _finish(profiler: Profiler, name: str):
+    """Stop the sampler (joining its thread) and store the profile."""
+    profiler.stop()
+    try:
+        path = ProfileStore().save(profiler)
+        print(f"📊 Profile of {name} saved to {path} ({profiler.samples} samples)")
+    except Exception as e:
+        print(f"Warning: Could not save profile of {name}: {e}")
+
+
+class ProfileRequestsMiddleware:
+    """
+    Profile requests sent with ``X-Profile: <ADMIN_TOKEN>`` (ASGI middleware).
+
+    Without ADMIN_TOKEN, or with any other header value, requests are not
+    profiled, so that callers cannot make the server sample arbitrary routes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _requested(self, scope) -> bool:
+        if scope["type"] != "http" or not settings.admin_token:
+            return False
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return hmac.compare_digest(value, settings.admin_token.encode())
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        async with async_profile_run(f"{scope['method']} {scope['path']}", enabled=True):
+            await self.app(scope, receive, send)
+
+
+def install_profiling(app, profile_requests: bool = False):
+    """
+    Add the admin endpoints for stored profiles to a FastAPI app.
+
+    GET /admin/profiles lists them and GET /admin/profiles/{id} downloads one
+    (``?format=collapsed`` for flame graph tools). Both require the
+    ``X-Admin-Token`` header to match ADMIN_TOKEN and are disabled without it.
+
+    Args:
+        app: FastAPI application
+        profile_requests: Also profile requests whose ``X-Profile`` header matches ADMIN_TOKEN
+    """
+    from fastapi import Header, HTTPException
+    from fastapi.responses import PlainTextResponse
+
+    store = ProfileStore()
+
+    def check_admin(token: Optional[str]):
+        if not settings.admin_token:
+            raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+        if token != settings.admin_token:
+            raise HTTPException(status_code=401, detail="Invalid admin token")
+
+    async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+        """List stored profiles, newest first."""
+        check_admin(x_admin_token)
+        return {"profiles": await asyncio.to_thread(store.list)}
+
+    async def get_profile(profile_id: str, format: str = "json", x_admin_token: Optional[str] = Header(None)):
+        """Download a stored profile as JSON or collapsed stacks."""
+        check_admin(x_admin_token)
+        profile = await asyncio.to_thread(store.load, profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        if format == "collapsed":
+            return PlainTextResponse(to_collapsed(profile))
+        return profile
+
+    app.add_api_route("/admin/profiles", list_profiles, methods=["GET"])
+    app.add_api_route("/admin/profiles/{profile_id}", get_profile, methods=["GET"])
+    if profile_requests:
+        app.add_middleware(ProfileRequestsMiddleware)
@@ -0,0 +1,116 @@
+"""
+Storage profiles: engine tuning for the database behind DATABASE_URL.
+
+A profile supplies the engine options (pooling) and per-connection setup for
+one kind of database. DATABASE_PROFILE selects it; ``auto`` picks the profile
+matching the URL's dialect.
+
+- ``sqlite``: WAL journaling so readers do not block the writer, a busy
+  timeout so concurrent writers wait for the lock instead of failing with
+  "database is locked", synchronous=NORMAL (durable at checkpoints in WAL
+  mode) and memory-mapped reads
+- ``postgresql``: a sized connection pool with pre-ping and recycling
+- ``default``: SQLAlchemy defaults, for comparison and other databases
+"""
+import importlib
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+from shared.config import settings
+
+
+class StorageProfile:
+    """Engine options and connection setup for a database."""
+
+    name = "default"
+
+    def engine_options(self, url: str) -> Dict[str, Any]:
+        """Keyword arguments for create_engine / create_async_engine."""
+        return {"echo": settings.database_echo}
+
+    def on_connect(self, dbapi_connection):
+        """Set up a new DBAPI connection."""
+
+    def install(self, engine: Engine):
+        """
+        Register the connection setup on an engine.
+
+        Args:
+            engine: Engine, or the ``sync_engine`` of an async engine
+        """
+        event.listen(engine, "connect", lambda dbapi_connection, _: self.on_connect(dbapi_connection))
+
+
+class SQLiteProfile(StorageProfile):
+    """SQLite tuned for several concurrent writer processes."""
+
+    name = "sqlite"
+
+    def engine_options(self, url: str) -> Dict[str, Any]:
+        options = super().engine_options(url)
+        # Seconds the driver waits for a lock, in addition to busy_timeout
+        options["connect_args"] = {"timeout": settings.sqlite_busy_timeout_ms / 1000}
+        return options
+
+    def on_connect(self, dbapi_connection):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        finally:
+            cursor.close()
+
+
+class PostgreSQLProfile(StorageProfile):
+    """PostgreSQL with a sized, health-checked connection pool."""
+
+    name = "postgresql"
+
+    def engine_options(self, url: str) -> Dict[str, Any]:
+        options = super().engine_options(url)
+        options.update(
+            pool_size=settings.database_pool_size,
+            max_overflow=settings.database_max_overflow,
+            pool_timeout=settings.database_pool_timeout,
+            pool_recycle=settings.database_pool_recycle,
+            pool_pre_ping=True,
+        )
+        return options
+
+
+STORAGE_PROFILES = {
+    "default": StorageProfile,
+    "sqlite": SQLiteProfile,
+    "postgresql": PostgreSQLProfile,
+}
+
+
+def get_storage_profile(url: Optional[str] = None, name: Optional[str] = None) -> StorageProfile:
+    """
+    Storage profile for a database URL.
+
+    Args:
+        url: Database URL (defaults to settings.database_url)
+        name: Profile name from STORAGE_PROFILES, "auto" to pick by the URL's
+            dialect, or "module:Class" for a custom StorageProfile subclass.
+            Defaults to settings.database_profile.
+    """
+    url = url or settings.database_url
+    name = name or settings.database_profile
+    if name == "auto":
+        dialect = make_url(url).get_backend_name()
+        # postgres:// is an alias of postgresql://
+        dialect = "postgresql" if dialect.startswith("postgres") else dialect
+        name = dialect if dialect in STORAGE_PROFILES else "default"
+    if ":" in name:
+        module_name, class_name = name.split(":", 1)
+        profile_cls = getattr(importlib.import_module(module_name), class_name)
+    elif name in STORAGE_PROFILES:
+        profile_cls = STORAGE_PROFILES[name]
+    else:
+        raise ValueError(f"Unsupported storage profile: {name}")
+    return profile_cls()
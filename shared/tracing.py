@@ -0,0 +1,331 @@
+"""
+Distributed tracing with W3C trace context.
+
+A task crosses the instructor dispatch (round1/round2), the student
+``/api/task``, the job queue, LLM and GitHub stages, and the evaluation
+``/api/evaluate``. Each hop sends a ``traceparent`` header so that all of
+their spans share one trace ID.
+
+Spans are exported according to TRACE_EXPORTER:
+
+- ``none``: not exported (trace context is still propagated)
+- ``file``: one JSON object per line in TRACE_FILE
+- ``otlp``: OTLP/HTTP JSON to OTLP_ENDPOINT, e.g. an OpenTelemetry Collector
+  or Jaeger on port 4318
+"""
+import atexit
+import contextvars
+import json
+import os
+import queue
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from shared.config import settings
+
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+_service_name = "tds"
+
+
+class SpanContext:
+    """Identifiers of a span, as carried in a traceparent header."""
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def to_traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """Parse a W3C traceparent header; None if missing or invalid."""
+    if not value:
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, sampled=bool(int(flags, 16) & 1))
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    def __init__(self, name: str, parent: Optional[SpanContext] = None, kind: str = "internal"):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.sampled = parent.sampled if parent else True
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+
+    @property
+    def context(self) -> SpanContext:
+        return SpanContext(self.trace_id, self.span_id, self.sampled)
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "service": _service_name,
+            "name": self.name,
+            "kind": self.kind,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def set_service_name(name: str):
+    """Name this process in exported spans."""
+    global _service_name
+    _service_name = name
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_traceparent() -> Optional[str]:
+    """traceparent header value for the current span, to send to the next hop."""
+    active = _current_span.get()
+    return active.context.to_traceparent() if active else None
+
+
+def annotate(**attributes):
+    """Add attributes to the current span, if any."""
+    active = _current_span.get()
+    if active is not None:
+        active.set_attributes(**attributes)
+
+
+@contextmanager
+def span(
+    name: str,
+    parent: Optional[SpanContext] = None,
+    kind: str = "internal",
+    **attributes
+) -> Iterator[Span]:
+    """
+    Record a span around the enclosed block.
+
+    The span becomes the current span, so nested spans (including in threads
+    started with asyncio.to_thread) are its children.
+
+    Args:
+        name: Operation name
+        parent: Remote parent from an incoming traceparent; defaults to the
+            current span
+        kind: internal, server, client, producer or consumer
+    """
+    if parent is None:
+        current = _current_span.get()
+        parent = current.context if current else None
+    new_span = Span(name, parent, kind)
+    new_span.set_attributes(**attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.end_ns = time.time_ns()
+        if new_span.sampled:
+            get_exporter().export(new_span)
+
+
+class SpanExporter:
+    """Batch finished spans and write them from a background thread."""
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 2.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def export(self, finished: Span):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            pass  # drop spans rather than slow down the pipeline
+
+    def _drain(self) -> List[Span]:
+        spans = []
+        while len(spans) < self.batch_size:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write out all queued spans."""
+        with self._lock:
+            while True:
+                spans = self._drain()
+                if not spans:
+                    return
+                try:
+                    self.write(spans)
+                except Exception as e:
+                    print(f"Warning: Could not export {len(spans)} spans: {e}")
+
+    def write(self, spans: List[Span]):
+        raise NotImplementedError
+
+
+class NoopExporter(SpanExporter):
+    def export(self, finished: Span):
+        pass
+
+
+class FileExporter(SpanExporter):
+    """Append spans as JSON lines."""
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = Path(path)
+
+    def write(self, spans: List[Span]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            for finished in spans:
+                f.write(json.dumps(finished.to_dict()) + "\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter(SpanExporter):
+    """Send spans to an OTLP/HTTP collector in the JSON encoding."""
+
+    def __init__(self, endpoint: str, **kwargs):
+        super().__init__(**kwargs)
+        self.endpoint = endpoint
+
+    def write(self, spans: List[Span]):
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": _service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "shared.tracing"},
+                    "spans": [self._to_otlp(finished) for finished in spans],
+                }],
+            }]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+    @staticmethod
+    def _to_otlp(finished: Span) -> Dict[str, Any]:
+        otlp = {
+            "traceId": finished.trace_id,
+            "spanId": finished.span_id,
+            "name": finished.name,
+            "kind": SPAN_KINDS.get(finished.kind, 1),
+            "startTimeUnixNano": str(finished.start_ns),
+            "endTimeUnixNano": str(finished.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in finished.attributes.items() if value is not None
+            ],
+            "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+        }
+        if finished.parent_id:
+            otlp["parentSpanId"] = finished.parent_id
+        return otlp
+
+
+_exporter: Optional[SpanExporter] = None
+
+
+def get_exporter() -> SpanExporter:
+    """Exporter selected by TRACE_EXPORTER, created on first use."""
+    global _exporter
+    if _exporter is None:
+        if settings.trace_exporter == "file":
+            _exporter = FileExporter(settings.trace_file)
+        elif settings.trace_exporter == "otlp":
+            _exporter = OTLPExporter(settings.otlp_endpoint)
+        else:
+            _exporter = NoopExporter()
+    return _exporter
+
+
+class TraceMiddleware:
+    """Record a server span for every HTTP request, continuing its traceparent (ASGI middleware)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        name = f"{scope['method']} {scope['path']}"
+        with span(name, parent=parent, kind="server", **{"http.method": scope["method"], "http.target": scope["path"]}) as server_span:
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    server_span.set_attributes(**{"http.status_code": message["status"]})
+                await send(message)
+            await self.app(scope, receive, send_with_status)
+
+
+def install_tracing(app, service_name: str):
+    """Trace every request to a FastAPI app under the given service name."""
+    set_service_name(service_name)
+    app.add_middleware(TraceMiddleware)
@@ -3,16 +3,38 @@ Student API endpoint for receiving task requests and deploying apps.
 """
 import os
 import asyncio
-import httpx
+import json
+import threading
 import time
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from shared.models import TaskRequest, RepoSubmission
 from shared.config import settings
-from student.llm_generator import LLMGenerator
-from student.github_manager import GitHubManager
+from shared.metrics import REGISTRY, CONTENT_TYPE_LATEST
 from student.task_tracker import TaskTracker
+from student.job_queue import Job, JobWorker, create_job_backend
+from student.progress import ProgressTracker, TERMINAL_STAGES, task_key as make_task_key
+from student.deadline import Deadline, FULL, FAST, TEMPLATE
+from student.outbox import Outbox, OutboxSender
+from shared.loop_monitor import install_loop_monitor
+from shared.profiling import async_profile_run, install_profiling
+from shared.tracing import install_tracing, span, current_traceparent, parse_traceparent
+from shared.llm_usage import get_ledger, usage_context, GROUP_BY
+from student.metrics import (
+    STAGE_SECONDS, TASK_SECONDS, RETRIES, TIMEOUTS, DEGRADED, TASKS_IN_FLIGHT, QUEUE_DEPTH,
+    OUTBOX_PENDING, TENANT_REQUESTS, TENANT_TASKS, TENANT_TASKS_IN_FLIGHT,
+    OPTIMIZER_BYTES_SAVED, OPTIMIZER_REMOVED_INCLUDES
+)
+from student.tenants import Tenant, TenantRegistry
+from student.page_optimizer import optimize_files
+
+if TYPE_CHECKING:
+    # Imported on first use: PyGithub, GitPython and requests are slow to import
+    from student.github_manager import GitHubManager
+    from student.llm_generator import LLMGenerator
 
 app = FastAPI(title="TDS Student API")
 
@@ -26,42 +48,243 @@ app.add_middleware(
 )
 
 # Persistent task tracking
-task_tracker = TaskTracker()
+task_tracker = TaskTracker(
+    filepath=settings.task_tracker_path,
+    ttl_seconds=settings.task_ttl_seconds,
+    keep_rounds=settings.task_keep_rounds,
+    index_capacity=settings.task_index_capacity,
+    index_error_rate=settings.task_index_error_rate
+)
 
 print(f"✅ Task tracker initialized: {task_tracker.count()} tasks already processed")
 
+# Student identities served by this deployment
+tenants = TenantRegistry()
+
+# Job queue shared by every node; workers claim jobs with heartbeated leases
+job_backend = create_job_backend()
+job_worker = None
+
+# Report event-loop lag and stacks of blocking calls
+loop_monitor = install_loop_monitor(app)
+
+# Admin endpoints for profiles of pipeline runs
+install_profiling(app)
+
+# Continue the instructor's trace on every request
+install_tracing(app, "tds-student-api")
+
+# Evaluation submissions are stored durably and delivered in the background
+outbox = Outbox(settings.outbox_path)
+outbox_sender = OutboxSender(outbox)
+
+# Live progress of recent tasks; snapshots are also stored with the job
+progress = ProgressTracker()
+
+# Network clients per tenant, built on first use rather than at import time
+_clients: Dict[Tuple[str, str], Any] = {}
+
+# Seconds to wait for an abandoned generation to stop before the next strategy
+GENERATION_STOP_GRACE = 5.0
+
+# Result of the background readiness check reported by /ready
+readiness: Dict[str, Any] = {"ready": False, "checks": {}}
+
+
+def get_github_manager(tenant: Optional[Tenant] = None) -> "GitHubManager":
+    """Get the tenant's GitHub client, authenticating on first use."""
+    cache_key = ("github", tenant.name if tenant else "")
+    if cache_key not in _clients:
+        from student.github_manager import GitHubManager
+        if tenant is not None and not tenant.github_token:
+            # Never fall back to the operator's token for a tenant's repos
+            raise ValueError(f"Tenant {tenant.name} has no GitHub token")
+        _clients[cache_key] = GitHubManager(token=tenant.github_token if tenant else None)
+    return _clients[cache_key]
+
+
+def get_llm_generator(tenant: Optional[Tenant] = None) -> "LLMGenerator":
+    """Get the tenant's LLM generator."""
+    cache_key = ("llm", tenant.name if tenant else "")
+    if cache_key not in _clients:
+        from student.llm_generator import LLMGenerator
+        if tenant is not None and not tenant.llm_api_key and tenants.is_multi_tenant():
+            # Never bill a tenant's generations to the operator's LLM key
+            raise ValueError(f"Tenant {tenant.name} has no LLM API key")
+        if tenant:
+            _clients[cache_key] = LLMGenerator(provider=tenant.llm_provider, api_key=tenant.llm_api_key)
+        else:
+            _clients[cache_key] = LLMGenerator()
+    return _clients[cache_key]
+
+
+async def check_readiness(retry_interval: float = 30.0):
+    """
+    Verify GitHub credentials once the server is accepting connections.
+    
+    Retries until it succeeds, so a GitHub outage at boot does not leave the
+    node unready for good. With a tenant registry, each tenant's credentials
+    are verified on its first task instead.
+    """
+    if tenants.is_multi_tenant():
+        readiness["checks"]["tenants"] = f"{len(tenants.all())} registered"
+        readiness["ready"] = True
+        return
+    while True:
+        try:
+            github_manager = await asyncio.to_thread(get_github_manager)
+            readiness["checks"]["github"] = "ok"
+            readiness["ready"] = True
+            print(f"✅ GitHub Account: {github_manager.username}")
+            print(f"✅ GitHub Pages URL: https://{github_manager.username}.github.io/")
+            return
+        except Exception as e:
+            readiness["checks"]["github"] = str(e)
+            print(f"⚠️  Warning: Could not verify GitHub credentials: {e}")
+        await asyncio.sleep(retry_interval)
+
+
+async def record_progress(key: str, stage: Optional[str] = None, **fields):
+    """Update a task's progress and share the snapshot through the job backend."""
+    snapshot = progress.update(key, stage, **fields)
+    if snapshot is None:
+        return
+    try:
+        await asyncio.to_thread(job_backend.set_progress, key, snapshot)
+    except Exception as e:
+        print(f"Warning: Could not store progress for {key}: {e}")
+
+
+@asynccontextmanager
+async def pipeline_stage(key: str, name: str):
+    """Enter a pipeline stage: report it as the current stage, time it and trace it."""
+    await record_progress(key, stage=name)
+    with STAGE_SECONDS.time(stage=name), span(name), usage_context(stage=name):
+        yield
+
+
+async def handle_job(job: Job):
+    """Run a claimed job through the processing pipeline."""
+    payload = dict(job.payload)
+    profile = payload.pop("_profile", False)
+    parent = parse_traceparent(payload.pop("_traceparent", None))
+    request = TaskRequest(**payload)
+    tenant = tenants.get(request.email)
+    if tenant is None:
+        # Removed from the registry after the task was accepted: never run it
+        # with the operator's credentials, and retrying would not help
+        if progress.get(job.key) is None:
+            progress.start(job.key, request.task, request.round, request.nonce)
+        TENANT_TASKS.inc(tenant=job.tenant, outcome="error")
+        await record_progress(job.key, stage="failed", error=f"Tenant {job.tenant} is no longer registered")
+        print(f"❌ Job {job.key}: tenant {job.tenant} is no longer registered, not running it")
+        return
+    async with async_profile_run(f"process_task-{job.key}", enabled=profile) as profiler:
+        with TASKS_IN_FLIGHT.track_inprogress(), TENANT_TASKS_IN_FLIGHT.track_inprogress(tenant=tenant.name), \
+                span("process_task", parent=parent, kind="consumer", task=job.key, attempts=job.attempts), \
+                usage_context(service="student", task=request.task, round=request.round):
+            # Errors are left to the queue's retry while the job has attempts left
+            await process_task(request, job.deadline, tenant, retryable=job.attempts < job_backend.max_attempts)
+    if profiler is not None:
+        await record_progress(job.key, profile_id=profiler.id)
+
+
+async def prune_processed_tasks():
+    """Apply the task tracker's retention policy periodically, off the request path."""
+    while True:
+        await asyncio.sleep(TaskTracker.PRUNE_INTERVAL)
+        try:
+            removed = await asyncio.to_thread(task_tracker.prune)
+            if removed:
+                print(f"📊 Pruned {removed} processed tasks")
+        except Exception as e:
+            print(f"⚠️  Could not prune processed tasks: {e}")
+
+
+@app.on_event("startup")
+async def start_job_worker():
+    """Start the outbox sender and task pruning, and claim jobs unless this node only accepts requests."""
+    global job_worker
+    # Runs in the background so that uvicorn binds the port right away
+    asyncio.create_task(check_readiness())
+    if task_tracker.has_retention():
+        asyncio.create_task(prune_processed_tasks())
+    outbox_sender.start()
+    if settings.job_worker_enabled:
+        # Tenants take turns and are capped at their max_concurrency
+        job_worker = JobWorker(job_backend, handle_job, tenant_cap=tenants.concurrency_cap)
+        job_worker.start()
+    elif settings.job_backend == "memory":
+        print("⚠️  Job worker disabled with the memory backend: queued tasks will never run")
+
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    """Stop claiming jobs; unfinished ones are re-claimed after their lease expires."""
+    if job_worker:
+        await job_worker.stop()
+    await outbox_sender.stop()
+
 
 @app.post("/api/task")
-async def receive_task(request: TaskRequest, background_tasks: BackgroundTasks):
+async def receive_task(request: TaskRequest, x_profile: Optional[str] = Header(None)):
     """
     Receive a task request, generate app, deploy to GitHub, and notify evaluation API.
+    
+    Send an ``X-Profile`` header to store a sampling profile of the pipeline run.
     """
-    # Verify secret
-    if request.secret != settings.student_secret:
+    # Verify email and secret against the tenant registry
+    tenant = tenants.get(request.email)
+    if tenant is None:
+        raise HTTPException(status_code=400, detail="Email mismatch")
+    if not tenant.check_secret(request.secret):
+        TENANT_REQUESTS.inc(tenant=tenant.name, result="unauthorized")
         raise HTTPException(status_code=401, detail="Invalid secret")
     
-    # Verify email
-    if request.email != settings.student_email:
-        raise HTTPException(status_code=400, detail="Email mismatch")
+    # Per-tenant rate limit
+    retry_after = tenants.check_rate(tenant)
+    if retry_after:
+        TENANT_REQUESTS.inc(tenant=tenant.name, result="rate_limited")
+        return JSONResponse(
+            status_code=429,
+            content={"message": "Rate limit exceeded", "task": request.task},
+            headers={"Retry-After": str(int(retry_after) + 1)}
+        )
     
     # Check if task already processed
-    task_key = f"{request.task}-{request.round}-{request.nonce}"
-    if task_tracker.is_processed(task_key):
+    task_key = make_task_key(request.task, request.round, request.nonce)
+    if await asyncio.to_thread(task_tracker.is_processed, task_key):
         print(f"⚠️  Task already processed: {task_key}")
+        TENANT_REQUESTS.inc(tenant=tenant.name, result="duplicate")
         return JSONResponse(
             status_code=200,
             content={"message": "Task already processed", "task": request.task}
         )
     
-    # Mark as processing
-    task_tracker.mark_processed(task_key)
-    print(f"✅ New task accepted: {task_key}")
+    # Mark as processing (a concurrent duplicate loses the insert)
+    if not await asyncio.to_thread(task_tracker.mark_processed, task_key, request.round):
+        print(f"⚠️  Task already processed: {task_key}")
+        TENANT_REQUESTS.inc(tenant=tenant.name, result="duplicate")
+        return JSONResponse(
+            status_code=200,
+            content={"message": "Task already processed", "task": request.task}
+        )
+    print(f"✅ New task accepted: {task_key} ({tenant.name})")
+    TENANT_REQUESTS.inc(tenant=tenant.name, result="accepted")
     
-    # Process task in background
-    background_tasks.add_task(
-        process_task,
-        request
-    )
+    # Queue for processing by any worker node, earliest deadline first
+    deadline_at = time.time() + settings.task_deadline_seconds
+    payload = request.model_dump()
+    if x_profile:
+        payload["_profile"] = True
+    # The worker continues the trace of this request
+    payload["_traceparent"] = current_traceparent()
+    await asyncio.to_thread(job_backend.enqueue, task_key, payload, deadline_at, tenant.name)
+    progress.start(task_key, request.task, request.round, request.nonce)
+    snapshot = progress.update(task_key, deadline=deadline_at)
+    await asyncio.to_thread(job_backend.set_progress, task_key, snapshot)
+    if job_worker:
+        job_worker.notify()
     
     return JSONResponse(
         status_code=200,
@@ -69,50 +292,71 @@ async def receive_task(request: TaskRequest, background_tasks: BackgroundTasks):
     )
 
 
-async def process_task(request: TaskRequest):
-    """Process the task: generate, deploy, and notify."""
-    start_time = time.time()
-    timeout_seconds = 600  # 10 minutes
+async def process_task(
+    request: TaskRequest,
+    deadline_at: Optional[float] = None,
+    tenant: Optional[Tenant] = None,
+    retryable: bool = False
+):
+    """
+    Process the task: generate, deploy, and notify.
+    
+    Each stage gets a budget from the time left before the task's deadline.
+    When time runs short, cheaper strategies are used (smaller model, template
+    app, no Pages verification) so that a submission is still made. GitHub and
+    LLM calls use the tenant's credentials.
+    
+    With retryable (the job has attempts left), an error before the deadline
+    is raised so that the job queue retries the task, and the task is only
+    recorded as failed on its last attempt.
+    """
+    deadline = Deadline(deadline_at)
+    tenant_name = tenant.name if tenant else request.email
     
-    def check_timeout() -> float:
-        """Check if timeout exceeded and return elapsed time."""
-        elapsed = time.time() - start_time
-        if elapsed > timeout_seconds:
-            raise TimeoutError(f"Task processing exceeded {timeout_seconds}s limit")
-        return elapsed
+    key = make_task_key(request.task, request.round, request.nonce)
+    if progress.get(key) is None:
+        # Claimed on a different node than the one that accepted it
+        progress.start(key, request.task, request.round, request.nonce)
     
     try:
         print(f"\n{'='*60}")
         print(f"🚀 PROCESSING TASK: {request.task} (Round {request.round})")
+        print(f"   ⏰ {deadline.remaining():.0f}s until deadline")
         print(f"{'='*60}")
         
+        if deadline.remaining() <= 0:
+            raise TimeoutError("Task deadline passed before processing started")
+        
         # Step 1: Generate application using LLM
-        elapsed = check_timeout()
+        elapsed = deadline.elapsed()
         print(f"\n[{elapsed:.1f}s] 🤖 Generating application with LLM...")
-        generator = LLMGenerator()
-        files = generator.generate_app(
-            brief=request.brief,
-            checks=request.checks,
-            attachments=request.attachments
-        )
-        elapsed = check_timeout()
-        print(f"[{elapsed:.1f}s] ✅ Generated {len(files)} files")
+        async with pipeline_stage(key, "generate"):
+            generator = await asyncio.to_thread(get_llm_generator, tenant)
+            files, strategy = await generate_files(generator, request, deadline)
+        await record_progress(key, strategy=strategy)
+        elapsed = deadline.elapsed()
+        print(f"[{elapsed:.1f}s] ✅ Generated {len(files)} files ({strategy})")
+        
+        if settings.page_optimizer_enabled:
+            async with pipeline_stage(key, "optimize"):
+                files = await optimize_pages(key, request, files, deadline)
         
         # Step 2: Prepare GitHub deployment
         repo_name = f"{request.task}-r{request.round}"
-        github_manager = GitHubManager()
         
-        elapsed = check_timeout()
+        elapsed = deadline.elapsed()
         print(f"\n[{elapsed:.1f}s] 📦 Deploying to GitHub...")
         
-        if request.round == 1:
-            # Create new repo
-            repo_url, commit_sha, pages_url = github_manager.create_and_deploy_repo(
-                repo_name=repo_name,
-                files=files,
-                enable_pages=True
-            )
-        else:
+        def deploy():
+            github_manager = get_github_manager(tenant)
+            if request.round == 1:
+                # Create new repo
+                return github_manager, *github_manager.create_and_deploy_repo(
+                    repo_name=repo_name,
+                    files=files,
+                    enable_pages=True
+                )
+            
             # Update existing repo
             base_repo_name = f"{request.task}-r1"
             
@@ -122,36 +366,47 @@ async def process_task(request: TaskRequest):
                     repo_name=base_repo_name,
                     files=files
                 )
-                pages_url = github_manager.get_pages_url(base_repo_name)
+                return github_manager, repo_url, commit_sha, github_manager.get_pages_url(base_repo_name)
             except:
                 # If update fails, create new repo
-                repo_url, commit_sha, pages_url = github_manager.create_and_deploy_repo(
+                RETRIES.inc(operation="git_push")
+                return github_manager, *github_manager.create_and_deploy_repo(
                     repo_name=repo_name,
                     files=files,
                     enable_pages=True
                 )
         
-        elapsed = check_timeout()
+        async with pipeline_stage(key, "git_push"):
+            github_manager, repo_url, commit_sha, pages_url = await asyncio.to_thread(deploy)
+        
+        await record_progress(key, repo_url=repo_url, commit_sha=commit_sha, pages_url=pages_url)
+        elapsed = deadline.elapsed()
         print(f"[{elapsed:.1f}s] ✅ GitHub deployment complete")
         print(f"   📍 Repo: {repo_url}")
         print(f"   🌐 Pages: {pages_url}")
         
-        # Step 3: Verify GitHub Pages is accessible
-        elapsed = check_timeout()
-        print(f"\n[{elapsed:.1f}s] ⏳ Verifying GitHub Pages deployment...")
-        await asyncio.sleep(5)  # Initial wait
-        
-        elapsed = check_timeout()
-        is_live = await github_manager.verify_pages_deployed(pages_url, timeout=120)
-        elapsed = check_timeout()
+        # Step 3: Verify GitHub Pages is accessible, if there is time
+        elapsed = deadline.elapsed()
+        budget = deadline.budget("pages_propagation")
+        async with pipeline_stage(key, "pages_propagation"):
+            if budget < 10:
+                DEGRADED.inc(strategy="skip_pages_verification")
+                is_live = None
+                print(f"\n[{elapsed:.1f}s] ⚠️  Only {budget:.0f}s left, skipping Pages verification")
+            else:
+                print(f"\n[{elapsed:.1f}s] ⏳ Verifying GitHub Pages deployment...")
+                await asyncio.sleep(5)  # Initial wait
+                is_live = await github_manager.verify_pages_deployed(pages_url, timeout=budget - 5)
+        await record_progress(key, pages_live=is_live)
+        elapsed = deadline.elapsed()
         
         if is_live:
             print(f"[{elapsed:.1f}s] ✅ GitHub Pages is live and accessible!")
-        else:
+        elif is_live is False:
             print(f"[{elapsed:.1f}s] ⚠️  Pages verification timed out, but continuing...")
         
         # Step 4: Submit to evaluation API
-        elapsed = check_timeout()
+        elapsed = deadline.elapsed()
         print(f"\n[{elapsed:.1f}s] 📤 Submitting to evaluation API...")
         
         submission = RepoSubmission(
@@ -164,51 +419,244 @@ async def process_task(request: TaskRequest):
             pages_url=pages_url
         )
         
-        await submit_with_retry(request.evaluation_url, submission)
+        async with pipeline_stage(key, "evaluation_submit"):
+            delivered = await submit_with_retry(request.evaluation_url, submission, deadline=deadline)
+        await record_progress(key, submission_delivered=delivered)
         
-        elapsed = check_timeout()
-        print(f"\n[{elapsed:.1f}s] 🎉 TASK COMPLETED SUCCESSFULLY")
+        elapsed = deadline.elapsed()
+        TASK_SECONDS.observe(elapsed, outcome="success")
+        TENANT_TASKS.inc(tenant=tenant_name, outcome="success")
+        await record_progress(key, stage="completed")
+        print(f"\n[{elapsed:.1f}s] 🎉 TASK COMPLETED SUCCESSFULLY ({deadline.remaining():.0f}s before deadline)")
         print(f"{'='*60}\n")
         
     except TimeoutError as e:
-        elapsed = time.time() - start_time
+        elapsed = deadline.elapsed()
+        TIMEOUTS.inc(stage="task")
+        TASK_SECONDS.observe(elapsed, outcome="timeout")
+        TENANT_TASKS.inc(tenant=tenant_name, outcome="timeout")
+        await record_progress(key, stage="timeout", error=str(e))
         print(f"\n[{elapsed:.1f}s] ⏱️  TIMEOUT: {e}")
         print(f"{'='*60}\n")
     except Exception as e:
-        elapsed = time.time() - start_time
+        elapsed = deadline.elapsed()
+        if retryable and deadline.remaining() > 0:
+            RETRIES.inc(operation="task")
+            await record_progress(key, stage="queued", error=str(e))
+            print(f"\n[{elapsed:.1f}s] ⚠️  ERROR: {e} (the task will be retried)")
+            print(f"{'='*60}\n")
+            raise
+        TASK_SECONDS.observe(elapsed, outcome="error")
+        TENANT_TASKS.inc(tenant=tenant_name, outcome="error")
+        await record_progress(key, stage="failed", error=str(e))
         print(f"\n[{elapsed:.1f}s] ❌ ERROR: {e}")
         import traceback
         traceback.print_exc()
         print(f"{'='*60}\n")
 
 
-async def submit_with_retry(url: str, submission: RepoSubmission, max_retries: int = 5):
-    """Submit to evaluation API with exponential backoff."""
-    delays = [1, 2, 4, 8, 16]  # seconds
+async def optimize_pages(key: str, request: TaskRequest, files: Dict[str, str], deadline: Deadline) -> Dict[str, str]:
+    """
+    Minify and trim the generated pages before deploy.
+
+    The optimizer only makes changes that keep the checks passing; if it fails
+    anyway, does not finish within the optimize budget, or does not make the
+    pages smaller, the files are deployed as generated.
+    """
+    budget = deadline.budget("optimize")
+    if budget < 1:
+        DEGRADED.inc(strategy="skip_optimize")
+        print(f"⚠️  Only {budget:.0f}s left, deploying the generated files unoptimized")
+        return files
+    try:
+        # optimize_files does not modify its input, so an abandoned run is harmless
+        optimized, report = await asyncio.wait_for(
+            asyncio.to_thread(optimize_files, files, request.checks, request.brief), timeout=budget
+        )
+    except asyncio.TimeoutError:
+        TIMEOUTS.inc(stage="optimize")
+        print(f"⚠️  Page optimization did not finish within {budget:.0f}s, deploying the generated files")
+        return files
+    except Exception as e:
+        print(f"⚠️  Page optimization failed, deploying the generated files: {e}")
+        return files
+    if report["optimized_bytes"] >= report["original_bytes"]:
+        # Nothing to gain (e.g. hints outweigh what was stripped)
+        await record_progress(key, optimization={**report, "applied": False})
+        print(f"📊 Optimization saved no bytes ({report['saved_bytes']}), deploying the generated files")
+        return files
+    OPTIMIZER_BYTES_SAVED.inc(report["saved_bytes"])
+    OPTIMIZER_REMOVED_INCLUDES.inc(len(report["removed_includes"]))
+    await record_progress(key, optimization={**report, "applied": True})
+    print(f"📊 Optimized pages: {report['original_bytes']} → {report['optimized_bytes']} bytes, "
+          f"{len(report['removed_includes'])} unused includes removed, {report['deferred_scripts']} scripts deferred")
+    return optimized
+
+
+async def generate_files(
+    generator: "LLMGenerator",
+    request: TaskRequest,
+    deadline: Deadline
+) -> Tuple[Dict[str, str], str]:
+    """
+    Generate the app with the best strategy that fits the remaining budget.
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        for attempt in range(max_retries):
-            try:
-                response = await client.post(
-                    url,
-                    json=submission.model_dump(),
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                if response.status_code == 200:
-                    print(f"Successfully submitted to {url}")
+    Returns:
+        Tuple of (files, strategy used)
+    """
+    for strategy in (FULL, FAST):
+        if strategy not in deadline.generation_strategies():
+            continue
+        budget = deadline.budget("generate")
+        model = generator.model if strategy == FULL else generator.fast_model
+        if strategy == FAST:
+            DEGRADED.inc(strategy="fast_model")
+        cancel = threading.Event()
+        call = asyncio.ensure_future(asyncio.to_thread(
+            generator.generate_app,
+            brief=request.brief,
+            checks=request.checks,
+            attachments=request.attachments,
+            model=model,
+            timeout=budget,
+            cancel=cancel
+        ))
+        try:
+            with span("llm_generate", kind="client", model=model, strategy=strategy, budget=round(budget, 1)):
+                files = await asyncio.wait_for(asyncio.shield(call), timeout=budget)
+            return files, strategy
+        except asyncio.TimeoutError:
+            TIMEOUTS.inc(stage="generate")
+            print(f"⚠️  {model} did not finish within {budget:.0f}s")
+            await stop_generation(call, cancel)
+        except Exception as e:
+            print(f"⚠️  Generation with {model} failed: {e}")
+    
+    DEGRADED.inc(strategy="template")
+    print("⚠️  Not enough time left for the LLM, using the template app")
+    return generator.generate_template_app(request.brief, request.checks), TEMPLATE
+
+
+async def stop_generation(call: asyncio.Future, cancel: threading.Event):
+    """
+    Stop an abandoned generation before the next strategy starts.
+
+    The thread cannot be killed: it is told to stop at its next step, and
+    its own request timeout equals the stage budget, so it ends shortly. It
+    is waited for (up to GENERATION_STOP_GRACE seconds) so that two
+    strategies never run at once; a result it still produces is discarded.
+    """
+    cancel.set()
+    # Consumed here so that a late failure is not reported as unretrieved
+    call.add_done_callback(lambda done: done.cancelled() or done.exception())
+    finished, _ = await asyncio.wait({call}, timeout=GENERATION_STOP_GRACE)
+    if not finished:
+        print(f"⚠️  Abandoned generation still running after {GENERATION_STOP_GRACE:.0f}s; its result will be discarded")
+
+
+async def submit_with_retry(
+    url: str,
+    submission: RepoSubmission,
+    deadline: Optional[Deadline] = None
+) -> bool:
+    """
+    Queue the submission in the durable outbox and wait for its delivery.
+    
+    The background sender keeps retrying after this returns, including
+    across restarts, until the evaluation API accepts it.
+    
+    Returns:
+        True if delivered before the evaluation_submit budget ran out
+    """
+    traceparent = current_traceparent()
+    headers = {"traceparent": traceparent} if traceparent else None
+    item_id = await asyncio.to_thread(outbox.enqueue, url, submission.model_dump(), headers)
+    outbox_sender.notify()
+    timeout = deadline.budget("evaluation_submit") if deadline else settings.stage_budget_seconds["evaluation_submit"]
+    delivered = await outbox_sender.wait_delivered(item_id, timeout=max(timeout, 1.0))
+    if not delivered:
+        print(f"⚠️  Submission to {url} not delivered yet; it stays queued in the outbox")
+    return delivered
+
+
+def running_here(key: str) -> bool:
+    """Whether this node has started the task's pipeline (not just accepted it)."""
+    snapshot = progress.get(key)
+    return snapshot is not None and snapshot.get("stage") != "queued"
+
+
+async def get_task_progress(key: str) -> Optional[dict]:
+    """Progress from this node while it runs the task, otherwise from the job backend."""
+    snapshot = progress.get(key)
+    if running_here(key):
+        return snapshot
+    # Accepted here but possibly claimed by another node
+    job = await asyncio.to_thread(job_backend.get, key)
+    if job is None:
+        return snapshot
+    return job.progress or {"stage": job.state, "error": job.error}
+
+
+@app.get("/api/task/{task}/{round}/{nonce}")
+async def task_status(task: str, round: int, nonce: str):
+    """Get the current stage, stage timings, URLs and error of a task."""
+    snapshot = await get_task_progress(make_task_key(task, round, nonce))
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return snapshot
+
+
+@app.get("/api/task/{task}/{round}/{nonce}/events")
+async def task_events(task: str, round: int, nonce: str):
+    """Stream progress snapshots as server-sent events until the task finishes."""
+    key = make_task_key(task, round, nonce)
+    snapshot = await get_task_progress(key)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    def event(data: dict) -> str:
+        return f"event: {data.get('stage')}\ndata: {json.dumps(data)}\n\n"
+
+    async def stream():
+        yield event(snapshot)
+        if snapshot.get("stage") in TERMINAL_STAGES:
+            return
+        queue = None
+        last, last_sent = snapshot, time.time()
+        try:
+            while True:
+                try:
+                    if queue is None and running_here(key):
+                        # This node claimed it: follow local updates from now on
+                        queue = progress.subscribe(key)
+                        current = progress.get(key)
+                    elif queue is not None:
+                        current = await asyncio.wait_for(queue.get(), timeout=15)
+                    else:
+                        # Queued, or running on another node: poll the shared job backend
+                        await asyncio.sleep(1)
+                        current = await get_task_progress(key)
+                    if current == last:
+                        if time.time() - last_sent >= 15:
+                            raise asyncio.TimeoutError
+                        continue
+                except asyncio.TimeoutError:
+                    last_sent = time.time()
+                    yield ": keep-alive\n\n"
+                    continue
+                last, last_sent = current, time.time()
+                yield event(current)
+                if current.get("stage") in TERMINAL_STAGES:
                     return
-                else:
-                    print(f"Attempt {attempt + 1}: Got status {response.status_code}")
-                    
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
-            
-            # Wait before retry (except on last attempt)
-            if attempt < max_retries - 1:
-                await asyncio.sleep(delays[attempt])
-        
-        print(f"Failed to submit to {url} after {max_retries} attempts")
+        finally:
+            if queue is not None:
+                progress.unsubscribe(key, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.get("/")
@@ -219,18 +667,63 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """Health check endpoint."""
+    """Liveness check: the process is up and serving requests."""
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness check: GitHub credentials have been verified."""
+    return JSONResponse(
+        status_code=200 if readiness["ready"] else 503,
+        content={"status": "ready" if readiness["ready"] else "starting", "checks": readiness["checks"]}
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint."""
+    counts = await asyncio.to_thread(job_backend.counts)
+    for state, count in counts.items():
+        QUEUE_DEPTH.set(count, state=state)
+    OUTBOX_PENDING.set((await asyncio.to_thread(outbox.counts))["pending"])
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/usage")
+async def usage(group_by: str = "model", task: Optional[str] = None, since: Optional[float] = None,
+                offset: int = 0, limit: int = 100):
+    """
+    LLM token usage and cost, aggregated and per call.
+    
+    Args:
+        group_by: provider, model, task, round, stage or service
+        task: Only calls made for this task
+        since: Only calls after this epoch time
+    """
+    if group_by not in GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(GROUP_BY)}")
+    ledger = get_ledger()
+    return {
+        "group_by": group_by,
+        "summary": await asyncio.to_thread(ledger.summary, group_by, task, since),
+        "calls": await asyncio.to_thread(ledger.records, offset, limit, task, since)
+    }
+
+
 @app.get("/stats")
-async def stats():
-    """Get statistics about processed tasks."""
-    processed = task_tracker.get_processed_tasks()
+async def stats(offset: int = 0, limit: int = 100):
+    """Get statistics about processed tasks, with one page of task keys."""
+    limit = max(0, min(limit, 1000))
     return {
         "status": "ok",
-        "total_processed": len(processed),
-        "tasks": processed
+        "outbox": await asyncio.to_thread(outbox.counts),
+        "total_processed": await asyncio.to_thread(task_tracker.count),
+        "by_round": await asyncio.to_thread(task_tracker.count_by_round),
+        "offset": offset,
+        "limit": limit,
+        "tasks": await asyncio.to_thread(task_tracker.get_processed_tasks, offset, limit),
+        "jobs": await asyncio.to_thread(job_backend.counts)
     }
 
 
@@ -242,14 +735,8 @@ if __name__ == "__main__":
     print("🚀 TDS Student API Starting...")
     print("="*60)
     
-    # Verify GitHub credentials
-    try:
-        test_manager = GitHubManager()
-        print(f"✅ GitHub Account: {test_manager.username}")
-        print(f"✅ GitHub Pages URL: https://{test_manager.username}.github.io/")
-    except Exception as e:
-        print(f"⚠️  Warning: Could not verify GitHub credentials: {e}")
-    
+    # GitHub credentials are verified in the background after the port is
+    # bound; see /ready
     print(f"✅ Student Email: {settings.student_email}")
     print(f"✅ API Port: {settings.api_port}")
     print("="*60 + "\n")
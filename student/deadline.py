@@ -0,0 +1,70 @@
+"""
+Absolute task deadlines and per-stage time budgets.
+"""
+import time
+from typing import Dict, List, Optional
+
+from shared.config import settings
+
+
+# Pipeline stages in execution order
+STAGES = ("generate", "optimize", "git_push", "pages_propagation", "evaluation_submit")
+
+# Time the cheapest strategy of each stage needs; later stages keep this much
+# in reserve so that a submission can always be made.
+STAGE_FLOORS = {
+    "generate": 2.0,          # template fallback
+    "optimize": 0.0,          # pages can be deployed as generated
+    "git_push": 30.0,
+    "pages_propagation": 0.0,  # verification can be skipped
+    "evaluation_submit": 10.0,
+}
+
+# Generation strategies, from best to cheapest
+FULL = "full"
+FAST = "fast"
+TEMPLATE = "template"
+
+
+class Deadline:
+    """Absolute deadline of a task with budgets for each remaining stage."""
+
+    def __init__(self, at: Optional[float] = None, budgets: Optional[Dict[str, float]] = None):
+        """
+        Initialize the deadline.
+
+        Args:
+            at: Absolute deadline (epoch seconds); defaults to now plus
+                settings.task_deadline_seconds
+            budgets: Maximum seconds per stage; defaults to settings.stage_budget_seconds
+        """
+        self.started_at = time.time()
+        self.at = at if at is not None else self.started_at + settings.task_deadline_seconds
+        self.budgets = budgets if budgets is not None else settings.stage_budget_seconds
+
+    def elapsed(self) -> float:
+        return time.time() - self.started_at
+
+    def remaining(self) -> float:
+        return self.at - time.time()
+
+    def budget(self, stage: str) -> float:
+        """
+        Seconds the stage may use: its own budget, but never eating into the
+        time later stages need for their cheapest strategy.
+        """
+        later = STAGES[STAGES.index(stage) + 1:]
+        reserve = sum(STAGE_FLOORS[name] for name in later)
+        available = self.remaining() - reserve
+        return max(0.0, min(self.budgets.get(stage, available), available))
+
+    def generation_strategies(self) -> List[str]:
+        """Generation strategies worth trying with the current budget, best first."""
+        budget = self.budget("generate")
+        strategies = []
+        if budget >= settings.llm_full_min_seconds:
+            strategies.append(FULL)
+        if budget >= settings.llm_fast_min_seconds:
+            strategies.append(FAST)
+        strategies.append(TEMPLATE)
+        return strategies
@@ -5,16 +5,25 @@ import os
 import tempfile
 import shutil
 from pathlib import Path
+from typing import Optional
 from github import Github
 from git import Repo
 from shared.config import settings
+from student.metrics import RETRIES
 
 
 class GitHubManager:
     """Manage GitHub repository operations."""
     
-    def __init__(self):
-        self.github = Github(settings.github_token)
+    def __init__(self, token: Optional[str] = None):
+        """
+        Initialize the manager.
+        
+        Args:
+            token: GitHub token (defaults to settings.github_token)
+        """
+        self.token = token or settings.github_token
+        self.github = Github(self.token)
         self.user = self.github.get_user()
         # Get the actual username from the authenticated account
         self.username = self.user.login
@@ -70,7 +79,7 @@ class GitHubManager:
             # Add remote and push
             origin = local_repo.create_remote('origin', repo.clone_url.replace(
                 'https://',
-                f'https://{settings.github_username}:{settings.github_token}@'
+                f'https://{self.username}:{self.token}@'
             ))
             
             # Push to main branch
@@ -79,6 +88,7 @@ class GitHubManager:
             except Exception as e:
                 print(f"Warning: Push to main failed: {e}")
                 # Try pushing to master as fallback
+                RETRIES.inc(operation="git_push")
                 origin.push(refspec='HEAD:refs/heads/master', force=True)
             
             # Get commit SHA
@@ -98,7 +108,7 @@ class GitHubManager:
                     try:
                         import requests
                         headers = {
-                            "Authorization": f"token {settings.github_token}",
+                            "Authorization": f"token {self.token}",
                             "Accept": "application/vnd.github.v3+json"
                         }
                         pages_data = {
@@ -108,7 +118,7 @@ class GitHubManager:
                             }
                         }
                         response = requests.post(
-                            f"https://api.github.com/repos/{settings.github_username}/{repo_name}/pages",
+                            f"https://api.github.com/repos/{self.username}/{repo_name}/pages",
                             headers=headers,
                             json=pages_data
                         )
@@ -151,7 +161,7 @@ class GitHubManager:
             local_repo = Repo.clone_from(
                 repo.clone_url.replace(
                     'https://',
-                    f'https://{settings.github_username}:{settings.github_token}@'
+                    f'https://{self.username}:{self.token}@'
                 ),
                 temp_dir
             )
@@ -210,11 +220,14 @@ class GitHubManager:
         
         while time.time() - start_time < timeout:
             attempts += 1
+            if attempts > 1:
+                RETRIES.inc(operation="pages_check")
+            remaining = timeout - (time.time() - start_time)
             try:
                 async with httpx.AsyncClient() as client:
                     response = await client.get(
                         pages_url, 
-                        timeout=10.0, 
+                        timeout=min(10.0, remaining), 
                         follow_redirects=True
                     )
                     if response.status_code == 200:
@@ -225,8 +238,9 @@ class GitHubManager:
             except Exception as e:
                 print(f"Attempt {attempts}: {type(e).__name__}: {str(e)[:50]}")
             
-            if time.time() - start_time < timeout:
-                await asyncio.sleep(10)  # Wait 10 seconds between checks
+            remaining = timeout - (time.time() - start_time)
+            if remaining > 0:
+                await asyncio.sleep(min(10, remaining))  # Wait up to 10 seconds between checks
         
         print(f"❌ GitHub Pages not accessible after {timeout} seconds and {attempts} attempts")
         return False
@@ -0,0 +1,658 @@
+"""
+Lease-based job queue for spreading task processing across several nodes.
+
+Any node can enqueue a job; worker nodes claim jobs with a time-limited lease
+and keep it alive with heartbeats. A job whose lease expires (because its
+worker died or lost connectivity) becomes claimable again.
+"""
+import asyncio
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from shared.config import settings
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+JOB_STATES = (QUEUED, RUNNING, DONE, FAILED)
+
+# Maximum running jobs for a tenant, or None for no limit
+TenantCap = Callable[[str], Optional[int]]
+
+
+@dataclass
+class Job:
+    """A unit of work held by a job backend."""
+    id: str
+    key: str
+    payload: Dict[str, Any]
+    state: str = QUEUED
+    attempts: int = 0
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[float] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    error: Optional[str] = None
+    progress: Optional[Dict[str, Any]] = None
+    deadline: Optional[float] = None
+    tenant: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the job as a JSON-serializable dict (without payload)."""
+        data = asdict(self)
+        data.pop("payload")
+        return data
+
+
+class JobBackend:
+    """
+    Interface implemented by every job backend.
+
+    Methods are synchronous so that backends can use blocking drivers; the
+    worker calls them from a thread.
+    """
+
+    def __init__(self, max_attempts: int = 3):
+        self.max_attempts = max_attempts
+
+    @classmethod
+    def from_settings(cls) -> "JobBackend":
+        """Build the backend from application settings."""
+        return cls(max_attempts=settings.job_max_attempts)
+
+    def enqueue(
+        self,
+        key: str,
+        payload: Dict[str, Any],
+        deadline: Optional[float] = None,
+        tenant: str = ""
+    ) -> bool:
+        """
+        Add a job unless one with the same key already exists.
+
+        Args:
+            key: Unique job key
+            payload: JSON-serializable job data
+            deadline: Absolute deadline (epoch seconds) used for scheduling
+            tenant: Tenant the job belongs to, for fair scheduling
+
+        Returns:
+            True if a new job was created
+        """
+        raise NotImplementedError
+
+    def claim(
+        self,
+        worker_id: str,
+        lease_seconds: float,
+        tenant_cap: Optional[TenantCap] = None
+    ) -> Optional[Job]:
+        """
+        Claim the next runnable job, or return None if there is none.
+
+        Tenants take turns: the tenant with the fewest running jobs goes
+        first, ties going to the one served least recently, and tenants at
+        their ``tenant_cap`` are skipped. Within a tenant the earliest
+        deadline goes first (jobs without one go last, oldest first).
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """
+        Extend the lease on a running job.
+
+        Returns:
+            False if the worker no longer holds the lease
+        """
+        raise NotImplementedError
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        """Mark a job as done if the worker still holds its lease."""
+        raise NotImplementedError
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Requeue a job, or mark it failed once it has used all attempts."""
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[Job]:
+        """Look up a job by its key."""
+        raise NotImplementedError
+
+    def set_progress(self, key: str, progress: Dict[str, Any]):
+        """Store the latest progress snapshot so any node can report it."""
+        raise NotImplementedError
+
+    def counts(self) -> Dict[str, int]:
+        """Get the number of jobs in each state."""
+        raise NotImplementedError
+
+
+def _schedule_order(job: Job) -> tuple:
+    """Earliest deadline first; jobs without a deadline last, oldest first."""
+    return (job.deadline is None, job.deadline or 0.0, job.created_at)
+
+
+def _pick_tenant(
+    candidates: Dict[str, float],
+    running: Dict[str, int],
+    turns: Dict[str, float],
+    tenant_cap: Optional[TenantCap]
+) -> Optional[str]:
+    """
+    Choose the tenant to serve next.
+
+    Args:
+        candidates: Tenants with runnable jobs and their earliest deadline
+        running: Running jobs per tenant
+        turns: When each tenant last had a job claimed
+        tenant_cap: Maximum running jobs per tenant
+    """
+    order = lambda t: (running.get(t, 0), turns.get(t, 0.0), candidates[t])
+    for tenant in sorted(candidates, key=order):
+        cap = tenant_cap(tenant) if tenant_cap else None
+        if cap is None or running.get(tenant, 0) < cap:
+            return tenant
+    return None
+
+
+class MemoryJobBackend(JobBackend):
+    """In-process backend; jobs are lost on restart and not shared between nodes."""
+
+    def __init__(self, max_attempts: int = 3):
+        super().__init__(max_attempts)
+        self._jobs: Dict[str, Job] = {}
+        self._by_id: Dict[str, Job] = {}
+        self._turns: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def enqueue(
+        self,
+        key: str,
+        payload: Dict[str, Any],
+        deadline: Optional[float] = None,
+        tenant: str = ""
+    ) -> bool:
+        with self._lock:
+            if key in self._jobs:
+                return False
+            job = Job(id=uuid.uuid4().hex, key=key, payload=payload, deadline=deadline, tenant=tenant)
+            self._jobs[key] = job
+            self._by_id[job.id] = job
+            return True
+
+    def claim(
+        self,
+        worker_id: str,
+        lease_seconds: float,
+        tenant_cap: Optional[TenantCap] = None
+    ) -> Optional[Job]:
+        now = time.time()
+        with self._lock:
+            runnable: List[Job] = []
+            running: Dict[str, int] = {}
+            for job in self._jobs.values():
+                expired = job.state == RUNNING and (job.lease_expires_at or 0) < now
+                if job.state == RUNNING and not expired:
+                    running[job.tenant] = running.get(job.tenant, 0) + 1
+                    continue
+                if job.state != QUEUED and not expired:
+                    continue
+                if job.attempts >= self.max_attempts:
+                    job.state = FAILED
+                    job.error = job.error or "Lease expired too many times"
+                    job.lease_owner = None
+                    job.updated_at = now
+                    continue
+                runnable.append(job)
+
+            heads: Dict[str, float] = {}
+            for job in runnable:
+                deadline = job.deadline if job.deadline is not None else float("inf")
+                heads[job.tenant] = min(heads.get(job.tenant, deadline), deadline)
+            tenant = _pick_tenant(heads, running, self._turns, tenant_cap)
+            if tenant is None:
+                return None
+            job = min((job for job in runnable if job.tenant == tenant), key=_schedule_order)
+            self._turns[tenant] = now
+            job.state = RUNNING
+            job.attempts += 1
+            job.lease_owner = worker_id
+            job.lease_expires_at = now + lease_seconds
+            job.updated_at = now
+            return Job(**asdict(job))
+
+    def _owned(self, job_id: str, worker_id: str) -> Optional[Job]:
+        job = self._by_id.get(job_id)
+        if job and job.state == RUNNING and job.lease_owner == worker_id:
+            return job
+        return None
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        with self._lock:
+            job = self._owned(job_id, worker_id)
+            if not job:
+                return False
+            job.lease_expires_at = time.time() + lease_seconds
+            job.updated_at = time.time()
+            return True
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        with self._lock:
+            job = self._owned(job_id, worker_id)
+            if not job:
+                return False
+            job.state = DONE
+            job.lease_owner = None
+            job.lease_expires_at = None
+            job.updated_at = time.time()
+            return True
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        with self._lock:
+            job = self._owned(job_id, worker_id)
+            if not job:
+                return False
+            job.state = QUEUED if job.attempts < self.max_attempts else FAILED
+            job.error = error
+            job.lease_owner = None
+            job.lease_expires_at = None
+            job.updated_at = time.time()
+            return True
+
+    def get(self, key: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(key)
+            return Job(**asdict(job)) if job else None
+
+    def set_progress(self, key: str, progress: Dict[str, Any]):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job:
+                job.progress = progress
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {state: 0 for state in JOB_STATES}
+            for job in self._jobs.values():
+                counts[job.state] += 1
+            return counts
+
+
+class SQLiteJobBackend(JobBackend):
+    """
+    SQLite file backend.
+
+    Every node pointing at the same file shares the queue, which is enough for
+    single-host deployments and tests. Claims run inside ``BEGIN IMMEDIATE`` so
+    two workers can never take the same job.
+    """
+
+    def __init__(self, path: str = "jobs.db", max_attempts: int = 3):
+        super().__init__(max_attempts)
+        self.path = path
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    key TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    error TEXT,
+                    progress TEXT,
+                    deadline REAL,
+                    tenant TEXT NOT NULL DEFAULT ''
+                )
+                """
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (
+                ("progress", "TEXT"), ("deadline", "REAL"), ("tenant", "TEXT NOT NULL DEFAULT ''")
+            ):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_jobs_state_deadline ON jobs (state, deadline, created_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_jobs_tenant_state ON jobs (tenant, state, deadline)"
+            )
+            # When each tenant last had a job claimed, for round-robin between tenants
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tenant_turns (tenant TEXT PRIMARY KEY, last_claimed_at REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+
+    @classmethod
+    def from_settings(cls) -> "SQLiteJobBackend":
+        return cls(path=settings.job_db_path, max_attempts=settings.job_max_attempts)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Job:
+        data = dict(row)
+        data["payload"] = json.loads(data["payload"])
+        data["progress"] = json.loads(data["progress"]) if data["progress"] else None
+        return Job(**data)
+
+    def enqueue(
+        self,
+        key: str,
+        payload: Dict[str, Any],
+        deadline: Optional[float] = None,
+        tenant: str = ""
+    ) -> bool:
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs "
+                "(id, key, payload, state, created_at, updated_at, deadline, tenant) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (uuid.uuid4().hex, key, json.dumps(payload), QUEUED, now, now, deadline, tenant)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def claim(
+        self,
+        worker_id: str,
+        lease_seconds: float,
+        tenant_cap: Optional[TenantCap] = None
+    ) -> Optional[Job]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose worker stopped heart-beating have used up an
+                # attempt; give up on them once the limit is reached.
+                conn.execute(
+                    "UPDATE jobs SET state = ?, lease_owner = NULL, updated_at = ?, "
+                    "error = COALESCE(error, 'Lease expired too many times') "
+                    "WHERE state = ? AND lease_expires_at < ? AND attempts >= ?",
+                    (FAILED, now, RUNNING, now, self.max_attempts)
+                )
+                candidates = {
+                    row["tenant"]: row["head"] if row["head"] is not None else float("inf")
+                    for row in conn.execute(
+                        "SELECT tenant, MIN(deadline) AS head FROM jobs "
+                        "WHERE state = ? OR (state = ? AND lease_expires_at < ?) GROUP BY tenant",
+                        (QUEUED, RUNNING, now)
+                    )
+                }
+                running = {
+                    row["tenant"]: row["n"] for row in conn.execute(
+                        "SELECT tenant, COUNT(*) AS n FROM jobs "
+                        "WHERE state = ? AND lease_expires_at >= ? GROUP BY tenant",
+                        (RUNNING, now)
+                    )
+                }
+                turns = {
+                    row["tenant"]: row["last_claimed_at"]
+                    for row in conn.execute("SELECT tenant, last_claimed_at FROM tenant_turns")
+                }
+                tenant = _pick_tenant(candidates, running, turns, tenant_cap)
+                if tenant is None:
+                    conn.execute("COMMIT")
+                    return None
+                row = conn.execute(
+                    "SELECT * FROM jobs "
+                    "WHERE tenant = ? AND (state = ? OR (state = ? AND lease_expires_at < ?)) "
+                    "ORDER BY deadline IS NULL, deadline, created_at LIMIT 1",
+                    (tenant, QUEUED, RUNNING, now)
+                ).fetchone()
+                conn.execute(
+                    "INSERT INTO tenant_turns (tenant, last_claimed_at) VALUES (?, ?) "
+                    "ON CONFLICT(tenant) DO UPDATE SET last_claimed_at = excluded.last_claimed_at",
+                    (tenant, now)
+                )
+                conn.execute(
+                    "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, "
+                    "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                    (RUNNING, worker_id, now + lease_seconds, now, row["id"])
+                )
+                claimed = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                conn.execute("COMMIT")
+                return self._row_to_job(claimed)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _update_owned(self, job_id: str, worker_id: str, assignments: str, params: tuple) -> bool:
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? "
+                "WHERE id = ? AND state = ? AND lease_owner = ?",
+                params + (time.time(), job_id, RUNNING, worker_id)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        return self._update_owned(
+            job_id, worker_id,
+            "lease_expires_at = ?",
+            (time.time() + lease_seconds,)
+        )
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        return self._update_owned(
+            job_id, worker_id,
+            "state = ?, lease_owner = NULL, lease_expires_at = NULL",
+            (DONE,)
+        )
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        return self._update_owned(
+            job_id, worker_id,
+            "state = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+            "error = ?, lease_owner = NULL, lease_expires_at = NULL",
+            (self.max_attempts, QUEUED, FAILED, error)
+        )
+
+    def get(self, key: str) -> Optional[Job]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE key = ?", (key,)).fetchone()
+            return self._row_to_job(row) if row else None
+        finally:
+            conn.close()
+
+    def set_progress(self, key: str, progress: Dict[str, Any]):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET progress = ? WHERE key = ?",
+                (json.dumps(progress), key)
+            )
+        finally:
+            conn.close()
+
+    def counts(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            counts = {state: 0 for state in JOB_STATES}
+            for row in conn.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state"):
+                counts[row["state"]] = row["n"]
+            return counts
+        finally:
+            conn.close()
+
+
+JOB_BACKENDS = {
+    "memory": MemoryJobBackend,
+    "sqlite": SQLiteJobBackend,
+}
+
+
+def create_job_backend(name: Optional[str] = None) -> JobBackend:
+    """
+    Create the configured job backend.
+
+    Args:
+        name: Backend name from JOB_BACKENDS, or "module:Class" for a custom
+            JobBackend subclass. Defaults to settings.job_backend.
+    """
+    name = name or settings.job_backend
+    if ":" in name:
+        module_name, class_name = name.split(":", 1)
+        backend_cls = getattr(importlib.import_module(module_name), class_name)
+    elif name in JOB_BACKENDS:
+        backend_cls = JOB_BACKENDS[name]
+    else:
+        raise ValueError(f"Unsupported job backend: {name}")
+    return backend_cls.from_settings()
+
+
+def default_worker_id() -> str:
+    """Identify this worker process across the cluster."""
+    return settings.job_worker_id or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class JobWorker:
+    """Claim jobs from a backend and run them with lease heartbeats."""
+
+    def __init__(
+        self,
+        backend: JobBackend,
+        handler: Callable[[Job], Awaitable[None]],
+        worker_id: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        lease_seconds: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+        tenant_cap: Optional[TenantCap] = None
+    ):
+        """
+        Initialize the worker.
+
+        Args:
+            backend: Job backend to claim from
+            handler: Coroutine run for each claimed job
+            worker_id: Lease owner name (defaults to hostname-pid)
+            concurrency: Number of jobs run at once on this node
+            lease_seconds: Lease length; heartbeats renew it every third of it
+            poll_interval: Seconds between claim attempts when the queue is empty
+            tenant_cap: Maximum running jobs per tenant (None for unlimited)
+        """
+        self.backend = backend
+        self.handler = handler
+        self.worker_id = worker_id or default_worker_id()
+        self.concurrency = concurrency or settings.job_worker_concurrency
+        self.lease_seconds = lease_seconds or settings.job_lease_seconds
+        self.poll_interval = poll_interval or settings.job_poll_interval
+        self.tenant_cap = tenant_cap
+        self._slots: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def start(self):
+        """Start the claim loops on the running event loop."""
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._slots = [
+            asyncio.create_task(self._run_slot())
+            for _ in range(self.concurrency)
+        ]
+        print(f"✅ Job worker {self.worker_id} started ({self.concurrency} slots)")
+
+    async def stop(self):
+        """Stop claiming and cancel running jobs; their leases will expire."""
+        self._stopping = True
+        for slot in self._slots:
+            slot.cancel()
+        await asyncio.gather(*self._slots, return_exceptions=True)
+        self._slots = []
+
+    def notify(self):
+        """Wake idle slots after a local enqueue instead of waiting for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run_slot(self):
+        while not self._stopping:
+            try:
+                job = await asyncio.to_thread(
+                    self.backend.claim, self.worker_id, self.lease_seconds, self.tenant_cap
+                )
+            except Exception as e:
+                print(f"⚠️  Job claim failed: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            await self._execute(job)
+
+    async def _execute(self, job: Job):
+        print(f"📥 Worker {self.worker_id} claimed job {job.key} (attempt {job.attempts})")
+        run = asyncio.create_task(self.handler(job))
+        interval = self.lease_seconds / 3
+
+        try:
+            while True:
+                done, _ = await asyncio.wait({run}, timeout=interval)
+                if done:
+                    break
+                try:
+                    still_owned = await asyncio.to_thread(
+                        self.backend.heartbeat, job.id, self.worker_id, self.lease_seconds
+                    )
+                except Exception as e:
+                    # Keep running; the lease is still valid until it expires.
+                    print(f"⚠️  Heartbeat for job {job.key} failed: {e}")
+                    continue
+                if not still_owned:
+                    print(f"⚠️  Lost lease on job {job.key}, abandoning it")
+                    run.cancel()
+                    await asyncio.gather(run, return_exceptions=True)
+                    return
+        except asyncio.CancelledError:
+            # Worker shutdown: stop the job and let its lease expire.
+            run.cancel()
+            raise
+
+        try:
+            run.result()
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            print(f"❌ Job {job.key} failed: {e}")
+            await asyncio.to_thread(self.backend.fail, job.id, self.worker_id, str(e))
+            return
+        await asyncio.to_thread(self.backend.complete, job.id, self.worker_id)
@@ -1,27 +1,46 @@
 """
 LLM-based code generator for creating applications based on briefs.
 """
+import html
 import json
+import re
+import threading
+import time
 import requests
 from typing import List, Dict, Optional
 from shared.models import Attachment
 from shared.config import settings
+from shared.llm_usage import record_llm_call
+from student.metrics import STAGE_SECONDS, TIMEOUTS, DEFAULT_PAGE_FALLBACKS
+
+
+class GenerationCancelled(Exception):
+    """The caller gave up on a generation (its stage budget ran out)."""
 
 
 class LLMGenerator:
     """Generate application code using LLM."""
     
-    def __init__(self):
-        self.provider = settings.llm_provider
+    def __init__(self, provider: Optional[str] = None, api_key: Optional[str] = None):
+        """
+        Initialize the generator.
+        
+        Args:
+            provider: openai or anthropic (defaults to settings.llm_provider)
+            api_key: Key for the provider (defaults to the key in settings)
+        """
+        self.provider = provider or settings.llm_provider
         
         if self.provider == "openai":
-            self.api_key = settings.openai_api_key
+            self.api_key = api_key or settings.openai_api_key
             self.api_url = "https://aipipe.org/openai/v1/chat/completions"
             self.model = "gpt-4o-mini"  # Using o4-mini as requested
+            self.fast_model = settings.llm_fallback_model or "gpt-4.1-nano"
         elif self.provider == "anthropic":
-            self.api_key = settings.anthropic_api_key
+            self.api_key = api_key or settings.anthropic_api_key
             self.api_url = "https://api.anthropic.com/v1/messages"
             self.model = "claude-3-sonnet-20240229"
+            self.fast_model = settings.llm_fallback_model or "claude-3-haiku-20240307"
         else:
             raise ValueError(f"Unsupported LLM provider: {self.provider}")
     
@@ -29,11 +48,24 @@ class LLMGenerator:
         self,
         brief: str,
         checks: List[str],
-        attachments: Optional[List[Attachment]] = None
+        attachments: Optional[List[Attachment]] = None,
+        model: Optional[str] = None,
+        timeout: float = 120,
+        cancel: Optional[threading.Event] = None
     ) -> Dict[str, str]:
         """
         Generate application files based on the brief.
         
+        Args:
+            brief: Task brief
+            checks: Checks the app must pass
+            attachments: Attachments to reference in the app
+            model: Model override, e.g. self.fast_model when time is short
+            timeout: Seconds to wait for the LLM response
+            cancel: Set by the caller when it gives up; the generation then
+                stops at its next step (before calling the LLM or before
+                parsing the response) with GenerationCancelled
+        
         Returns:
             Dict mapping filenames to their content
         """
@@ -42,9 +74,48 @@ class LLMGenerator:
         
         # Generate code
         if self.provider == "openai":
-            return self._generate_with_openai(prompt)
+            return self._generate_with_openai(prompt, model or self.model, timeout, cancel)
         else:
-            return self._generate_with_anthropic(prompt)
+            return self._generate_with_anthropic(prompt, model or self.model, timeout, cancel)
+    
+    def generate_template_app(self, brief: str, checks: List[str]) -> Dict[str, str]:
+        """
+        Build an app from a template without calling the LLM.
+        
+        Used when there is no time left for generation. The page shows the
+        brief and contains every element ID the brief and checks mention, so
+        that a submission can still be made.
+        """
+        text = " ".join([brief] + list(checks))
+        element_ids = sorted(set(re.findall(r"#([A-Za-z][\w-]*)", text)))
+        elements = "\n".join(
+            f'        <div id="{element_id}" class="mb-2"></div>' for element_id in element_ids
+        )
+        title_match = re.search(r"title (?:to|equals) [\"']([^\"']+)[\"']", text)
+        title = title_match.group(1) if title_match else "Generated App"
+        
+        index_html = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{html.escape(title)}</title>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
+</head>
+<body class="container py-4">
+    <h1>{html.escape(title)}</h1>
+    <p>{html.escape(brief)}</p>
+    <main>
+{elements}
+    </main>
+</body>
+</html>"""
+        
+        return {
+            "index.html": index_html,
+            "README.md": self._generate_default_readme(),
+            "LICENSE": self._get_mit_license()
+        }
     
     def _build_prompt(
         self,
@@ -104,7 +175,40 @@ Generate the complete application now:"""
         
         return prompt
     
-    def _generate_with_openai(self, prompt: str) -> Dict[str, str]:
+    def _post(
+        self, model: str, headers: dict, payload: dict, timeout: float, cancel: Optional[threading.Event] = None
+    ) -> requests.Response:
+        """Call the LLM API, recording latency, token usage and cost."""
+        if cancel is not None and cancel.is_set():
+            raise GenerationCancelled(f"{model} cancelled before the request")
+        started = time.perf_counter()
+        try:
+            with STAGE_SECONDS.time(stage="llm_generate"):
+                response = requests.post(
+                    self.api_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=timeout
+                )
+        except requests.exceptions.RequestException as e:
+            status = "timeout" if isinstance(e, requests.exceptions.Timeout) else "error"
+            record_llm_call(self.provider, model, None, time.perf_counter() - started, status=status)
+            raise
+        
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        status = "ok" if response.status_code == 200 else f"http_{response.status_code}"
+        record_llm_call(self.provider, model, body, time.perf_counter() - started, status=status)
+        if cancel is not None and cancel.is_set():
+            # A fallback strategy is already being used
+            raise GenerationCancelled(f"{model} answered after its budget; response discarded")
+        return response
+    
+    def _generate_with_openai(
+        self, prompt: str, model: str, timeout: float, cancel: Optional[threading.Event] = None
+    ) -> Dict[str, str]:
         """Generate using OpenAI API via HTTP request."""
         headers = {
             "Content-Type": "application/json",
@@ -112,7 +216,7 @@ Generate the complete application now:"""
         }
         
         payload = {
-            "model": self.model,
+            "model": model,
             "messages": [
                 {
                     "role": "system",
@@ -128,20 +232,13 @@ Generate the complete application now:"""
         }
         
         print(f"Calling AI pipe at: {self.api_url}")
-        print(f"Using model: {self.model}")
-        print(f"API key (first 20 chars): {self.api_key[:20]}...")
+        print(f"Using model: {model}")
         
         try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=120
-            )
+            response = self._post(model, headers, payload, timeout, cancel)
             
             # Log response details for debugging
             print(f"Response status: {response.status_code}")
-            print(f"Response headers: {dict(response.headers)}")
             
             if response.status_code != 200:
                 print(f"Error response body: {response.text}")
@@ -163,7 +260,8 @@ Generate the complete application now:"""
             print(f"Generated content length: {len(content)} characters")
             
             # Parse the JSON response
-            files = self._parse_response(content)
+            with STAGE_SECONDS.time(stage="parse"):
+                files = self._parse_response(content)
             
             # Ensure we have required files
             if "index.html" not in files:
@@ -181,13 +279,17 @@ Generate the complete application now:"""
             print(f"Response content: {e.response.text if hasattr(e, 'response') else 'No response'}")
             raise
         except requests.exceptions.RequestException as e:
+            if isinstance(e, requests.exceptions.Timeout):
+                TIMEOUTS.inc(stage="llm_generate")
             print(f"Request Error calling AI pipe: {e}")
             raise
         except Exception as e:
             print(f"Error calling AI pipe: {e}")
             raise
     
-    def _generate_with_anthropic(self, prompt: str) -> Dict[str, str]:
+    def _generate_with_anthropic(
+        self, prompt: str, model: str, timeout: float, cancel: Optional[threading.Event] = None
+    ) -> Dict[str, str]:
         """Generate using Anthropic API via HTTP request."""
         headers = {
             "Content-Type": "application/json",
@@ -196,7 +298,7 @@ Generate the complete application now:"""
         }
         
         payload = {
-            "model": self.model,
+            "model": model,
             "max_tokens": 4000,
             "messages": [
                 {
@@ -208,12 +310,7 @@ Generate the complete application now:"""
         }
         
         try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=120
-            )
+            response = self._post(model, headers, payload, timeout, cancel)
             
             response.raise_for_status()
             result = response.json()
@@ -222,7 +319,8 @@ Generate the complete application now:"""
             content = result["content"][0]["text"]
             
             # Parse the JSON response
-            files = self._parse_response(content)
+            with STAGE_SECONDS.time(stage="parse"):
+                files = self._parse_response(content)
             
             # Ensure we have required files
             if "index.html" not in files:
@@ -236,6 +334,8 @@ Generate the complete application now:"""
             return files
             
         except Exception as e:
+            if isinstance(e, requests.exceptions.Timeout):
+                TIMEOUTS.inc(stage="llm_generate")
             print(f"Error calling Anthropic API: {e}")
             raise
     
@@ -287,6 +387,7 @@ Generate the complete application now:"""
         
         # Generate minimal files if extraction failed
         if "index.html" not in files:
+            DEFAULT_PAGE_FALLBACKS.inc()
             files["index.html"] = """<!DOCTYPE html>
 <html lang="en">
 <head>
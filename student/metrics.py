@@ -0,0 +1,100 @@
+"""
+Metrics exported by the student API on /metrics.
+"""
+from shared.metrics import Counter, Gauge, Histogram
+
+
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+STAGE_SECONDS = Histogram(
+    "student_stage_duration_seconds",
+    "Duration of each task pipeline stage.",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+
+TASK_SECONDS = Histogram(
+    "student_task_duration_seconds",
+    "End-to-end duration of process_task by outcome.",
+    ["outcome"],
+    buckets=STAGE_BUCKETS
+)
+
+RETRIES = Counter(
+    "student_retries_total",
+    "Retried attempts by operation.",
+    ["operation"]
+)
+
+TIMEOUTS = Counter(
+    "student_timeouts_total",
+    "Timeouts by pipeline stage.",
+    ["stage"]
+)
+
+DEGRADED = Counter(
+    "student_degraded_total",
+    "Cheaper strategies used because the deadline was near.",
+    ["strategy"]
+)
+
+DEFAULT_PAGE_FALLBACKS = Counter(
+    "student_default_page_fallbacks_total",
+    "Generated apps replaced by the built-in default page."
+)
+
+OPTIMIZER_BYTES_SAVED = Counter(
+    "student_optimizer_bytes_saved_total",
+    "Bytes removed from generated pages by the page optimizer."
+)
+
+OPTIMIZER_REMOVED_INCLUDES = Counter(
+    "student_optimizer_removed_includes_total",
+    "Unused CDN includes removed from generated pages."
+)
+
+TASKS_IN_FLIGHT = Gauge(
+    "student_tasks_in_flight",
+    "Tasks currently being processed on this node."
+)
+
+QUEUE_DEPTH = Gauge(
+    "student_job_queue_depth",
+    "Jobs in the job backend by state.",
+    ["state"]
+)
+
+OUTBOX_PENDING = Gauge(
+    "student_outbox_pending",
+    "Evaluation submissions waiting in the outbox."
+)
+
+OUTBOX_ATTEMPTS = Counter(
+    "student_outbox_attempts_total",
+    "Outbox delivery attempts by result (delivered, retry, dead).",
+    ["result"]
+)
+
+OUTBOX_DELIVERY_SECONDS = Histogram(
+    "student_outbox_delivery_seconds",
+    "Time from queueing a submission to its successful delivery.",
+    buckets=STAGE_BUCKETS + (1800.0, 3600.0, 21600.0, 86400.0)
+)
+
+TENANT_REQUESTS = Counter(
+    "student_tenant_requests_total",
+    "Task requests per tenant by result (accepted, duplicate, rate_limited, unauthorized).",
+    ["tenant", "result"]
+)
+
+TENANT_TASKS = Counter(
+    "student_tenant_tasks_total",
+    "Processed tasks per tenant by outcome.",
+    ["tenant", "outcome"]
+)
+
+TENANT_TASKS_IN_FLIGHT = Gauge(
+    "student_tenant_tasks_in_flight",
+    "Tasks currently being processed on this node, per tenant.",
+    ["tenant"]
+)
@@ -0,0 +1,378 @@
+"""
+Durable outbox for evaluation API submissions.
+
+Submissions are written to a local SQLite file before any network call and
+delivered by a background sender, so they survive restarts and evaluation API
+outages. The sender shares one HTTP connection pool, honours ``Retry-After``,
+adds jitter, and backs off per evaluation host on server errors, 408/425/429
+and transport errors. Any other 4xx is a permanent rejection: the submission
+is marked dead at once and the host is not backed off.
+"""
+import asyncio
+import json
+import random
+import sqlite3
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from shared.config import settings
+from shared.tracing import span, current_traceparent, parse_traceparent
+from student.metrics import (
+    OUTBOX_DELIVERY_SECONDS, OUTBOX_ATTEMPTS, OUTBOX_PENDING, RETRIES, TIMEOUTS
+)
+
+
+PENDING = "pending"
+DELIVERED = "delivered"
+DEAD = "dead"
+
+# How long a claimed item is hidden from other senders while it is in flight
+IN_FLIGHT_SECONDS = 60
+
+# Client errors that may succeed later; any other 4xx is a permanent rejection
+RETRYABLE_CLIENT_ERRORS = (408, 425, 429)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date) into seconds from now."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Outbox:
+    """SQLite-backed store of submissions waiting for delivery."""
+
+    def __init__(self, path: str = "outbox.db"):
+        """
+        Initialize the outbox.
+
+        Args:
+            path: Path to the SQLite file
+        """
+        self.path = path
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    headers TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    next_attempt_at REAL NOT NULL,
+                    delivered_at REAL,
+                    last_error TEXT
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_outbox_due ON outbox (status, next_attempt_at)"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _row_to_item(row: sqlite3.Row) -> Dict[str, Any]:
+        item = dict(row)
+        item["payload"] = json.loads(item["payload"])
+        item["headers"] = json.loads(item["headers"])
+        return item
+
+    def enqueue(self, url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> str:
+        """
+        Durably store a submission.
+
+        Returns:
+            Outbox item ID
+        """
+        item_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO outbox (id, url, payload, headers, status, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item_id, url, json.dumps(payload), json.dumps(headers or {}), PENDING, now, now)
+            )
+        finally:
+            conn.close()
+        return item_id
+
+    def due(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Get pending items whose next attempt is due, oldest first."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM outbox WHERE status = ? AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, time.time(), limit)
+            ).fetchall()
+            return [self._row_to_item(row) for row in rows]
+        finally:
+            conn.close()
+
+    def claim(self, item_id: str) -> bool:
+        """
+        Hide a due item from other senders while it is being delivered.
+
+        Returns:
+            False if another sender claimed it first
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE outbox SET next_attempt_at = ?, attempts = attempts + 1 "
+                "WHERE id = ? AND status = ? AND next_attempt_at <= ?",
+                (now + IN_FLIGHT_SECONDS, item_id, PENDING, now)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def mark_delivered(self, item_id: str):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE outbox SET status = ?, delivered_at = ?, last_error = NULL WHERE id = ?",
+                (DELIVERED, time.time(), item_id)
+            )
+        finally:
+            conn.close()
+
+    def reschedule(self, item_id: str, delay: float, error: str, dead: bool = False):
+        """Schedule the next attempt, or give up on the item."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (DEAD if dead else PENDING, time.time() + delay, error, item_id)
+            )
+        finally:
+            conn.close()
+
+    def get(self, item_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM outbox WHERE id = ?", (item_id,)).fetchone()
+            return self._row_to_item(row) if row else None
+        finally:
+            conn.close()
+
+    def counts(self) -> Dict[str, int]:
+        """Get the number of items in each status."""
+        conn = self._connect()
+        try:
+            counts = {PENDING: 0, DELIVERED: 0, DEAD: 0}
+            for row in conn.execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status"):
+                counts[row["status"]] = row["n"]
+            return counts
+        finally:
+            conn.close()
+
+
+class OutboxSender:
+    """Background delivery of outbox items."""
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        concurrency: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        max_backoff: Optional[float] = None,
+        poll_interval: float = 1.0
+    ):
+        """
+        Initialize the sender.
+
+        Args:
+            outbox: Outbox to deliver from
+            concurrency: Maximum deliveries in flight
+            max_attempts: Attempts before an item is marked dead
+            max_backoff: Upper bound for the per-host backoff in seconds
+            poll_interval: Seconds between scans when nothing was woken up
+        """
+        self.outbox = outbox
+        self.concurrency = concurrency or settings.outbox_concurrency
+        self.max_attempts = max_attempts or settings.outbox_max_attempts
+        self.max_backoff = max_backoff or settings.outbox_max_backoff
+        self.poll_interval = poll_interval
+        self._client = None  # httpx.AsyncClient, created on first delivery
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight: set = set()
+        # host -> (consecutive failures, blocked until)
+        self._host_backoff: Dict[str, tuple] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+
+    def start(self):
+        """Start delivering on the running event loop."""
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the sender; undelivered items stay in the outbox."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self._client:
+            await self._client.aclose()
+
+    def _get_client(self):
+        """Create the shared HTTP client on first use, keeping httpx off the startup path."""
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(max_connections=self.concurrency * 2, max_keepalive_connections=self.concurrency)
+            )
+        return self._client
+
+    def notify(self):
+        """Deliver newly enqueued items without waiting for the next scan."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait_delivered(self, item_id: str, timeout: float) -> bool:
+        """
+        Wait until an item delivered by this sender succeeds.
+
+        Returns:
+            False if it was not delivered within the timeout (it stays queued)
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(item_id, []).append(future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(item_id, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(item_id, None)
+
+    def _resolve(self, item_id: str, delivered: bool):
+        for future in self._waiters.pop(item_id, []):
+            if not future.done():
+                future.set_result(delivered)
+
+    def _host_ready(self, host: str) -> bool:
+        _, blocked_until = self._host_backoff.get(host, (0, 0.0))
+        return blocked_until <= time.time()
+
+    def _backoff(self, host: str, retry_after: Optional[float]) -> float:
+        """Record a failure for the host and return the delay before retrying it."""
+        failures, _ = self._host_backoff.get(host, (0, 0.0))
+        failures += 1
+        # Exponential backoff with jitter, unless the server told us when to return
+        delay = min(self.max_backoff, 2 ** min(failures, 16))
+        delay = retry_after if retry_after is not None else random.uniform(delay / 2, delay)
+        self._host_backoff[host] = (failures, time.time() + delay)
+        return delay
+
+    async def _run(self):
+        while True:
+            try:
+                items = await asyncio.to_thread(self.outbox.due, self.concurrency * 4)
+                for item in items:
+                    if not self._host_ready(urlsplit(item["url"]).netloc):
+                        continue
+                    if not await asyncio.to_thread(self.outbox.claim, item["id"]):
+                        continue
+                    await self._semaphore.acquire()
+                    task = asyncio.create_task(self._deliver(item))
+                    self._in_flight.add(task)
+                    task.add_done_callback(self._in_flight.discard)
+                counts = await asyncio.to_thread(self.outbox.counts)
+                OUTBOX_PENDING.set(counts[PENDING])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Outbox scan failed: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _deliver(self, item: Dict[str, Any]):
+        import httpx
+        host = urlsplit(item["url"]).netloc
+        attempt = item["attempts"] + 1
+        try:
+            retry_after = None
+            try:
+                # Each attempt is a child of the span that queued the submission
+                parent = parse_traceparent(item["headers"].get("traceparent"))
+                with span("outbox_deliver", parent=parent, kind="client", url=item["url"], attempt=attempt) as delivery:
+                    headers = {"Content-Type": "application/json", **item["headers"]}
+                    headers["traceparent"] = current_traceparent()
+                    response = await self._get_client().post(item["url"], json=item["payload"], headers=headers)
+                    delivery.set_attributes(**{"http.status_code": response.status_code})
+                if 200 <= response.status_code < 300:
+                    await asyncio.to_thread(self.outbox.mark_delivered, item["id"])
+                    self._host_backoff.pop(host, None)
+                    OUTBOX_ATTEMPTS.inc(result="delivered")
+                    OUTBOX_DELIVERY_SECONDS.observe(time.time() - item["created_at"])
+                    print(f"Successfully submitted to {item['url']} (attempt {attempt})")
+                    self._resolve(item["id"], True)
+                    return
+                error = f"HTTP {response.status_code}"
+                if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_CLIENT_ERRORS:
+                    # Rejected (e.g. "No matching task"): retrying cannot help, and the
+                    # host is healthy, so its other submissions are not held back
+                    await asyncio.to_thread(self.outbox.reschedule, item["id"], 0, f"{error}: {response.text[:500]}", True)
+                    OUTBOX_ATTEMPTS.inc(result="dead")
+                    print(f"Submission to {item['url']} rejected ({error}): {response.text[:200]}")
+                    self._resolve(item["id"], False)
+                    return
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            except httpx.HTTPError as e:
+                if isinstance(e, httpx.TimeoutException):
+                    TIMEOUTS.inc(stage="evaluation_submit")
+                error = f"{type(e).__name__}: {e}"
+
+            dead = attempt >= self.max_attempts
+            delay = self._backoff(host, retry_after)
+            await asyncio.to_thread(self.outbox.reschedule, item["id"], delay, error, dead)
+            if dead:
+                OUTBOX_ATTEMPTS.inc(result="dead")
+                print(f"Failed to submit to {item['url']} after {attempt} attempts: {error}")
+                self._resolve(item["id"], False)
+            else:
+                OUTBOX_ATTEMPTS.inc(result="retry")
+                RETRIES.inc(operation="evaluation_submit")
+                print(f"Attempt {attempt} to {item['url']} failed ({error}), retrying in {delay:.1f}s")
+        except Exception as e:
+            # The claim expires after IN_FLIGHT_SECONDS and the item is retried
+            print(f"⚠️  Outbox delivery error: {e}")
+        finally:
+            self._semaphore.release()
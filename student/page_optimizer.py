@@ -0,0 +1,486 @@
+"""
+Post-generation optimization of the generated pages before deploy.
+
+Every transformation is conservative, so that a page which passed its checks
+before optimization still does afterwards:
+
+- small local CSS/JS files referenced by a page are inlined
+- CDN libraries that are recognised, not used by the page's inline scripts,
+  markup or any local script, and not mentioned by any check are removed
+- comments and indentation are stripped from HTML, CSS and JS; line breaks
+  are kept in scripts, so automatic semicolon insertion is unaffected, and so
+  is the text of template literals
+- external scripts get ``defer`` when no inline code that runs during parsing
+  (outside DOMContentLoaded and load handlers) uses what they define
+- ``preconnect`` hints are added for the CDN origins that more than one
+  remaining include is loaded from
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+# Local files up to this size are inlined into the page
+INLINE_LIMIT = 16 * 1024
+
+# Recognised CDN libraries: (pattern matching the include URL, pattern showing
+# the page uses it). Unknown includes are always kept.
+CDN_LIBRARIES = {
+    "jquery": (r"jquery", r"\$\(|\$\.|jQuery"),
+    "bootstrap": (r"bootstrap(\.bundle)?(\.min)?\.js", r"data-bs-|bootstrap\."),
+    "bootstrap-icons": (r"bootstrap-icons", r"\bbi-[\w-]+"),
+    "marked": (r"marked", r"\bmarked\b"),
+    "highlight": (r"highlight(\.min)?\.js|highlightjs", r"\bhljs\b"),
+    "chart": (r"chart(\.umd)?(\.min)?\.js|chart\.js@", r"\bChart\b"),
+    "d3": (r"/d3(@|\.v\d|\.min|/)", r"\bd3\."),
+    "lodash": (r"lodash", r"\b_\.\w"),
+    "axios": (r"axios", r"\baxios\b"),
+    "moment": (r"moment", r"\bmoment\b"),
+    "dayjs": (r"dayjs", r"\bdayjs\b"),
+    "fontawesome": (r"font-?awesome", r"\bfa-[\w-]+"),
+    "animate": (r"animate(\.min)?\.css", r"animate__"),
+}
+
+_BLOCKS = re.compile(
+    r"(<script\b[^>]*>.*?</script\s*>|<style\b[^>]*>.*?</style\s*>|"
+    r"<pre\b[^>]*>.*?</pre\s*>|<textarea\b[^>]*>.*?</textarea\s*>|<!--.*?-->)",
+    re.IGNORECASE | re.DOTALL
+)
+_SCRIPT = re.compile(r"<script\b([^>]*)>(.*?)</script\s*>", re.IGNORECASE | re.DOTALL)
+_STYLE = re.compile(r"(<style\b[^>]*>)(.*?)(</style\s*>)", re.IGNORECASE | re.DOTALL)
+_STYLESHEET = re.compile(r"<link\b(?=[^>]*\brel=[\"']?stylesheet)[^>]*>", re.IGNORECASE)
+_SRC = re.compile(r"\bsrc=[\"']([^\"']+)[\"']", re.IGNORECASE)
+_HREF = re.compile(r"\bhref=[\"']([^\"']+)[\"']", re.IGNORECASE)
+_JS_TYPE = re.compile(r"\btype=[\"']?(?!text/javascript|module|application/javascript)[\w/+-]+", re.IGNORECASE)
+_WAITS_FOR_LOAD = re.compile(r"DOMContentLoaded|addEventListener\(\s*[\"']load|window\.onload")
+# From the end of a _WAITS_FOR_LOAD match to the opening brace of an inline handler
+_HANDLER_START = re.compile(
+    r"""["']?\s*[,=]\s*(?:async\s+)?(?:function\s*[\w$]*\s*\([^)]*\)|\([^)]*\)|[\w$]+)\s*(?:=>\s*)?\{"""
+)
+# Names a classic script defines globally
+_GLOBAL_NAMES = re.compile(r"^(?:async\s+)?(?:function\s*\*?|var|let|const|class)\s+([\w$]+)|\bwindow\.([\w$]+)\s*=", re.MULTILINE)
+
+
+def _is_external(url: str) -> bool:
+    return url.startswith(("http://", "https://", "//"))
+
+
+def _inline_scripts(html: str) -> List[str]:
+    """Bodies of inline, executable scripts."""
+    return [
+        body for attrs, body in _SCRIPT.findall(html)
+        if not _SRC.search(attrs) and not _JS_TYPE.search(attrs) and body.strip()
+    ]
+
+
+def _matching_brace(script: str, start: int) -> Optional[int]:
+    """Index of the brace closing the one at start, skipping strings and comments."""
+    depth = 0
+    i = start
+    while i < len(script):
+        c = script[i]
+        if c in "'\"`":
+            i += 1
+            while i < len(script) and script[i] != c:
+                i += 2 if script[i] == "\\" else 1
+        elif script.startswith("//", i):
+            i = script.find("\n", i)
+            if i == -1:
+                return None
+        elif script.startswith("/*", i):
+            i = script.find("*/", i + 2)
+            if i == -1:
+                return None
+            i += 1
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return None
+
+
+def _outside_load_handlers(script: str) -> str:
+    """
+    The code of a script that runs while the page is parsed: everything but
+    the bodies of inline DOMContentLoaded and load handlers.
+    """
+    parts = []
+    position = 0
+    for match in _WAITS_FOR_LOAD.finditer(script):
+        if match.start() < position:
+            continue
+        handler = _HANDLER_START.match(script, match.end())
+        if handler is None:
+            # A named handler: its function body is counted as running now
+            continue
+        end = _matching_brace(script, handler.end() - 1)
+        if end is None:
+            break
+        parts.append(script[position:match.start()])
+        position = end + 1
+    parts.append(script[position:])
+    return "".join(parts)
+
+
+def _library_of(url: str) -> Optional[str]:
+    for library, (url_pattern, _) in CDN_LIBRARIES.items():
+        if re.search(url_pattern, url, re.IGNORECASE):
+            return library
+    return None
+
+
+def minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    # Spaces around ":" are kept: "a :hover" and "a:hover" differ
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+# A "/" after one of these starts a regular expression, otherwise a division
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_KEYWORDS = {"return", "typeof", "case", "in", "of", "delete", "void", "throw", "new", "else", "do", "yield", "await"}
+
+
+def _lines_in_literals(js: str) -> List[bool]:
+    """
+    For each line of js.split("\n"), whether it starts inside a template
+    literal or a continued string, where whitespace is part of the value.
+    """
+    states = [False]
+    mode = "code"  # code, line_comment, block_comment, string, template, regex, regex_class
+    quote = ""
+    # Brace depth of each open ${...} in a template literal
+    expressions: List[int] = []
+    last = ""  # last significant token in code, for telling regexes from divisions
+    i = 0
+    while i < len(js):
+        c = js[i]
+        following = js[i + 1] if i + 1 < len(js) else ""
+        if c == "\n":
+            if mode in ("line_comment", "regex", "regex_class"):
+                mode = "code"
+            states.append(mode in ("string", "template"))
+            i += 1
+            continue
+        if mode == "line_comment":
+            i += 1
+        elif mode == "block_comment":
+            if c == "*" and following == "/":
+                mode = "code"
+                i += 1
+            i += 1
+        elif mode in ("string", "template", "regex", "regex_class"):
+            if c == "\\":
+                # An escaped line break continues the literal on the next line
+                if following == "\n":
+                    states.append(mode in ("string", "template"))
+                i += 2
+                continue
+            if mode == "string" and c == quote:
+                mode, last = "code", "a"
+            elif mode == "template" and c == "`":
+                mode, last = "code", "a"
+            elif mode == "template" and c == "$" and following == "{":
+                expressions.append(0)
+                mode, last = "code", "{"
+                i += 1
+            elif mode == "regex" and c == "[":
+                mode = "regex_class"
+            elif mode == "regex_class" and c == "]":
+                mode = "regex"
+            elif mode == "regex" and c == "/":
+                mode, last = "code", "a"
+            i += 1
+        else:
+            if c == "/" and following == "/":
+                mode = "line_comment"
+                i += 2
+                continue
+            if c == "/" and following == "*":
+                mode = "block_comment"
+                i += 2
+                continue
+            if c in "'\"":
+                mode, quote = "string", c
+            elif c == "`":
+                mode = "template"
+            elif c == "/":
+                mode = "regex" if last in _REGEX_PRECEDERS or last in _REGEX_KEYWORDS or not last else "code"
+                last = "/"
+            elif c == "}" and expressions and expressions[-1] == 0:
+                expressions.pop()
+                mode = "template"
+            elif c.isalnum() or c in "_$":
+                word = re.match(r"[\w$]+", js[i:]).group(0)
+                last = word if word in _REGEX_KEYWORDS else "a"
+                i += len(word)
+                continue
+            elif not c.isspace():
+                if expressions and c == "{":
+                    expressions[-1] += 1
+                elif expressions and c == "}":
+                    expressions[-1] -= 1
+                last = c
+            i += 1
+    return states
+
+
+def minify_js(js: str) -> str:
+    """
+    Remove lines that are only a comment, indentation and blank lines.
+
+    Lines inside template literals (and continued strings) are kept as they
+    are. Comments after code, and block comments over several lines, are
+    kept, since removing them safely needs a real parser.
+    """
+    lines = js.split("\n")
+    in_literal = _lines_in_literals(js) + [False]
+    kept = []
+    for index, line in enumerate(lines):
+        starts_in_literal, ends_in_literal = in_literal[index], in_literal[index + 1]
+        if not starts_in_literal:
+            line = line.lstrip()
+        if not ends_in_literal:
+            line = line.rstrip()
+        if not starts_in_literal and not ends_in_literal and (
+            not line or line.startswith("//") or re.fullmatch(r"/\*(?:(?!\*/).)*\*/", line)
+        ):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def minify_html(html: str) -> str:
+    """Minify markup, inline styles and inline scripts; pre and textarea are left alone."""
+    parts = []
+    text = ""
+    # split() alternates text and captured blocks
+    for index, part in enumerate(_BLOCKS.split(html)):
+        lower = part[:10].lower()
+        if index % 2 == 0:
+            # Text around a dropped comment is joined before collapsing
+            text += part
+            continue
+        if part.startswith("<!--") and not part.startswith("<!--[if"):
+            # Dropped; conditional comments are markup for old IE and are kept
+            continue
+        if text:
+            parts.append(_collapse_whitespace(text))
+            text = ""
+        if lower.startswith("<script"):
+            attrs, body = _SCRIPT.match(part).groups()
+            if body.strip() and not _JS_TYPE.search(attrs):
+                part = f"<script{attrs}>\n{minify_js(body)}\n</script>"
+            parts.append(part)
+        elif lower.startswith("<style"):
+            parts.append(_STYLE.sub(lambda m: m.group(1) + minify_css(m.group(2)) + m.group(3), part))
+        else:
+            # pre, textarea and conditional comments are kept as they are
+            parts.append(part)
+    parts.append(_collapse_whitespace(text))
+    return "".join(parts).strip() + "\n"
+
+
+def _collapse_whitespace(text: str) -> str:
+    # Whitespace between tags collapses when rendered; keep one line break
+    text = re.sub(r"\n[ \t]+", "\n", text)
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    return re.sub(r"\n{2,}", "\n", text)
+
+
+class PageOptimizer:
+    """Optimize the HTML files of a generated app."""
+
+    def __init__(self, checks: Optional[List[str]] = None, brief: str = ""):
+        """
+        Initialize the optimizer.
+
+        Args:
+            checks: Checks the app must pass; libraries they mention are kept
+            brief: Task brief, also searched for library names
+        """
+        self.required_text = " ".join([brief] + list(checks or [])).lower()
+
+    def optimize(self, files: Dict[str, str]) -> Tuple[Dict[str, str], Dict]:
+        """
+        Optimize every HTML file.
+
+        Returns:
+            Tuple of (optimized files, report with bytes saved and changes made)
+        """
+        optimized = dict(files)
+        report = {
+            "original_bytes": 0,
+            "optimized_bytes": 0,
+            "saved_bytes": 0,
+            "inlined": [],
+            "removed_includes": [],
+            "deferred_scripts": 0,
+            "preconnects": [],
+        }
+        for name, content in files.items():
+            if not name.endswith((".html", ".htm")):
+                continue
+            page = self._inline_local_assets(content, files, report)
+            page = self._remove_unused_includes(page, files, report)
+            page = minify_html(page)
+            page = self._defer_scripts(page, files, report)
+            page = self._add_preconnects(page, report)
+            report["original_bytes"] += len(content.encode())
+            report["optimized_bytes"] += len(page.encode())
+            optimized[name] = page
+        report["saved_bytes"] = report["original_bytes"] - report["optimized_bytes"]
+        return optimized, report
+
+    def _inline_local_assets(self, page: str, files: Dict[str, str], report: Dict) -> str:
+        def local_file(url: str, closing_tag: str) -> Optional[str]:
+            path = url.split("?")[0]
+            path = path[2:] if path.startswith("./") else path.lstrip("/")
+            content = files.get(path)
+            if _is_external(url) or content is None or len(content.encode()) > INLINE_LIMIT:
+                return None
+            if closing_tag in content.lower():
+                return None
+            report["inlined"].append(path)
+            return content
+
+        def inline_stylesheet(match: re.Match) -> str:
+            href = _HREF.search(match.group(0))
+            if href and not re.search(r"\bmedia=", match.group(0), re.IGNORECASE):
+                content = local_file(href.group(1), "</style")
+                if content is not None:
+                    return f"<style>\n{content}\n</style>"
+            return match.group(0)
+
+        def inline_script(match: re.Match) -> str:
+            attrs, body = match.groups()
+            src = _SRC.search(attrs)
+            # Deferred and async scripts would run at a different time inline
+            if not src or body.strip() or re.search(r"\b(defer|async)\b", attrs, re.IGNORECASE):
+                return match.group(0)
+            content = local_file(src.group(1), "</script")
+            if content is None:
+                return match.group(0)
+            return f"<script{_SRC.sub('', attrs).rstrip()}>\n{content}\n</script>"
+
+        page = _STYLESHEET.sub(inline_stylesheet, page)
+        return _SCRIPT.sub(inline_script, page)
+
+    def _remove_unused_includes(self, page: str, files: Dict[str, str], report: Dict) -> str:
+        # Local scripts that were not inlined (deferred, too large) use libraries too
+        local_scripts = [content for path, content in files.items() if path.endswith((".js", ".mjs"))]
+        usage_text = " ".join(_inline_scripts(page) + local_scripts) + " " + _SCRIPT.sub("", _STYLESHEET.sub("", page))
+
+        def unused_library(url: str) -> Optional[str]:
+            if not _is_external(url):
+                return None
+            for library, (url_pattern, usage_pattern) in CDN_LIBRARIES.items():
+                if not re.search(url_pattern, url, re.IGNORECASE):
+                    continue
+                if library in self.required_text or re.search(usage_pattern, usage_text):
+                    return None
+                return library
+            return None
+
+        def drop_script(match: re.Match) -> str:
+            src = _SRC.search(match.group(1))
+            library = unused_library(src.group(1)) if src and not match.group(2).strip() else None
+            if library is None:
+                return match.group(0)
+            report["removed_includes"].append(src.group(1))
+            return ""
+
+        def drop_stylesheet(match: re.Match) -> str:
+            href = _HREF.search(match.group(0))
+            library = unused_library(href.group(1)) if href else None
+            if library is None:
+                return match.group(0)
+            report["removed_includes"].append(href.group(1))
+            return ""
+
+        page = _SCRIPT.sub(drop_script, page)
+        return _STYLESHEET.sub(drop_stylesheet, page)
+
+    def _defer_scripts(self, page: str, files: Dict[str, str], report: Dict) -> str:
+        """
+        Defer every external script, or none.
+
+        Deferred scripts run after parsing, in order, so inline code that runs
+        during parsing must not use anything they define: a recognised
+        library's usage pattern, or a global name declared by a local script.
+        An unrecognised CDN script defines unknown globals and is never
+        deferred, and then neither is any other.
+        """
+        candidates = []
+        for match in _SCRIPT.finditer(page):
+            attrs, body = match.groups()
+            src = _SRC.search(attrs)
+            if not src or body.strip() or re.search(r"\b(defer|async)\b|module", attrs, re.IGNORECASE):
+                continue
+            candidates.append(src.group(1))
+        if not candidates:
+            return page
+
+        during_parsing = " ".join(_outside_load_handlers(body) for body in _inline_scripts(page))
+        for url in candidates:
+            library = _library_of(url)
+            if library is not None:
+                usage = CDN_LIBRARIES[library][1]
+            elif _is_external(url):
+                return page
+            else:
+                path = url.split("?")[0]
+                path = path[2:] if path.startswith("./") else path.lstrip("/")
+                content = files.get(path)
+                if content is None:
+                    return page
+                names = [name for groups in _GLOBAL_NAMES.findall(content) for name in groups if name]
+                if not names:
+                    continue
+                usage = r"(?<![\w$.])(" + "|".join(re.escape(name) for name in names) + r")(?![\w$])"
+            if re.search(usage, during_parsing):
+                return page
+
+        def defer(match: re.Match) -> str:
+            attrs, body = match.groups()
+            if not _SRC.search(attrs) or body.strip() or re.search(r"\b(defer|async)\b|module", attrs, re.IGNORECASE):
+                return match.group(0)
+            report["deferred_scripts"] += 1
+            return f"<script{attrs} defer></script>"
+
+        return _SCRIPT.sub(defer, page)
+
+    def _add_preconnects(self, page: str, report: Dict) -> str:
+        requests_per_origin: Dict[str, int] = {}
+        urls = [m.group(1) for m in _SRC.finditer(page)] + [
+            href.group(1) for link in _STYLESHEET.findall(page) for href in [_HREF.search(link)] if href
+        ]
+        for url in urls:
+            if not _is_external(url):
+                continue
+            parts = urlsplit(url if not url.startswith("//") else "https:" + url)
+            origin = f"{parts.scheme}://{parts.netloc}"
+            requests_per_origin[origin] = requests_per_origin.get(origin, 0) + 1
+        # A single request connects no later than its hint would; it only adds bytes
+        origins = [
+            origin for origin, count in requests_per_origin.items()
+            if count > 1 and f'rel="preconnect" href="{origin}"' not in page
+        ]
+        head = re.search(r"<head\b[^>]*>", page, re.IGNORECASE)
+        if not origins or head is None:
+            return page
+        # After <meta charset>, which must stay within the first 1024 bytes
+        charset = re.search(r"<meta\s+charset=[^>]*>", page, re.IGNORECASE)
+        position = charset.end() if charset else head.end()
+        hints = "".join(f'\n<link rel="preconnect" href="{origin}">' for origin in origins)
+        report["preconnects"].extend(origins)
+        return page[:position] + hints + page[position:]
+
+
+def optimize_files(files: Dict[str, str], checks: Optional[List[str]] = None, brief: str = "") -> Tuple[Dict[str, str], Dict]:
+    """Optimize a generated app; see PageOptimizer.optimize."""
+    return PageOptimizer(checks, brief).optimize(files)
@@ -0,0 +1,105 @@
+"""
+Per-task progress tracking with live subscriptions for server-sent events.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+TERMINAL_STAGES = ("completed", "failed", "timeout")
+
+
+def task_key(task: str, round: int, nonce: str) -> str:
+    """Unique task identifier shared by the tracker, job queue and progress."""
+    return f"{task}-{round}-{nonce}"
+
+
+class ProgressTracker:
+    """
+    Keep the current stage, per-stage timings, URLs and error of recent tasks.
+
+    Entries are kept for the most recent ``max_entries`` tasks. Subscribers get
+    a snapshot on every change, which the API streams as server-sent events.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    def start(self, key: str, task: str, round: int, nonce: str) -> Dict[str, Any]:
+        """Create the entry for a newly accepted task."""
+        now = time.time()
+        self._entries[key] = {
+            "task": task,
+            "round": round,
+            "nonce": nonce,
+            "stage": "queued",
+            "created_at": now,
+            "updated_at": now,
+            "stages": {"queued": {"started_at": now, "duration": None}},
+            "repo_url": None,
+            "commit_sha": None,
+            "pages_url": None,
+            "pages_live": None,
+            "error": None,
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return self._publish(key)
+
+    def update(self, key: str, stage: Optional[str] = None, **fields) -> Optional[Dict[str, Any]]:
+        """
+        Record a stage transition and/or new fields (repo_url, error, ...).
+
+        Entering a new stage closes the timing of the previous one.
+
+        Returns:
+            The updated snapshot, or None if the task is unknown
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        if stage is not None and stage != entry["stage"]:
+            current = entry["stages"].get(entry["stage"])
+            if current is not None and current.get("duration") is None:
+                current["duration"] = round(now - current["started_at"], 3)
+            if stage not in TERMINAL_STAGES:
+                entry["stages"][stage] = {"started_at": now, "duration": None}
+            entry["stage"] = stage
+        entry.update(fields)
+        entry["updated_at"] = now
+        return self._publish(key)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a snapshot of a task's progress."""
+        entry = self._entries.get(key)
+        return self._snapshot(entry) if entry is not None else None
+
+    def subscribe(self, key: str) -> asyncio.Queue:
+        """Receive a snapshot on the returned queue after every change."""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(key, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, key: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(key, [])
+        self._subscribers[key] = [(loop, q) for loop, q in subscribers if q is not queue]
+        if not self._subscribers[key]:
+            del self._subscribers[key]
+
+    @staticmethod
+    def _snapshot(entry: Dict[str, Any]) -> Dict[str, Any]:
+        snapshot = dict(entry)
+        snapshot["stages"] = {name: dict(timing) for name, timing in entry["stages"].items()}
+        return snapshot
+
+    def _publish(self, key: str) -> Dict[str, Any]:
+        snapshot = self._snapshot(self._entries[key])
+        for loop, queue in self._subscribers.get(key, []):
+            # Updates may come from worker threads
+            loop.call_soon_threadsafe(queue.put_nowait, snapshot)
+        return snapshot
@@ -1,85 +1,284 @@
 """
 Persistent task tracking to avoid duplicates even after restart.
 """
+import hashlib
 import json
+import math
 import os
-from typing import Set
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
 from pathlib import Path
 
 
+class BloomFilter:
+    """Fixed-size Bloom filter: no false negatives, tunable false positive rate."""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.01):
+        """
+        Initialize the filter.
+
+        Args:
+            capacity: Number of keys the filter is sized for
+            error_rate: False positive rate at full capacity
+        """
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        """Add a key to the filter."""
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def clear(self):
+        """Remove all keys."""
+        self.bits = bytearray(len(self.bits))
+
+
 class TaskTracker:
-    """Track processed tasks persistently."""
-    
-    def __init__(self, filepath: str = "processed_tasks.json"):
+    """
+    Track processed tasks persistently.
+
+    Keys live in a SQLite file; a Bloom filter in memory answers most
+    ``is_processed`` calls for new keys without touching disk, so memory use
+    stays constant however many keys are stored. Old keys are pruned by age
+    and/or by round, at startup and whenever the owner calls ``prune`` (the
+    API does so every PRUNE_INTERVAL seconds from a background task).
+    """
+
+    PRUNE_INTERVAL = 60  # seconds between retention passes
+
+    def __init__(
+        self,
+        filepath: str = "processed_tasks.db",
+        ttl_seconds: int = 0,
+        keep_rounds: int = 0,
+        index_capacity: int = 100000,
+        index_error_rate: float = 0.01,
+        legacy_json_path: Optional[str] = "processed_tasks.json"
+    ):
         """
         Initialize task tracker.
-        
+
         Args:
-            filepath: Path to JSON file for storing processed tasks
+            filepath: Path to SQLite file for storing processed tasks
+            ttl_seconds: Forget keys older than this (0 keeps them forever)
+            keep_rounds: Keep only keys from the latest N rounds (0 keeps all)
+            index_capacity: Number of keys the in-memory filter is sized for
+            index_error_rate: Filter false positive rate at full capacity
+            legacy_json_path: JSON list written by older versions, imported once
         """
         self.filepath = filepath
-        self.tasks = self._load()
-    
-    def _load(self) -> Set[str]:
-        """Load processed tasks from file."""
-        if os.path.exists(self.filepath):
+        self.ttl_seconds = ttl_seconds
+        self.keep_rounds = keep_rounds
+        self.index = BloomFilter(index_capacity, index_error_rate)
+        self._lock = threading.Lock()
+        self._init_store()
+        self._import_legacy(legacy_json_path)
+        self.prune()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.filepath, timeout=30)
+
+    def _init_store(self):
+        """Create the store and its indexes if missing."""
+        # Ensure directory exists
+        Path(self.filepath).parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            conn = self._connect()
             try:
-                with open(self.filepath, 'r') as f:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        return set(data)
-                    return set()
-            except Exception as e:
-                print(f"Warning: Could not load task tracker: {e}")
-                return set()
-        return set()
-    
-    def _save(self):
-        """Save processed tasks to file."""
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS processed_tasks ("
+                        "key TEXT PRIMARY KEY, round INTEGER, processed_at REAL NOT NULL)"
+                    )
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS ix_processed_at ON processed_tasks (processed_at)"
+                    )
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS ix_processed_round ON processed_tasks (round)"
+                    )
+            finally:
+                conn.close()
+
+    def _import_legacy(self, legacy_json_path: Optional[str]):
+        """Import keys from the old JSON file format, then rename it."""
+        if not legacy_json_path or not os.path.exists(legacy_json_path):
+            return
         try:
-            # Ensure directory exists
-            Path(self.filepath).parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(self.filepath, 'w') as f:
-                json.dump(list(self.tasks), f, indent=2)
+            with open(legacy_json_path, 'r') as f:
+                data = json.load(f)
+            keys = data if isinstance(data, list) else []
+            now = time.time()
+            with self._lock:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO processed_tasks (key, round, processed_at) "
+                            "VALUES (?, NULL, ?)",
+                            [(key, now) for key in keys]
+                        )
+                finally:
+                    conn.close()
+            os.replace(legacy_json_path, legacy_json_path + ".imported")
+            print(f"✅ Imported {len(keys)} tasks from {legacy_json_path}")
         except Exception as e:
-            print(f"Warning: Could not save task tracker: {e}")
-    
+            print(f"Warning: Could not import legacy task tracker: {e}")
+
+    def _rebuild_index(self, conn: sqlite3.Connection):
+        """Reload the filter from the store (filters cannot delete keys)."""
+        # Built aside and swapped in, so that concurrent is_processed calls
+        # never see a partly filled filter and miss a stored key
+        index = BloomFilter(self.index.capacity, self.index.error_rate)
+        for (key,) in conn.execute("SELECT key FROM processed_tasks"):
+            index.add(key)
+        self.index = index
+
+    def has_retention(self) -> bool:
+        """Whether a retention policy is set, i.e. prune can remove keys."""
+        return self.ttl_seconds > 0 or self.keep_rounds > 0
+
+    def prune(self) -> int:
+        """
+        Apply the retention policy and rebuild the in-memory index.
+
+        Returns:
+            Number of keys removed
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                removed = 0
+                with conn:
+                    if self.ttl_seconds > 0:
+                        removed += conn.execute(
+                            "DELETE FROM processed_tasks WHERE processed_at < ?",
+                            (time.time() - self.ttl_seconds,)
+                        ).rowcount
+                    if self.keep_rounds > 0:
+                        removed += conn.execute(
+                            "DELETE FROM processed_tasks WHERE round <= "
+                            "(SELECT MAX(round) FROM processed_tasks) - ?",
+                            (self.keep_rounds,)
+                        ).rowcount
+                self._rebuild_index(conn)
+                return removed
+            finally:
+                conn.close()
+
     def is_processed(self, task_key: str) -> bool:
         """
         Check if task was already processed.
-        
+
         Args:
             task_key: Unique task identifier (task-round-nonce)
-            
+
         Returns:
             True if task was already processed
         """
-        return task_key in self.tasks
-    
-    def mark_processed(self, task_key: str):
+        if task_key not in self.index:
+            return False
+        # Possible false positive: confirm against the store
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT 1 FROM processed_tasks WHERE key = ?", (task_key,)
+            ).fetchone()
+            return row is not None
+        finally:
+            conn.close()
+
+    def mark_processed(self, task_key: str, round: Optional[int] = None) -> bool:
         """
         Mark task as processed.
-        
+
         Args:
             task_key: Unique task identifier (task-round-nonce)
+            round: Task round, used by round-based retention
+
+        Returns:
+            False if the task was already marked (e.g. by a concurrent request)
         """
-        self.tasks.add(task_key)
-        self._save()
-    
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    inserted = conn.execute(
+                        "INSERT OR IGNORE INTO processed_tasks (key, round, processed_at) "
+                        "VALUES (?, ?, ?)",
+                        (task_key, round, time.time())
+                    ).rowcount == 1
+            except Exception as e:
+                print(f"Warning: Could not save task tracker: {e}")
+                inserted = True
+            finally:
+                conn.close()
+            self.index.add(task_key)
+            return inserted
+
     def get_all(self) -> Set[str]:
         """Get all processed task keys."""
-        return self.tasks.copy()
-    
-    def get_processed_tasks(self) -> list:
-        """Get all processed task keys as a sorted list."""
-        return sorted(list(self.tasks))
-    
+        return set(self.get_processed_tasks(limit=None))
+
+    def get_processed_tasks(self, offset: int = 0, limit: Optional[int] = 100) -> List[str]:
+        """
+        Get processed task keys as a sorted list, one page at a time.
+
+        Args:
+            offset: Number of keys to skip
+            limit: Maximum number of keys to return (None for all)
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT key FROM processed_tasks ORDER BY key LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset)
+            )
+            return [key for (key,) in rows]
+        finally:
+            conn.close()
+
+    def count_by_round(self) -> Dict[str, int]:
+        """Get the number of processed tasks per round ("unknown" for imported keys)."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT round, COUNT(*) FROM processed_tasks GROUP BY round ORDER BY round"
+            )
+            return {str(r) if r is not None else "unknown": n for r, n in rows}
+        finally:
+            conn.close()
+
     def clear(self):
         """Clear all processed tasks (use with caution)."""
-        self.tasks = set()
-        self._save()
-    
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM processed_tasks")
+            finally:
+                conn.close()
+            self.index = BloomFilter(self.index.capacity, self.index.error_rate)
+
     def count(self) -> int:
         """Get count of processed tasks."""
-        return len(self.tasks)
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM processed_tasks").fetchone()[0]
+        finally:
+            conn.close()
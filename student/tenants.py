@@ -0,0 +1,180 @@
+"""
+Tenant registry: the student identities served by one deployment.
+
+Each tenant has its own email and secret, GitHub and LLM credentials, a
+request rate limit and a cap on concurrently running tasks. The registry is
+a JSON list in TENANTS_PATH, for example::
+
+    [
+        {
+            "email": "student@example.com",
+            "secret": "...",
+            "github_token": "ghp_...",
+            "llm_provider": "openai",
+            "openai_api_key": "...",
+            "rate_limit_per_minute": 30,
+            "max_concurrency": 2
+        }
+    ]
+
+Without the file, the single identity from the STUDENT_* / GITHUB_* / LLM
+settings is served, as before. The file is re-read when it changes.
+
+A tenant in the file must have its own ``github_token`` and an API key for its
+LLM provider: entries without them are not registered, rather than creating
+repos under the operator's account or billing its LLM key.
+"""
+import hmac
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from shared.config import settings
+
+
+@dataclass
+class Tenant:
+    """A student identity and its credentials and limits."""
+    email: str
+    secret: str
+    name: str = ""
+    github_token: Optional[str] = None
+    llm_provider: Optional[str] = None
+    openai_api_key: Optional[str] = None
+    anthropic_api_key: Optional[str] = None
+    rate_limit_per_minute: Optional[float] = None
+    max_concurrency: Optional[int] = None
+
+    def __post_init__(self):
+        self.name = self.name or self.email
+
+    @property
+    def llm_api_key(self) -> Optional[str]:
+        if (self.llm_provider or settings.llm_provider) == "anthropic":
+            return self.anthropic_api_key
+        return self.openai_api_key
+
+    def check_secret(self, secret: str) -> bool:
+        return hmac.compare_digest(self.secret.encode(), secret.encode())
+
+
+class TokenBucket:
+    """Allow ``rate`` requests per minute with bursts up to ``burst``."""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, rate_per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Take a token.
+
+        Returns:
+            0 if allowed, otherwise seconds until a token is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class TenantRegistry:
+    """Look up tenants by email and enforce their request rate limits."""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the registry.
+
+        Args:
+            path: JSON tenant list (defaults to settings.tenants_path)
+        """
+        self.path = path if path is not None else settings.tenants_path
+        self._tenants: Dict[str, Tenant] = {}
+        self._by_name: Dict[str, Tenant] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _default_tenants(self) -> List[Tenant]:
+        return [Tenant(
+            email=settings.student_email,
+            secret=settings.student_secret,
+            github_token=settings.github_token,
+            openai_api_key=settings.openai_api_key,
+            anthropic_api_key=settings.anthropic_api_key,
+        )]
+
+    def _load(self):
+        """(Re)load the registry if the file changed."""
+        try:
+            mtime = os.path.getmtime(self.path) if self.path else None
+        except OSError:
+            mtime = None
+        if self._tenants and mtime == self._mtime:
+            return
+        if mtime is None:
+            tenants = self._default_tenants()
+        else:
+            with open(self.path, "r") as f:
+                tenants = []
+                for entry in json.load(f):
+                    tenant = Tenant(**entry)
+                    if not tenant.github_token:
+                        print(f"⚠️  Tenant {tenant.name} has no github_token and is not registered")
+                        continue
+                    if not tenant.llm_api_key:
+                        print(f"⚠️  Tenant {tenant.name} has no API key for its LLM provider and is not registered")
+                        continue
+                    tenants.append(tenant)
+            print(f"✅ Loaded {len(tenants)} tenants from {self.path}")
+        self._tenants = {tenant.email.lower(): tenant for tenant in tenants}
+        self._by_name = {tenant.name: tenant for tenant in tenants}
+        self._mtime = mtime
+        # Keep the rate limit state of tenants that are still registered
+        self._buckets = {name: bucket for name, bucket in self._buckets.items() if name in self._by_name}
+
+    def get(self, email: str) -> Optional[Tenant]:
+        with self._lock:
+            try:
+                self._load()
+            except Exception as e:
+                print(f"⚠️  Could not reload tenants from {self.path}, keeping the previous list: {e}")
+            return self._tenants.get(email.lower())
+
+    def all(self) -> List[Tenant]:
+        with self._lock:
+            return list(self._tenants.values())
+
+    def is_multi_tenant(self) -> bool:
+        return self._mtime is not None
+
+    def check_rate(self, tenant: Tenant) -> float:
+        """
+        Count a request against the tenant's rate limit.
+
+        Returns:
+            0 if allowed, otherwise seconds to wait before retrying
+        """
+        rate = tenant.rate_limit_per_minute or settings.tenant_rate_limit_per_minute
+        if not rate:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get(tenant.name)
+            if bucket is None or bucket.rate != rate / 60.0:
+                bucket = self._buckets[tenant.name] = TokenBucket(rate)
+            return bucket.take()
+
+    def concurrency_cap(self, tenant_name: str) -> Optional[int]:
+        """Maximum running tasks for a tenant across the deployment, None if unlimited."""
+        tenant = self._by_name.get(tenant_name)
+        cap = (tenant.max_concurrency if tenant else None) or settings.tenant_max_concurrency
+        return cap or None
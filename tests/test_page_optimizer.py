@@ -0,0 +1,81 @@
+"""
+Tests for the page optimizer: pages that work before optimization must still work after it.
+"""
+from student.page_optimizer import minify_js, optimize_files
+
+
+JQUERY_READY_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<script src="https://code.jquery.com/jquery-3.7.1.min.js"></script>
+</head>
+<body>
+<div id="greeting"></div>
+<script>
+$(document).ready(function () {
+    $("#greeting").text("Hello");
+});
+</script>
+</body>
+</html>
+"""
+
+
+def test_library_used_during_parsing_is_not_deferred():
+    optimized, report = optimize_files({"index.html": JQUERY_READY_PAGE})
+    assert report["deferred_scripts"] == 0
+    assert 'jquery-3.7.1.min.js"></script>' in optimized["index.html"]
+    assert "defer" not in optimized["index.html"]
+
+
+def test_library_used_only_in_load_handler_is_deferred():
+    page = JQUERY_READY_PAGE.replace(
+        '$(document).ready(function () {\n    $("#greeting").text("Hello");\n});',
+        'document.addEventListener("DOMContentLoaded", () => {\n    $("#greeting").text("Hello");\n});'
+    )
+    optimized, report = optimize_files({"index.html": page})
+    assert report["deferred_scripts"] == 1
+    assert 'jquery-3.7.1.min.js" defer></script>' in optimized["index.html"]
+
+
+def test_top_level_use_next_to_load_handler_is_not_deferred():
+    page = JQUERY_READY_PAGE.replace(
+        '$(document).ready(function () {\n    $("#greeting").text("Hello");\n});',
+        'const greeting = $("#greeting");\nwindow.onload = function () { greeting.text("Hello"); };'
+    )
+    _, report = optimize_files({"index.html": page})
+    assert report["deferred_scripts"] == 0
+
+
+def test_local_script_global_used_during_parsing_is_not_deferred():
+    page = """<html><head><script src="app.js"></script></head>
+<body><script>render();</script></body></html>
+"""
+    app = "function render() {\n  document.body.textContent = 'x';\n}\n" + "// padding\n" * 2000
+    _, report = optimize_files({"index.html": page, "app.js": app})
+    assert report["deferred_scripts"] == 0
+
+
+def test_library_used_by_deferred_local_script_is_kept():
+    page = """<html><head>
+<script src="https://cdn.jsdelivr.net/npm/marked/marked.min.js"></script>
+<script src="app.js" defer></script>
+</head><body></body></html>
+"""
+    _, report = optimize_files({"index.html": page, "app.js": "document.body.innerHTML = marked.parse('# Hi');"})
+    assert report["removed_includes"] == []
+
+
+def test_single_request_origin_gets_no_preconnect():
+    _, report = optimize_files({"index.html": JQUERY_READY_PAGE})
+    assert report["preconnects"] == []
+
+
+def test_minify_js_keeps_code_between_block_comments():
+    assert minify_js("/* setup */ init();\nfoo();\n/* end */") == "/* setup */ init();\nfoo();"
+
+
+def test_minify_js_keeps_template_literal_text():
+    js = "const t = `line1\n    // not a comment\n    indented`;\n// comment\nx();"
+    assert minify_js(js) == "const t = `line1\n    // not a comment\n    indented`;\nx();"